@@ -0,0 +1,473 @@
+import os
+import sys
+import hmac
+import json
+import time
+import queue
+import socket
+import struct
+import argparse
+import threading
+import secrets
+import hashlib
+from enum import Enum
+from benchmark_harness import BenchmarkConnection
+from benchmark_framestore import shift_timestamps, FRAME_STORE_EXTENSION
+from benchmark_capture import create_capture_backend
+from benchmark_resources import ResourceSampler
+
+class AgentMessages(Enum):
+    # Harness to agent
+    Launch = 0x01
+    Data = 0x02
+    Close = 0x03
+    StartCapture = 0x04
+    StopCapture = 0x05
+    Fetch = 0x06
+    StartSampling = 0x07
+    StopSampling = 0x08
+    StartTraffic = 0x09
+    StopTraffic = 0x0A
+    Authenticate = 0x0B
+    # Agent to harness, Data is used in both directions
+    Reply = 0x80
+    File = 0x81
+
+# Messages are the message byte, the channel of the process they belong to and the payload length
+MESSAGE_HEADER = struct.Struct('<BII')
+FILE_CHUNK_SIZE = 1024 * 1024
+DEFAULT_AGENT_PORT = 24900
+SECRET_VARIABLE = "BENCHMARK_AGENT_SECRET"
+
+def authentication_digest(secret: str, nonce: str):
+    return hmac.new(secret.encode(), nonce.encode(), hashlib.sha256).hexdigest()
+
+def receive_exactly(sock: socket.socket, length: int):
+    data = bytearray()
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+def receive_message(sock: socket.socket):
+    # Returns (message, channel, payload) or None once the connection closed
+    header = receive_exactly(sock, MESSAGE_HEADER.size)
+    if header is None:
+        return None
+    message, channel, length = MESSAGE_HEADER.unpack(header)
+    payload = receive_exactly(sock, length) if length else b''
+    if payload is None:
+        return None
+    return AgentMessages(message), channel, payload
+
+class MessageSocket:
+    # Sends whole messages from several threads over one TCP connection
+    def __init__(self, sock: socket.socket):
+        self.socket = sock
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.lock = threading.Lock()
+
+    def send(self, message: AgentMessages, channel: int = 0, payload: bytes = b''):
+        with self.lock:
+            self.socket.sendall(MESSAGE_HEADER.pack(message.value, channel, len(payload)) + payload)
+
+    def send_json(self, message: AgentMessages, channel: int = 0, value=None):
+        self.send(message, channel, json.dumps(value if value is not None else {}).encode())
+
+    def close(self):
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+
+class AgentProcess(BenchmarkConnection):
+    # Framework process launched by an agent, everything its controller sends is forwarded to the harness
+    def __init__(self, session, channel: int, name: str, process_path: str, startup: str, fps: float, frame_source: str, headless: bool):
+        self.session = session
+        self.channel = channel
+        self.name = name
+        super().__init__(process_path, startup, '127.0.0.1', fps, frame_source=frame_source, headless=headless)
+
+    def receive(self, data: bytes):
+        try:
+            self.session.messages.send(AgentMessages.Data, self.channel, data)
+        except OSError:
+            pass
+
+class AgentSession:
+    # One harness connected to the agent. Requests are answered in order with one Reply each, controller
+    # data is forwarded as soon as it arrives.
+    def __init__(self, agent, sock: socket.socket):
+        self.agent = agent
+        self.messages = MessageSocket(sock)
+        self.processes = {}
+        self.sampler = None
+        self.traffic = None
+
+    def authenticate(self):
+        # The agent runs builds on request, so every harness has to prove it knows the shared secret first
+        nonce = secrets.token_hex(16)
+        self.messages.send_json(AgentMessages.Reply, 0, {"nonce": nonce})
+        received = receive_message(self.messages.socket)
+        if received is None:
+            return False
+        message, channel, payload = received
+        digest = json.loads(payload).get("digest", "") if message == AgentMessages.Authenticate and payload else ""
+        if not hmac.compare_digest(str(digest), authentication_digest(self.agent.secret, nonce)):
+            self.messages.send_json(AgentMessages.Reply, channel, {"error": "Authentication failed"})
+            return False
+        self.messages.send_json(AgentMessages.Reply, channel, {})
+        return True
+
+    def run(self):
+        try:
+            if not self.authenticate():
+                print("Harness failed to authenticate, closing the connection.")
+                return
+            while True:
+                received = receive_message(self.messages.socket)
+                if received is None:
+                    break
+                message, channel, payload = received
+                if message == AgentMessages.Data:
+                    process = self.processes.get(channel)
+                    if process:
+                        process.send_data(payload)
+                    continue
+                try:
+                    reply = self.handle(message, channel, json.loads(payload) if payload else {})
+                except Exception as e:
+                    print(f"Request {message.name} failed: {e}")
+                    reply = {"error": str(e)}
+                self.messages.send_json(AgentMessages.Reply, channel, reply)
+        except (OSError, ValueError) as e:
+            print(f"Harness connection lost: {e}")
+        finally:
+            self.close()
+
+    def handle(self, message: AgentMessages, channel: int, request: dict):
+        if message == AgentMessages.Launch:
+            path = os.path.realpath(request["path"])
+            if path not in self.agent.builds:
+                raise ValueError(f"{request['path']} is not one of the builds this agent may launch")
+            process = AgentProcess(self, channel, request["name"], path, request.get("startup", ''),
+                                   request.get("fps", 30), request.get("frame_source", 'auto'), request.get("headless", False))
+            self.processes[channel] = process
+            print(f"Launched {request['name']} ({process.process.pid}) on channel {channel}.")
+            return {"pid": process.process.pid}
+
+        if message == AgentMessages.Close:
+            process = self.processes.pop(channel, None)
+            if process:
+                process.__del__()
+            return {}
+
+        if message == AgentMessages.StartCapture:
+            # Recordings are kept in the agent directory until the harness fetched them
+            path = self.agent.file_path(request["path"])
+            self.processes[channel].start_capture(path, **request.get("options", {}))
+            return {"path": os.path.basename(path)}
+
+        if message == AgentMessages.StopCapture:
+            process = self.processes[channel]
+            process.stop_capture()
+            # Lets the harness map the capture timestamps of this node into its own clock
+            return {"statistics": process.capture_statistics, "clock_ns": time.perf_counter_ns()}
+
+        if message == AgentMessages.Fetch:
+            path = self.agent.file_path(request["path"])
+            size = 0
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(FILE_CHUNK_SIZE), b''):
+                    self.messages.send(AgentMessages.File, channel, chunk)
+                    size += len(chunk)
+            if request.get("remove", True):
+                os.remove(path)
+            return {"size": size}
+
+        if message == AgentMessages.StartSampling:
+            self.sampler = ResourceSampler({process.name: process.process.pid for process in self.processes.values()}, request.get("rate_hz", 10.0))
+            self.sampler.start()
+            return {}
+
+        if message == AgentMessages.StopSampling:
+            if not self.sampler:
+                return {}
+            self.sampler.stop()
+            samples = self.sampler.export()
+            self.sampler = None
+            return samples
+
+        if message == AgentMessages.StartTraffic:
+            cancel_event = threading.Event()
+            results = {}
+            backend = create_capture_backend(request.get("backend", "auto"), request["port"], request.get("interface", "lo"))
+            thread = threading.Thread(target=backend.capture, args=(cancel_event, results))
+            thread.start()
+            self.traffic = (cancel_event, thread, results)
+            return {}
+
+        if message == AgentMessages.StopTraffic:
+            if not self.traffic:
+                return {}
+            cancel_event, thread, results = self.traffic
+            cancel_event.set()
+            thread.join()
+            self.traffic = None
+            return results
+
+        raise ValueError(f"Unexpected request {message.name}")
+
+    def close(self):
+        if self.sampler:
+            self.sampler.stop()
+        if self.traffic:
+            self.traffic[0].set()
+            self.traffic[1].join()
+        for process in self.processes.values():
+            process.__del__()
+        self.processes = {}
+        self.messages.close()
+
+class BenchmarkAgent:
+    # Launches framework builds on its node for harnesses on other nodes, relays the benchmark commands and
+    # acknowledgements and returns resource samples, traffic counters and recordings. Several agents can
+    # run on one host with different ports. Only harnesses knowing the secret are served, and only the
+    # given builds are launched.
+    def __init__(self, secret: str, builds: list[str], host: str = '127.0.0.1', port: int = DEFAULT_AGENT_PORT,
+                 directory: str = "benchmark_agent_files"):
+        if not secret:
+            raise ValueError("The agent requires a shared secret.")
+        self.secret = secret
+        self.builds = {os.path.realpath(build) for build in builds}
+        self.host = host
+        self.port = port
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.socket.listen()
+        self.port = self.socket.getsockname()[1]
+
+    def file_path(self, name: str):
+        # Only names inside the agent directory are accepted
+        return os.path.join(self.directory, os.path.basename(name))
+
+    def serve(self):
+        print(f"Agent listening on {self.host}:{self.port}")
+        while True:
+            try:
+                sock, addr = self.socket.accept()
+            except OSError:
+                break
+            print(f"Harness connected from {addr}")
+            threading.Thread(target=AgentSession(self, sock).run, daemon=True).start()
+
+    def close(self):
+        self.socket.close()
+
+class RemoteProcess:
+    # Stand-in for the Popen object of a process on an agent
+    def __init__(self, pid: int):
+        self.pid = pid
+
+    def poll(self):
+        return None
+
+class RemoteBenchmarkConnection(BenchmarkConnection):
+    # BenchmarkConnection to a process launched by an agent, commands and acknowledgements are relayed
+    def __init__(self, agent, channel: int, name: str, pid: int, ack_timeout: float = 30.0, headless: bool = False):
+        self.agent = agent
+        self.channel = channel
+        self.name = name
+        self.headless = headless
+        self.process = RemoteProcess(pid)
+        self.init_acks(ack_timeout)
+        self.capture_path = None
+        self.capture_statistics = None
+
+    def __del__(self):
+        if self.agent:
+            self.agent.close_process(self.channel)
+            self.agent = None
+
+    def send_data(self, data: bytes):
+        try:
+            self.agent.messages.send(AgentMessages.Data, self.channel, data)
+        except Exception as e:
+            print(f"Error sending data: {e}")
+
+    def start_capture(self, output_video_path: str, **writer_options):
+        if self.headless:
+            print("Headless processes have no window to capture.")
+            return
+        self.capture_path = output_video_path
+        self.agent.request(AgentMessages.StartCapture, self.channel, {"path": os.path.basename(output_video_path), "options": writer_options})
+
+    def stop_capture(self):
+        if self.capture_path is None:
+            return
+        # The agent clock is assumed to be read halfway through the request, off by at most half the round trip
+        requested = time.perf_counter_ns()
+        reply = self.agent.request(AgentMessages.StopCapture, self.channel)
+        offset = reply["clock_ns"] - (requested + time.perf_counter_ns()) // 2
+        self.capture_statistics = reply["statistics"]
+        self.agent.fetch(self.channel, os.path.basename(self.capture_path), self.capture_path)
+        # Frame stores are aligned by capture time to the scenario origin of the harness
+        if self.capture_path.endswith(FRAME_STORE_EXTENSION):
+            shift_timestamps(self.capture_path, -offset)
+        self.capture_path = None
+
+class RemoteAgent:
+    # Harness side of the connection to one agent
+    def __init__(self, name: str, host: str, port: int = DEFAULT_AGENT_PORT, secret: str = None, timeout: float = 120.0):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.messages = MessageSocket(socket.create_connection((host, port), timeout=timeout))
+        self.messages.socket.settimeout(None)
+        self.request_lock = threading.Lock()
+        self.replies = queue.Queue()
+        self.connections = {}
+        self.next_channel = 1
+        self.fetch_file = None
+        self.receive_thread = threading.Thread(target=self.receive, daemon=True)
+        self.receive_thread.start()
+        self.authenticate(secret or os.environ.get(SECRET_VARIABLE))
+        print(f"Connected to agent {name} at {host}:{port}")
+
+    def authenticate(self, secret: str):
+        if not secret:
+            self.messages.close()
+            raise RuntimeError(f"No secret for agent {self.name}, set {SECRET_VARIABLE}")
+        try:
+            challenge = self.replies.get(timeout=self.timeout)
+        except queue.Empty:
+            challenge = {}
+        if "nonce" not in challenge:
+            self.messages.close()
+            raise RuntimeError(f"Agent {self.name} did not send an authentication challenge")
+        try:
+            self.request(AgentMessages.Authenticate, 0, {"digest": authentication_digest(secret, challenge["nonce"])})
+        except RuntimeError:
+            self.messages.close()
+            raise
+
+    def receive(self):
+        while True:
+            try:
+                received = receive_message(self.messages.socket)
+            except (OSError, ValueError):
+                received = None
+            if received is None:
+                self.replies.put({"error": f"Connection to agent {self.name} closed"})
+                break
+            message, channel, payload = received
+            if message == AgentMessages.Data:
+                connection = self.connections.get(channel)
+                if connection:
+                    connection.receive(payload)
+            elif message == AgentMessages.File:
+                if self.fetch_file:
+                    self.fetch_file.write(payload)
+            elif message == AgentMessages.Reply:
+                self.replies.put(json.loads(payload))
+
+    def request(self, message: AgentMessages, channel: int = 0, value: dict = None):
+        # Requests are answered in order, so one request at a time waits for the next reply
+        with self.request_lock:
+            self.messages.send_json(message, channel, value)
+            try:
+                reply = self.replies.get(timeout=self.timeout)
+            except queue.Empty:
+                raise RuntimeError(f"Agent {self.name} did not answer {message.name} within {self.timeout}s")
+        if "error" in reply:
+            raise RuntimeError(f"Agent {self.name} failed {message.name}: {reply['error']}")
+        return reply
+
+    def launch(self, name: str, process_path: str, startup: str = '', fps: float = 30, frame_source: str = 'auto', headless: bool = False):
+        channel = self.next_channel
+        self.next_channel += 1
+        # Registered before the launch, the controller announces itself while the agent still accepts it
+        connection = RemoteBenchmarkConnection(self, channel, name, 0, headless=headless)
+        self.connections[channel] = connection
+        reply = self.request(AgentMessages.Launch, channel, {
+            "name": name, "path": process_path, "startup": startup, "fps": fps, "frame_source": frame_source, "headless": headless})
+        connection.process.pid = reply["pid"]
+        print(f"Launched {name} on agent {self.name} with pid {reply['pid']}")
+        return connection
+
+    def close_process(self, channel: int):
+        if self.connections.pop(channel, None) is None:
+            return
+        try:
+            self.request(AgentMessages.Close, channel)
+        except (RuntimeError, OSError) as e:
+            print(f"Unable to close process {channel} on agent {self.name}: {e}")
+
+    def fetch(self, channel: int, name: str, path: str):
+        # Streams a recording of the agent into path and removes it on the agent
+        with open(path, 'wb') as file:
+            self.fetch_file = file
+            try:
+                self.request(AgentMessages.Fetch, channel, {"path": name})
+            finally:
+                self.fetch_file = None
+
+    def start_sampling(self, rate_hz: float):
+        self.request(AgentMessages.StartSampling, 0, {"rate_hz": rate_hz})
+
+    def stop_sampling(self):
+        return self.request(AgentMessages.StopSampling)
+
+    def start_traffic_capture(self, port: int, interface: str, backend: str = "auto"):
+        self.request(AgentMessages.StartTraffic, 0, {"port": port, "interface": interface, "backend": backend})
+
+    def stop_traffic_capture(self):
+        return self.request(AgentMessages.StopTraffic)
+
+    def close(self):
+        for channel in list(self.connections):
+            self.close_process(channel)
+        self.messages.close()
+
+def connect_agents(agents: dict, secret: str = None):
+    # {"name": "host:port"} or {"name": ("host", port)} to connected RemoteAgents, the secret defaults to
+    # the BENCHMARK_AGENT_SECRET environment variable
+    connected = {}
+    for name, address in agents.items():
+        if isinstance(address, str):
+            host, separator, port = address.partition(':')
+            address = (host, int(port) if separator else DEFAULT_AGENT_PORT)
+        connected[name] = RemoteAgent(name, *address, secret=secret)
+    return connected
+
+def main():
+    parser = argparse.ArgumentParser(description="Launches benchmark builds on this node for a remote harness.")
+    parser.add_argument("--host", default='127.0.0.1', help="Interface to listen on, e.g. 0.0.0.0 for harnesses on other nodes")
+    parser.add_argument("--port", type=int, default=DEFAULT_AGENT_PORT)
+    parser.add_argument("--directory", default="benchmark_agent_files", help="Where recordings are kept until they are fetched")
+    parser.add_argument("--build", action="append", default=[], help="Build the harness may launch, can be repeated")
+    parser.add_argument("--secret", default=os.environ.get(SECRET_VARIABLE),
+                        help=f"Shared secret of the harnesses, defaults to the {SECRET_VARIABLE} environment variable")
+    args = parser.parse_args()
+    if not args.secret:
+        parser.error(f"a shared secret is required, set {SECRET_VARIABLE} or pass --secret")
+    if not args.build:
+        parser.error("at least one --build is required")
+
+    agent = BenchmarkAgent(args.secret, args.build, args.host, args.port, args.directory)
+    try:
+        agent.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
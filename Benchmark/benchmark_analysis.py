@@ -0,0 +1,275 @@
+import os
+import cv2
+import numpy as np
+from benchmark_framestore import FrameStore, FRAME_STORE_EXTENSION
+from benchmark_resources import set_affinity
+from benchmark_tracing import span, traced, enable_tracing
+
+class FrameDifferences:
+    # Running statistics of the per frame mean absolute differences of one comparison
+    def __init__(self, name: str, capacity: int = 1024):
+        self.name = name
+        self.values = np.zeros(max(capacity, 1), dtype=np.float64)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        if self.count == len(self.values):
+            self.values = np.concatenate((self.values, np.zeros_like(self.values)))
+        self.values[self.count] = value
+        self.count += 1
+
+        # Welford update, so mean and variance are known without another pass over the values
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.max = max(self.max, value)
+
+    @property
+    def per_frame(self):
+        return self.values[:self.count]
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else 0.0
+
+    def result(self):
+        # Mean difference over all frames, None if no frame could be compared
+        return self.mean if self.count else None
+
+class VideoFrameReader:
+    # Decodes a video file into grayscale frames. Videos carry no capture timestamps, so they can only be
+    # read in order.
+    def __init__(self, path: str):
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        self.frame = None
+        self.buffer = None
+        self.timestamps = None
+        self.timestamp = None
+        self.shape = (int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)))
+        self.count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def opened(self):
+        return self.capture.isOpened()
+
+    def read(self, shape: tuple):
+        # Returns the next frame with the given shape or None at the end of the video
+        ret, self.frame = self.capture.read(self.frame)
+        if not ret:
+            return None
+        if self.buffer is None or self.buffer.shape != shape:
+            self.buffer = np.zeros(shape, dtype=np.uint8)
+        frame = self.frame
+        if frame.shape[:2] != shape:
+            frame = cv2.resize(frame, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.buffer)
+        return self.buffer
+
+    def release(self):
+        self.capture.release()
+
+class StoreFrameReader:
+    # Reads the grayscale frames of a frame store in order or by capture timestamp, without a copy if no
+    # resize is needed
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            self.store = FrameStore(path)
+        except (OSError, ValueError) as e:
+            print(f"Error opening frame store {path}: {e}")
+            self.store = None
+        self.index = 0
+        self.buffer = None
+        self.timestamp = None
+        self.shape = self.store.shape if self.store else (0, 0)
+        self.count = len(self.store) if self.store else 0
+        self.timestamps = self.store.timestamps if self.count else None
+        # Frames are held until the next one, so the last frame covers one more frame interval
+        self.interval = int(np.median(np.diff(self.timestamps))) if self.count > 1 else 0
+
+    def opened(self):
+        return self.store is not None
+
+    def read(self, shape: tuple):
+        if self.index >= self.count:
+            return None
+        self.timestamp = int(self.timestamps[self.index])
+        frame = self.store.frame(self.index)
+        self.index += 1
+        return self.fit(frame, shape)
+
+    def read_at(self, timestamp: int, shape: tuple):
+        # Frame that was on screen at the timestamp, None outside of the capture
+        if timestamp < self.timestamps[0] or timestamp > self.end():
+            return None
+        return self.fit(self.store.frame_at(timestamp), shape)
+
+    def end(self):
+        return int(self.timestamps[-1]) + self.interval
+
+    def fit(self, frame: np.ndarray, shape: tuple):
+        if frame.shape == shape:
+            return frame
+        if self.buffer is None or self.buffer.shape != shape:
+            self.buffer = np.zeros(shape, dtype=np.uint8)
+        return cv2.resize(frame, (shape[1], shape[0]), dst=self.buffer, interpolation=cv2.INTER_AREA)
+
+    def release(self):
+        if self.store:
+            self.timestamps = None
+            self.store.close()
+            self.store = None
+
+def open_frames(path: str):
+    if path.endswith(FRAME_STORE_EXTENSION):
+        return StoreFrameReader(path)
+    return VideoFrameReader(path)
+
+def load_mask(mask, shape: tuple):
+    # ROI mask from an image file or array, non-zero pixels are compared and zero pixels (e.g. UI) are ignored
+    if mask is None:
+        return None
+    if isinstance(mask, str):
+        path = mask
+        mask = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if mask is None:
+            raise ValueError(f"Unable to read ROI mask {path}.")
+    mask = np.asarray(mask)
+    if mask.ndim == 3:
+        mask = mask.any(axis=2)
+    if mask.shape != shape:
+        mask = cv2.resize(mask.astype(np.uint8), (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+    return mask != 0
+
+class FrameDifference:
+    # Mean absolute difference between a baseline frame and the truncated average of one or more frames,
+    # computed on uint8 frames with SIMD kernels and restricted to the ROI mask
+    def __init__(self, shape: tuple, mask=None):
+        self.shape = shape
+        self.mask = load_mask(mask, shape)
+        if self.mask is None:
+            self.pixels = shape[0] * shape[1]
+        else:
+            self.mask = self.mask.astype(np.uint8)
+            self.pixels = max(int(np.count_nonzero(self.mask)), 1)
+        self.sum = np.zeros(shape, dtype=np.uint16)
+        self.average = np.zeros(shape, dtype=np.uint8)
+
+    @traced("analysis.compare")
+    def compare(self, baseline: np.ndarray, frames: list):
+        if len(frames) == 1:
+            frame = frames[0]
+        else:
+            self.sum.fill(0)
+            for frame in frames:
+                cv2.add(self.sum, frame, dst=self.sum, dtype=cv2.CV_16U)
+            # Rounding (sum - (n - 1) / 2) / n equals floor(sum / n) for integer sums
+            n = len(frames)
+            frame = cv2.convertScaleAbs(self.sum, dst=self.average, alpha=1.0 / n, beta=-(n - 1) / (2.0 * n))
+        return cv2.norm(frame, baseline, cv2.NORM_L1, self.mask) / self.pixels
+
+class VideoGroup:
+    # Videos that are averaged into one grayscale frame before they are compared against the baseline
+    def __init__(self, name: str, paths: list[str], capacity: int):
+        self.name = name
+        self.paths = paths
+        self.readers = [open_frames(path) for path in paths]
+        self.differences = FrameDifferences(name, capacity)
+        self.active = True
+
+    def opened(self):
+        return all(reader.opened() for reader in self.readers)
+
+    def timed(self):
+        return all(reader.timestamps is not None for reader in self.readers)
+
+    def read(self, shape: tuple):
+        # Next frame of every video, None once one of them ended
+        frames = [reader.read(shape) for reader in self.readers]
+        return None if any(frame is None for frame in frames) else frames
+
+    def read_at(self, timestamp: int, shape: tuple):
+        frames = [reader.read_at(timestamp, shape) for reader in self.readers]
+        if any(frame is None for frame in frames):
+            if timestamp > min(reader.end() for reader in self.readers):
+                self.active = False
+            return None
+        return frames
+
+    def release(self):
+        for reader in self.readers:
+            reader.release()
+
+@traced("analysis.compare_videos")
+def compare_videos(baseline_path: str, groups: dict[str, list[str]], baseline_origin_ns: int = None, origin_ns: int = None,
+                   mask=None):
+    # Compares the baseline against every group of videos, the videos of a group are averaged first.
+    # With the origins, e.g. the time of the first scenario input of the baseline and of the compared run,
+    # frame stores are matched by capture time relative to their origin, so a different startup delay
+    # does not count as a difference. Otherwise the frames are paired in read order. Every group is scaled
+    # to the resolution of the baseline and memory stays constant in the video length except for the per
+    # frame difference values.
+    baseline = open_frames(baseline_path)
+    if not baseline.opened():
+        print(f"Error opening baseline video: {baseline_path}")
+        return None
+
+    shape = baseline.shape
+    videos = [VideoGroup(name, paths, baseline.count) for name, paths in groups.items()]
+
+    try:
+        for group in videos:
+            if not group.opened():
+                print(f"Error opening videos: {group.paths}")
+                return None
+
+        aligned = baseline_origin_ns is not None and origin_ns is not None and baseline.timestamps is not None and all(group.timed() for group in videos)
+        engine = FrameDifference(shape, mask)
+        while any(group.active for group in videos):
+            with span("analysis.read"):
+                frame = baseline.read(shape)
+            if frame is None:
+                break  # End of video
+            if aligned:
+                elapsed = baseline.timestamp - baseline_origin_ns
+                if elapsed < 0:
+                    continue  # Before the first input
+
+            for group in videos:
+                if not group.active:
+                    continue
+                with span("analysis.read"):
+                    frames = group.read_at(origin_ns + elapsed, shape) if aligned else group.read(shape)
+                if frames is None:
+                    if not aligned:
+                        group.active = False
+                    continue
+                group.differences.add(engine.compare(frame, frames))
+    finally:
+        baseline.release()
+        for group in videos:
+            group.release()
+
+    return {group.name: group.differences for group in videos}
+
+def remove_recordings(groups: dict[str, list[str]]):
+    for paths in groups.values():
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+def init_worker(cpus, trace: bool):
+    # Initializer of the analysis worker processes
+    set_affinity(0, cpus)
+    enable_tracing(trace)
+
+def analyze_run(baseline_path: str, groups: dict[str, list[str]], baseline_origin_ns: int = None, origin_ns: int = None,
+                mask=None, remove: bool = False):
+    # Entry point of the analysis worker processes, deletes the recordings of the run once they are compared
+    differences = compare_videos(baseline_path, groups, baseline_origin_ns, origin_ns, mask)
+    if remove:
+        remove_recordings(groups)
+    return differences
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import hashlib
+
+BUILD_HASHES = {}
+
+def process_name(path: str):
+    # ../Projects/<Framework>/Builds/Benchmark.exe
+    return os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(path))))
+
+def build_hash(process_path: str):
+    # Hash of a Unity build: the contents of the executable plus the layout of its <name>_Data directory.
+    # The player executable is the same for every project, the project itself lives in the data directory.
+    path = os.path.abspath(process_path)
+    stat = os.stat(path)
+    memo_key = (path, stat.st_size, stat.st_mtime_ns)
+    if memo_key in BUILD_HASHES:
+        return BUILD_HASHES[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+
+    data_directory = os.path.splitext(path)[0] + "_Data"
+    for root, directories, files in os.walk(data_directory):
+        directories.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            file_stat = os.stat(file_path)
+            digest.update(f"{os.path.relpath(file_path, data_directory)}:{file_stat.st_size}:{file_stat.st_mtime_ns}\n".encode())
+
+    BUILD_HASHES[memo_key] = digest.hexdigest()
+    return BUILD_HASHES[memo_key]
+
+class BaselineCache:
+    # Content addressed store of baseline recordings. Entries are frame stores named by the hash of
+    # everything that determines their content and are evicted least recently used once the cache grows
+    # beyond max_bytes.
+    def __init__(self, directory: str = "benchmark_baseline_cache", max_bytes: int = 4 * 1024 ** 3, extension: str = ".frames"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, process_path: str, num_objects: int, num_clients: int, scenario, **options):
+        # options holds anything else that changes the recording, e.g. the frame store scale
+        description = json.dumps({
+            "build": build_hash(process_path),
+            "num_objects": num_objects,
+            "num_clients": num_clients,
+            "scenario": scenario.definition(),
+            "options": options,
+        }, sort_keys=True)
+        return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+    def path(self, key: str):
+        return os.path.join(self.directory, key + self.extension)
+
+    def metadata_path(self, key: str):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str):
+        # Returns the path and metadata of a cached recording or None
+        path = self.path(key)
+        if not os.path.exists(path) or not os.path.exists(self.metadata_path(key)):
+            return None
+        with open(self.metadata_path(key)) as file:
+            metadata = json.load(file)
+        metadata["last_used"] = time.time()
+        self.write_metadata(key, metadata)
+        return path, metadata
+
+    def put(self, key: str, **metadata):
+        # Registers the recording that was written to path(key), e.g. with the origin of the baseline run
+        metadata["created"] = metadata["last_used"] = time.time()
+        self.write_metadata(key, metadata)
+        self.evict(keep=key)
+        return self.path(key)
+
+    def write_metadata(self, key: str, metadata: dict):
+        temporary = self.metadata_path(key) + ".tmp"
+        with open(temporary, 'w') as file:
+            json.dump(metadata, file)
+        os.replace(temporary, self.metadata_path(key))
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            try:
+                with open(self.metadata_path(key)) as file:
+                    last_used = json.load(file).get("last_used", 0)
+                size = os.path.getsize(self.path(key))
+            except (OSError, ValueError):
+                last_used, size = 0, 0
+            entries.append((last_used, key, size))
+        return sorted(entries)
+
+    def remove(self, key: str):
+        for path in (self.path(key), self.metadata_path(key)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def evict(self, keep: str = None):
+        entries = self.entries()
+        total = sum(size for _, _, size in entries)
+        for _, key, size in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self.remove(key)
+            total -= size
+            print(f"Evicted baseline {key} from the cache.")
@@ -0,0 +1,350 @@
+import sys
+import time
+import socket
+import struct
+import mmap
+import select
+import ctypes
+import asyncio
+import numpy as np
+from abc import ABC, abstractmethod
+
+ETH_P_ALL = 0x0003
+PACKET_OUTGOING = 4
+SO_ATTACH_FILTER = 26
+IPPROTO_UDP = 17
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+TPACKET_V2 = 1
+TP_STATUS_USER = 1
+ARPHRD_LOOPBACK = 772
+RING_BLOCK_SIZE = 1 << 16
+
+# Link header lengths of the supported link types, mirrors the pcap DLT numbering
+LINK_HEADER_LENGTHS = {
+    0: 4,     # DLT_NULL (e.g. \Device\NPF_Loopback)
+    1: 14,    # DLT_EN10MB (e.g. lo on Linux)
+    101: 0,   # DLT_RAW
+    113: 16,  # DLT_LINUX_SLL
+}
+
+def ipv4_header_dtype(link_offset: int, itemsize: int):
+    # Structured view over the fixed part of the IPv4 header behind the link header
+    return np.dtype({
+        'names': ['ver_ihl', 'total_length', 'frag', 'protocol'],
+        'formats': ['u1', '>u2', '>u2', 'u1'],
+        'offsets': [link_offset, link_offset + 2, link_offset + 6, link_offset + 9],
+        'itemsize': itemsize
+    })
+
+def tpacket2_header_dtype(frame_size: int):
+    # Structured view over the tpacket2_hdr and sockaddr_ll at the start of every packet ring frame
+    return np.dtype({
+        'names': ['status', 'len', 'snaplen', 'mac', 'sec', 'nsec', 'pkttype'],
+        'formats': ['u4', 'u4', 'u4', 'u2', 'u4', 'u4', 'u1'],
+        'offsets': [0, 4, 8, 12, 16, 20, 42],
+        'itemsize': frame_size
+    })
+
+def parse_udp_headers(frames: np.ndarray, link_offset: int):
+    # frames is a (n, snap_length) uint8 array, each row holding the start of one captured frame
+    n, snap_length = frames.shape
+    if n == 0:
+        empty = np.zeros(0, dtype=np.uint16)
+        return np.zeros(0, dtype=bool), empty, empty
+
+    headers = np.ascontiguousarray(frames).view(ipv4_header_dtype(link_offset, snap_length)).reshape(n)
+    ihl = (headers['ver_ihl'] & 0x0F).astype(np.intp) * 4
+    valid = ((headers['ver_ihl'] >> 4) == 4) \
+        & (headers['protocol'] == IPPROTO_UDP) \
+        & ((headers['frag'] & 0x1FFF) == 0) \
+        & (link_offset + ihl + 4 <= snap_length)
+
+    # UDP ports follow the variable length IPv4 header
+    rows = np.arange(n)
+    udp_offset = np.where(valid, link_offset + ihl, 0)
+    src_ports = (frames[rows, udp_offset].astype(np.uint16) << 8) | frames[rows, udp_offset + 1]
+    dst_ports = (frames[rows, udp_offset + 2].astype(np.uint16) << 8) | frames[rows, udp_offset + 3]
+    return valid, src_ports, dst_ports
+
+def count_udp_traffic(lengths: np.ndarray, valid: np.ndarray, src_ports: np.ndarray, dst_ports: np.ndarray, port: int):
+    # Same classification as the pyshark loop: destination port first, then source port
+    to_server = valid & (dst_ports == port)
+    from_server = valid & ~to_server & (src_ports == port)
+    return {
+        "bytes_to_server": int(lengths[to_server].sum()),
+        "bytes_from_server": int(lengths[from_server].sum()),
+        "packets_to_server": int(np.count_nonzero(to_server)),
+        "packets_from_server": int(np.count_nonzero(from_server)),
+    }
+
+def capture_failed(results: dict, error: str):
+    # Marks the results of a capture that did not see all traffic, so the run is repeated instead of stored
+    print(error)
+    results["capture_error"] = error
+
+def store_results(results: dict, bytes_to_server, bytes_from_server, packets_to_server, packets_from_server):
+    results["bytes_to_server"] = bytes_to_server
+    results["bytes_from_server"] = bytes_from_server
+    results["total_bytes"] = bytes_to_server + bytes_from_server
+    results["packets_to_server"] = packets_to_server
+    results["packets_from_server"] = packets_from_server
+    results["total_packets"] = packets_to_server + packets_from_server
+
+class TrafficCaptureBackend(ABC):
+    def __init__(self, port: int, interface: str):
+        self.port = port
+        self.interface = interface
+
+    @abstractmethod
+    def capture(self, cancel_event, results: dict, series=None):
+        pass
+
+class RawSocketTrafficCapture(TrafficCaptureBackend):
+    # Linux only, requires CAP_NET_RAW. The kernel writes frames into a memory mapped packet ring,
+    # each batch of ready frames is gathered and classified at once instead of parsing every packet in python.
+    def __init__(self, port: int, interface: str = 'lo', batch_size: int = 1024, snap_length: int = 128, timeout: float = 0.1, buffer_size: int = 8 * 1024 * 1024):
+        super().__init__(port, interface)
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.snap_length = snap_length
+        self.timeout = timeout
+        self.link_offset = LINK_HEADER_LENGTHS[1]
+
+        self.frames = np.zeros((batch_size, snap_length), dtype=np.uint8)
+        self.lengths = np.zeros(batch_size, dtype=np.int64)
+        self.timestamps = np.zeros(batch_size, dtype=np.int64)
+        self.frame_views = [memoryview(row) for row in self.frames]
+
+        # Ring frames hold the headers and up to snap_length bytes of the packet, a power of two keeps
+        # them packed into the blocks without gaps
+        self.frame_size = 1 << (128 + snap_length - 1).bit_length()
+        self.snap_columns = np.arange(snap_length)
+        self.batch_slots = np.arange(batch_size)
+        self.ring = None
+        self.ring_frames = None
+        self.ring_headers = None
+        self.cursor = 0
+        self.poller = None
+        self.loopback = False
+
+    def open_socket(self, filter_port: bool = True):
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        # A large kernel buffer absorbs bursts while a batch is being classified
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer_size)
+        sock.bind((self.interface, 0))
+        self.attach_filter(sock, self.port if filter_port else None)
+        sock.settimeout(self.timeout)
+        # Loopback frames are seen twice, once outgoing and once incoming, other interfaces only show
+        # the outgoing copy of packets sent by this host
+        self.loopback = sock.getsockname()[3] == ARPHRD_LOOPBACK
+        try:
+            self.map_ring(sock)
+        except OSError as e:
+            print(f"Packet ring unavailable on {self.interface}, reading packets one by one: {e}")
+        return sock
+
+    def map_ring(self, sock):
+        block_count = max(self.buffer_size // RING_BLOCK_SIZE, 1)
+        frame_count = block_count * (RING_BLOCK_SIZE // self.frame_size)
+        sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V2)
+        sock.setsockopt(SOL_PACKET, PACKET_RX_RING, struct.pack('IIII', RING_BLOCK_SIZE, block_count, self.frame_size, frame_count))
+        self.ring = mmap.mmap(sock.fileno(), block_count * RING_BLOCK_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.ring_frames = np.frombuffer(self.ring, dtype=np.uint8).reshape(frame_count, self.frame_size)
+        self.ring_headers = self.ring_frames.reshape(-1).view(tpacket2_header_dtype(self.frame_size))
+        self.cursor = 0
+        self.poller = select.poll()
+        self.poller.register(sock, select.POLLIN)
+
+    def close_socket(self, sock):
+        if self.ring is not None:
+            # The array views export the mapping and have to be released before it can be closed
+            self.ring_frames = None
+            self.ring_headers = None
+            self.poller = None
+            self.ring.close()
+            self.ring = None
+        sock.close()
+
+    def attach_filter(self, sock, port: int = None):
+        # Kernel side equivalent of "ip and udp port <port>" so unrelated traffic never reaches python,
+        # or of "ip and udp" without a port
+        if port is None:
+            instructions = [
+                (0x28, 0, 0, 0x0000000c),   # ldh [12]
+                (0x15, 0, 5, 0x00000800),   # jeq #0x800 else drop
+                (0x30, 0, 0, 0x00000017),   # ldb [23]
+                (0x15, 0, 3, IPPROTO_UDP),  # jeq #17 else drop
+                (0x28, 0, 0, 0x00000014),   # ldh [20]
+                (0x45, 1, 0, 0x00001fff),   # jset #0x1fff drop fragments
+                (0x06, 0, 0, 0x00040000),   # ret accept
+                (0x06, 0, 0, 0x00000000),   # ret drop
+            ]
+        else:
+            instructions = [
+                (0x28, 0, 0, 0x0000000c),   # ldh [12]
+                (0x15, 0, 10, 0x00000800),  # jeq #0x800 else drop
+                (0x30, 0, 0, 0x00000017),   # ldb [23]
+                (0x15, 0, 8, IPPROTO_UDP),  # jeq #17 else drop
+                (0x28, 0, 0, 0x00000014),   # ldh [20]
+                (0x45, 6, 0, 0x00001fff),   # jset #0x1fff drop fragments
+                (0xb1, 0, 0, 0x0000000e),   # ldxb 4*([14]&0xf)
+                (0x48, 0, 0, 0x0000000e),   # ldh [x + 14]
+                (0x15, 2, 0, port),         # jeq #port accept
+                (0x48, 0, 0, 0x00000010),   # ldh [x + 16]
+                (0x15, 0, 1, port),         # jeq #port else drop
+                (0x06, 0, 0, 0x00040000),   # ret accept
+                (0x06, 0, 0, 0x00000000),   # ret drop
+            ]
+        program = b''.join(struct.pack('HBBI', *instruction) for instruction in instructions)
+        buffer = ctypes.create_string_buffer(program)
+        fprog = struct.pack('HL', len(instructions), ctypes.addressof(buffer))
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+    def capture(self, cancel_event, results: dict, series=None):
+        counts = {"bytes_to_server": 0, "bytes_from_server": 0, "packets_to_server": 0, "packets_from_server": 0}
+
+        try:
+            sock = self.open_socket()
+        except (OSError, AttributeError) as e:
+            capture_failed(results, f"Error opening raw socket on {self.interface}: {e}")
+            return
+
+        print("Traffic capture started...")
+        try:
+            while not cancel_event.is_set():
+                n = self.read_batch(sock, cancel_event)
+                if n == 0:
+                    continue
+                for key, value in self.process_batch(n, series).items():
+                    counts[key] += value
+        except Exception as e:
+            capture_failed(results, f"Error during traffic capture: {e}")
+        finally:
+            self.close_socket(sock)
+
+        store_results(results, counts["bytes_to_server"], counts["bytes_from_server"], counts["packets_to_server"], counts["packets_from_server"])
+        print("Traffic capture stopped.")
+
+    def read_batch(self, sock, cancel_event):
+        # Fills frames, lengths and timestamps with the next batch and returns its size
+        if self.ring is None:
+            return self.read_batch_socket(sock, cancel_event)
+
+        # Consecutive frames handed to user space starting at the cursor
+        slots = (self.cursor + self.batch_slots) % len(self.ring_frames)
+        ready = (self.ring_headers['status'][slots] & TP_STATUS_USER) != 0
+        count = len(slots) if ready.all() else int(np.argmin(ready))
+        if count == 0:
+            self.poller.poll(int(self.timeout * 1000))
+            return 0
+        slots = slots[:count]
+
+        records = self.ring_frames[slots]
+        headers = records.reshape(-1).view(tpacket2_header_dtype(self.frame_size))
+        keep = headers['pkttype'] != PACKET_OUTGOING if self.loopback else np.ones(count, dtype=bool)
+        n = int(np.count_nonzero(keep))
+
+        columns = headers['mac'][keep].astype(np.intp)[:, None] + self.snap_columns
+        data = np.take_along_axis(records[keep], np.minimum(columns, self.frame_size - 1), axis=1)
+        data[self.snap_columns >= headers['snaplen'][keep][:, None]] = 0
+        self.frames[:n] = data
+        self.lengths[:n] = headers['len'][keep]
+        self.timestamps[:n] = headers['sec'][keep].astype(np.int64) * 1_000_000_000 + headers['nsec'][keep]
+
+        # Hands the frames back to the kernel
+        self.ring_headers['status'][slots] = 0
+        self.cursor = int(slots[-1]) + 1
+        return n
+
+    def read_batch_socket(self, sock, cancel_event):
+        n = 0
+        while n < self.batch_size and not cancel_event.is_set():
+            try:
+                # MSG_TRUNC returns the real frame length even though only the headers are copied
+                nbytes, address = sock.recvfrom_into(self.frame_views[n], self.snap_length, socket.MSG_TRUNC)
+            except socket.timeout:
+                break
+            if self.loopback and address[2] == PACKET_OUTGOING:
+                continue
+            self.lengths[n] = nbytes
+            self.timestamps[n] = time.time_ns()
+            n += 1
+        return n
+
+    def process_batch(self, n: int, series=None):
+        valid, src_ports, dst_ports = parse_udp_headers(self.frames[:n], self.link_offset)
+        if series is not None:
+            series.add(self.timestamps[:n], self.lengths[:n], valid, src_ports, dst_ports)
+        return count_udp_traffic(self.lengths[:n], valid, src_ports, dst_ports, self.port)
+
+class PysharkTrafficCapture(TrafficCaptureBackend):
+    def capture(self, cancel_event, results: dict, series=None):
+        import pyshark
+
+        # Create an event loop in this thread
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        capture = pyshark.LiveCapture(interface=self.interface, bpf_filter=f"udp port {self.port}")
+        bytes_to_server = 0
+        bytes_from_server = 0
+        packets_to_server = 0
+        packets_from_server = 0
+        pending = []
+
+        print("Traffic capture started...")
+        try:
+            for packet in capture.sniff_continuously():
+                if cancel_event.is_set():
+                    break
+
+                if hasattr(packet, 'udp') and hasattr(packet, 'length'):
+                    packet_length = int(packet.length)
+                    src_port = int(packet.udp.srcport)
+                    dst_port = int(packet.udp.dstport)
+
+                    # Check if the captured port is the destination or source
+                    if dst_port == self.port:
+                        # Traffic to the server
+                        bytes_to_server += packet_length
+                        packets_to_server += 1
+                    elif src_port == self.port:
+                        # Traffic from the server
+                        bytes_from_server += packet_length
+                        packets_from_server += 1
+
+                    if series is not None:
+                        pending.append((int(float(packet.sniff_timestamp) * 1e9), packet_length, src_port, dst_port))
+                        if len(pending) >= 256:
+                            self.flush_series(series, pending)
+
+        except Exception as e:
+            capture_failed(results, f"Error during traffic capture: {e}")
+        finally:
+            capture.close()
+            if series is not None:
+                self.flush_series(series, pending)
+
+        store_results(results, bytes_to_server, bytes_from_server, packets_to_server, packets_from_server)
+        print("Traffic capture stopped.")
+
+    def flush_series(self, series, pending: list):
+        if not pending:
+            return
+        timestamps, lengths, src_ports, dst_ports = (np.array(column, dtype=np.int64) for column in zip(*pending))
+        series.add(timestamps, lengths, np.ones(len(pending), dtype=bool), src_ports, dst_ports)
+        pending.clear()
+
+CAPTURE_BACKENDS = {
+    "raw": RawSocketTrafficCapture,
+    "pyshark": PysharkTrafficCapture,
+}
+
+def create_capture_backend(name: str, port: int, interface: str):
+    if name == "auto":
+        name = "raw" if sys.platform.startswith("linux") else "pyshark"
+    if name not in CAPTURE_BACKENDS:
+        raise ValueError(f"Unknown capture backend '{name}', expected one of {list(CAPTURE_BACKENDS)}")
+    return CAPTURE_BACKENDS[name](port, interface)
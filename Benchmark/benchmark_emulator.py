@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import queue
+import socket
+import struct
+import random
+import argparse
+import itertools
+import threading
+import numpy as np
+from benchmark_harness import BenchmarkCommands, BenchmarkAcks, CONTROLLER_BATCH_MODE, CONTROLLER_NO_GRAPHICS, LEGACY_PROTOCOL, PROTOCOL_VERSION, \
+    FRAME_ACKNOWLEDGE, COMMAND_APPLIED, encode_frame, parse_frames
+
+# Stand-in for the Unity benchmark builds. It is launched like a build ("<control port> [arguments]"), connects
+# back to the harness and handles the BenchmarkCommands in the plain or framed protocol like the BenchmarkController. Servers
+# replicate a simulated world to their clients over UDP, so traffic scales with the number of objects and clients.
+
+# Payload lengths of the commands, DirectionalInput carries an int32 index in front of the floats in the local build
+COMMAND_LENGTHS = {
+    BenchmarkCommands.StartServer: 0,
+    BenchmarkCommands.StartClient: 0,
+    BenchmarkCommands.StopServer: 0,
+    BenchmarkCommands.StopClient: 0,
+    BenchmarkCommands.DirectionalInput: 8,
+    BenchmarkCommands.SetObjectNumber: 4,
+}
+LOCAL_INPUT_LENGTH = 12
+
+# Replication packets: server snapshots split into chunks of object records, client inputs and disconnects
+SNAPSHOT_HEADER = struct.Struct('<cIHH')  # type, tick, chunk, chunk count
+INPUT_HEADER = struct.Struct('<cIIff')  # type, client id, sequence, right, up
+DISCONNECT = struct.Struct('<cI')  # type, client id
+MAX_PAYLOAD = 1200
+PLAYER_SPEED = 0.5
+
+def parse_commands(buffer: bytes, input_length: int):
+    # Returns the complete commands in the buffer and the remaining bytes
+    commands = []
+    index = 0
+    while index < len(buffer):
+        try:
+            command = BenchmarkCommands(buffer[index:index + 1])
+        except ValueError:
+            print(f"Received unknown command {buffer[index]}.")
+            index += 1
+            continue
+        length = input_length if command == BenchmarkCommands.DirectionalInput else COMMAND_LENGTHS[command]
+        if index + 1 + length > len(buffer):
+            break  # Incomplete message body
+        commands.append((command, buffer[index + 1:index + 1 + length]))
+        index += 1 + length
+    return commands, buffer[index:]
+
+def frame_commands(messages: list):
+    # Commands of a frame, unknown opcodes are skipped by their length
+    commands = []
+    for opcode, payload in messages:
+        try:
+            commands.append((BenchmarkCommands(bytes([opcode])), payload))
+        except ValueError:
+            print(f"Received unknown command {opcode}.")
+    return commands
+
+def record_dtype(object_bytes: int):
+    # Object id and position, padded to the replicated size of one object
+    return np.dtype({'names': ['id', 'x', 'y'], 'formats': ['<u4', '<f4', '<f4'], 'offsets': [0, 4, 8], 'itemsize': max(object_bytes, 12)})
+
+class World:
+    # Objects drift on a seeded timeline and bounce off the borders, players are moved by directional inputs
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.positions = np.zeros((0, 2), dtype=np.float32)
+        self.velocities = np.zeros((0, 2), dtype=np.float32)
+        self.players = {}  # player id -> [x, y, right, up]
+
+    def spawn(self, count: int):
+        rng = np.random.default_rng(self.seed)
+        self.positions = rng.uniform(0, 1, (count, 2)).astype(np.float32)
+        self.velocities = rng.uniform(-0.2, 0.2, (count, 2)).astype(np.float32)
+
+    def clear(self):
+        self.spawn(0)
+        self.players = {}
+
+    def join(self, player: int):
+        self.players.setdefault(player, [0.5, 0.5, 0.0, 0.0])
+
+    def leave(self, player: int):
+        self.players.pop(player, None)
+
+    def input(self, player: int, right: float, up: float):
+        if player in self.players:
+            self.players[player][2:] = [right, up]
+
+    def step(self, dt: float):
+        self.positions += self.velocities * dt
+        outside = (self.positions < 0) | (self.positions > 1)
+        self.velocities[outside] *= -1
+        np.clip(self.positions, 0, 1, out=self.positions)
+        for player in self.players.values():
+            player[0] = min(max(player[0] + player[2] * PLAYER_SPEED * dt, 0.0), 1.0)
+            player[1] = min(max(player[1] - player[3] * PLAYER_SPEED * dt, 0.0), 1.0)
+
+    def state(self):
+        # Positions of the objects followed by the players, in join order
+        players = np.array([player[:2] for player in self.players.values()], dtype=np.float32).reshape(-1, 2)
+        return np.concatenate((self.positions, players))
+
+class Renderer:
+    # Draws the objects as boxes into a window, so the capture path has frames of the replicated state
+    def __init__(self, width: int = 640, height: int = 360):
+        import cv2
+        self.cv2 = cv2
+        self.width = width
+        self.height = height
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.name = f"Benchmark {os.getpid()}"
+        cv2.namedWindow(self.name, cv2.WINDOW_AUTOSIZE)
+
+    def draw(self, positions: np.ndarray, players: int):
+        self.frame.fill(32)
+        size = max(self.height // 24, 2)
+        for index, (x, y) in enumerate(positions):
+            left = int(x * (self.width - size))
+            top = int(y * (self.height - size))
+            color = (255, 255, 255) if index >= len(positions) - players else (96, 160, 224)
+            self.frame[top:top + size, left:left + size] = color
+        self.cv2.imshow(self.name, self.frame)
+        self.cv2.waitKey(1)
+
+    def close(self):
+        self.cv2.destroyWindow(self.name)
+
+class EmulatedServer:
+    def __init__(self, port: int, world: World, object_bytes: int):
+        self.world = world
+        self.dtype = record_dtype(object_bytes)
+        self.records_per_packet = max((MAX_PAYLOAD - SNAPSHOT_HEADER.size) // self.dtype.itemsize, 1)
+        self.clients = {}  # address -> client id
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("0.0.0.0", port))
+        self.socket.setblocking(False)
+
+    def receive(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(2048)
+            except (BlockingIOError, ConnectionResetError):
+                break
+            if data[:1] == b'I' and len(data) >= INPUT_HEADER.size:
+                _, client, _, right, up = INPUT_HEADER.unpack_from(data)
+                if address not in self.clients:
+                    self.clients[address] = client
+                    self.world.join(client)
+                self.world.input(client, right, up)
+            elif data[:1] == b'D' and len(data) >= DISCONNECT.size:
+                client = self.clients.pop(address, None)
+                if client is not None:
+                    self.world.leave(client)
+
+    def send(self, tick: int):
+        state = self.world.state()
+        records = np.zeros(len(state), dtype=self.dtype)
+        records['id'] = np.arange(len(state))
+        records['x'] = state[:, 0]
+        records['y'] = state[:, 1]
+        chunks = max((len(records) + self.records_per_packet - 1) // self.records_per_packet, 1)
+        packets = [SNAPSHOT_HEADER.pack(b'S', tick, chunk, chunks) + records[chunk * self.records_per_packet:(chunk + 1) * self.records_per_packet].tobytes()
+                   for chunk in range(chunks)]
+        for address in self.clients:
+            for packet in packets:
+                try:
+                    self.socket.sendto(packet, address)
+                except OSError:
+                    pass
+
+    def close(self):
+        self.socket.close()
+        self.clients = {}
+
+class EmulatedClient:
+    def __init__(self, address: str, port: int, object_bytes: int, input_bytes: int):
+        self.server = (address, port)
+        self.dtype = record_dtype(object_bytes)
+        self.input_bytes = max(input_bytes, INPUT_HEADER.size)
+        self.id = random.getrandbits(31)
+        self.sequence = 0
+        self.input = (0.0, 0.0)
+        self.positions = np.zeros((0, 2), dtype=np.float32)
+        self.connected = False
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def receive(self):
+        # Returns True once the first snapshot arrived
+        first = False
+        while True:
+            try:
+                data = self.socket.recv(MAX_PAYLOAD + 64)
+            except (BlockingIOError, ConnectionResetError):
+                break
+            if data[:1] != b'S' or len(data) < SNAPSHOT_HEADER.size:
+                continue
+            records = np.frombuffer(data, dtype=self.dtype, offset=SNAPSHOT_HEADER.size)
+            if len(records):
+                count = int(records['id'].max()) + 1
+                if count > len(self.positions):
+                    self.positions = np.concatenate((self.positions, np.zeros((count - len(self.positions), 2), dtype=np.float32)))
+                self.positions[records['id'], 0] = records['x']
+                self.positions[records['id'], 1] = records['y']
+            if not self.connected:
+                self.connected = first = True
+        return first
+
+    def send(self):
+        self.sequence += 1
+        packet = INPUT_HEADER.pack(b'I', self.id, self.sequence, *self.input)
+        try:
+            self.socket.sendto(packet.ljust(self.input_bytes, b'\0'), self.server)
+        except OSError:
+            pass
+
+    def close(self):
+        try:
+            self.socket.sendto(DISCONNECT.pack(b'D', self.id), self.server)
+        except OSError:
+            pass
+        self.socket.close()
+
+class BenchmarkEmulator:
+    # Handles the commands of the harness on a fixed tick like the Unity main loop, the control socket is read
+    # by a background thread
+    def __init__(self, args):
+        self.args = args
+        self.local = args.local
+        self.input_length = LOCAL_INPUT_LENGTH if self.local else COMMAND_LENGTHS[BenchmarkCommands.DirectionalInput]
+        self.world = World(args.seed)
+        self.num_objects = 0
+        self.server = None
+        self.client = None
+        self.local_clients = 0
+        self.await_objects = False
+        self.await_client = False
+        self.framed = args.protocol >= PROTOCOL_VERSION
+        self.commands = queue.Queue()  # Frames of (sequence, flags, commands), every plain command is a frame of its own
+        self.ack_sequence = itertools.count(1)
+        self.running = True
+        self.tick = 0
+
+        self.renderer = None
+        if args.window and not args.nographics:
+            try:
+                self.renderer = Renderer()
+            except Exception as e:
+                print(f"Unable to open a window, running without graphics: {e}")
+
+        self.control = socket.create_connection(("127.0.0.1", args.control_port))
+        self.control.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        print(f"Connected to harness at {args.control_port}.")
+
+    def mode(self):
+        return (CONTROLLER_BATCH_MODE if self.args.batchmode else 0) | (CONTROLLER_NO_GRAPHICS if self.renderer is None else 0)
+
+    def acknowledge(self, ack: BenchmarkAcks, value: int = 0, payload: bytes = None):
+        payload = struct.pack('<i', value) if payload is None else payload
+        try:
+            if self.framed:
+                self.control.sendall(encode_frame([(ack, payload)], next(self.ack_sequence)))
+            else:
+                self.control.sendall(ack.value + payload)
+        except OSError as e:
+            print(f"Error sending acknowledgement: {e}")
+
+    def receive_commands(self):
+        buffer = b''
+        while self.running:
+            try:
+                data = self.control.recv(1024)
+            except OSError:
+                break
+            if not data:
+                break
+            if self.framed:
+                frames, buffer = parse_frames(buffer + data)
+                for flags, sequence, messages in frames:
+                    self.commands.put((sequence, flags, frame_commands(messages)))
+            else:
+                commands, buffer = parse_commands(buffer + data, self.input_length)
+                for command in commands:
+                    self.commands.put((0, 0, [command]))
+        print("Harness disconnected.")
+        self.running = False
+
+    def handle(self, command: BenchmarkCommands, payload: bytes):
+        args = self.args
+        if command == BenchmarkCommands.SetObjectNumber:
+            self.num_objects = struct.unpack('i', payload)[0]
+        elif command == BenchmarkCommands.StartServer:
+            if not self.local:
+                self.server = EmulatedServer(args.port, self.world, args.object_bytes)
+            self.world.spawn(self.num_objects)
+            self.world.join(-1)
+            self.acknowledge(BenchmarkAcks.ServerStarted)
+            self.await_objects = True  # Acknowledged a tick later, like the framework integrations
+        elif command == BenchmarkCommands.StopServer:
+            if self.server:
+                self.server.close()
+                self.server = None
+            self.world.clear()
+            self.local_clients = 0
+        elif command == BenchmarkCommands.StartClient:
+            if self.local:
+                self.world.join(self.local_clients)
+                self.local_clients += 1
+                self.acknowledge(BenchmarkAcks.ClientConnected)
+            else:
+                self.client = EmulatedClient(args.address, args.port, args.object_bytes, args.input_bytes)
+                self.await_client = True  # Acknowledged once the first snapshot arrived
+        elif command == BenchmarkCommands.StopClient:
+            if self.local:
+                self.local_clients = max(self.local_clients - 1, 0)
+                self.world.leave(self.local_clients)
+            elif self.client:
+                self.client.close()
+                self.client = None
+        elif command == BenchmarkCommands.DirectionalInput:
+            # Frames carry the payload length, so both layouts are accepted there
+            if len(payload) == LOCAL_INPUT_LENGTH:
+                index, right, up = struct.unpack('iff', payload)
+                if self.local:
+                    self.world.input(index, right, up)
+                    return
+            else:
+                right, up = struct.unpack('ff', payload[:8])
+            if self.local:
+                self.world.input(-1, right, up)
+            else:
+                if self.server:
+                    self.world.input(-1, right, up)
+                if self.client:
+                    self.client.input = (right, up)
+
+    def update(self, dt: float):
+        while True:
+            try:
+                sequence, flags, commands = self.commands.get_nowait()
+            except queue.Empty:
+                break
+            for command, payload in commands:
+                self.handle(command, payload)
+            if flags & FRAME_ACKNOWLEDGE:
+                self.acknowledge(BenchmarkAcks.CommandApplied, payload=COMMAND_APPLIED.pack(sequence, self.tick))
+
+        if self.await_objects:
+            self.await_objects = False
+            self.acknowledge(BenchmarkAcks.ObjectsSpawned, self.num_objects)
+
+        if self.server:
+            self.server.receive()
+        self.world.step(dt)
+        if self.server:
+            self.server.send(self.tick)
+        if self.client:
+            self.client.send()
+            if self.client.receive() and self.await_client:
+                self.await_client = False
+                self.acknowledge(BenchmarkAcks.ClientConnected)
+
+        if self.renderer:
+            if self.client and not self.server:
+                self.renderer.draw(self.client.positions, 0)
+            else:
+                self.renderer.draw(self.world.state(), len(self.world.players))
+
+    def run(self):
+        self.acknowledge(BenchmarkAcks.ControllerReady, self.args.token)
+        self.acknowledge(BenchmarkAcks.ControllerMode, self.mode())
+        threading.Thread(target=self.receive_commands, daemon=True).start()
+
+        interval = 1.0 / self.args.tick_rate
+        next_tick = time.perf_counter()
+        while self.running:
+            next_tick += interval
+            self.update(interval)
+            self.tick += 1
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()  # Skip the ticks that were missed instead of catching up
+
+        if self.server:
+            self.server.close()
+        if self.client:
+            self.client.close()
+        if self.renderer:
+            self.renderer.close()
+        self.control.close()
+
+def main():
+    # Unity style arguments, unknown player arguments (e.g. "-screen-width") are ignored like in the builds
+    parser = argparse.ArgumentParser(description="Emulates a benchmark build for the harness.")
+    parser.add_argument("control_port", type=int, help="port of the harness control socket")
+    parser.add_argument("-protocol", type=int, default=LEGACY_PROTOCOL, help="command protocol requested by the harness")
+    parser.add_argument("-token", type=int, default=0, help="handshake token echoed with the ControllerReady acknowledgement")
+    parser.add_argument("-port", type=int, default=24856, help="game port the server listens on and the clients connect to")
+    parser.add_argument("-address", default="127.0.0.1", help="server address of the clients")
+    parser.add_argument("-batchmode", action='store_true')
+    parser.add_argument("-nographics", action='store_true')
+    parser.add_argument("-local", action='store_true', help="emulate the local build: server and clients in one process without network traffic")
+    parser.add_argument("-tick-rate", type=float, default=60.0, help="simulation, replication and frame rate")
+    parser.add_argument("-object-bytes", type=int, default=16, help="replicated bytes per object and snapshot, at least 12")
+    parser.add_argument("-input-bytes", type=int, default=32, help="bytes of every client input packet")
+    parser.add_argument("-window", action='store_true', help="render the objects into a window that can be captured")
+    parser.add_argument("-seed", type=int, default=0)
+    args, _ = parser.parse_known_args()
+
+    BenchmarkEmulator(args).run()
+
+if __name__ == "__main__":
+    sys.exit(main())
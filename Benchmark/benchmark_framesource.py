@@ -0,0 +1,384 @@
+import sys
+import time
+import ctypes
+import ctypes.util
+import cv2
+import numpy as np
+from abc import ABC, abstractmethod
+
+class FrameSource(ABC):
+    # Delivers BGR frames of the window of one benchmark process. Nothing is set up before open(), which
+    # is only called once a capture is started.
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.width = 0
+        self.height = 0
+
+    @abstractmethod
+    def open(self):
+        # Returns the (width, height) of the frames
+        pass
+
+    @abstractmethod
+    def grab(self, out: np.ndarray):
+        # Writes the current frame into out, an array of shape (height, width, 3)
+        pass
+
+    def close(self):
+        pass
+
+class Win32FrameSource(FrameSource):
+    def open(self):
+        import win32gui
+        import win32ui
+        from ctypes import windll
+
+        self.hwnd = self.find_window_by_pid(self.pid)
+        if self.hwnd is None:
+            raise RuntimeError(f"Window for process with PID {self.pid} not found.")
+
+        rect = win32gui.GetWindowRect(self.hwnd)
+        left, top, right, bottom = rect
+        self.width = right - left
+        self.height = bottom - top
+
+        windll.user32.SetProcessDPIAware()
+        self.hwnd_dc = win32gui.GetWindowDC(self.hwnd)
+        self.mfc_dc = win32ui.CreateDCFromHandle(self.hwnd_dc)
+        self.save_dc = self.mfc_dc.CreateCompatibleDC()
+
+        self.bitmap = win32ui.CreateBitmap()
+        self.bitmap.CreateCompatibleBitmap(self.mfc_dc, self.width, self.height)
+        return self.width, self.height
+
+    def find_window_by_pid(self, pid):
+        # Adapted from https://stackoverflow.com/questions/70618975/python-get-windowtitle-from-process-id-or-process-name
+        import win32gui
+        import win32process
+
+        def enum_window_callback(hwnd, lParam):
+            _, found_pid = win32process.GetWindowThreadProcessId(hwnd)
+            if found_pid == pid:
+                lParam.append(hwnd)
+            return True
+
+        hwnd_list = []
+        win32gui.EnumWindows(enum_window_callback, hwnd_list)
+        return hwnd_list[0] if hwnd_list else None
+
+    def grab(self, out: np.ndarray):
+        # Adapted from https://github.com/BoboTiG/python-mss/issues/180
+        from ctypes import windll
+        self.save_dc.SelectObject(self.bitmap)
+
+        result = windll.user32.PrintWindow(self.hwnd, self.save_dc.GetSafeHdc(), 3)
+
+        if result != 1:
+            self.close()
+            raise RuntimeError(f"Unable to acquire screenshot! Result: {result}")
+
+        # The BGRX bitmap is viewed without a copy and converted straight into the pooled frame buffer
+        bmpstr = self.bitmap.GetBitmapBits(True)
+        frame = np.frombuffer(bmpstr, dtype=np.uint8).reshape(self.height, self.width, 4)
+        cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR, dst=out)
+        return out
+
+    def close(self):
+        import win32gui
+        if getattr(self, "bitmap", None) is None:
+            return
+        win32gui.DeleteObject(self.bitmap.GetHandle())
+        self.save_dc.DeleteDC()
+        self.mfc_dc.DeleteDC()
+        win32gui.ReleaseDC(self.hwnd, self.hwnd_dc)
+        self.bitmap = None
+
+class XImage(ctypes.Structure):
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+        ("obdata", ctypes.c_void_p),
+        ("create_image", ctypes.c_void_p),
+        ("destroy_image", ctypes.c_void_p),
+        ("get_pixel", ctypes.c_void_p),
+        ("put_pixel", ctypes.c_void_p),
+        ("sub_image", ctypes.c_void_p),
+        ("add_pixel", ctypes.c_void_p),
+    ]
+
+class XWindowAttributes(ctypes.Structure):
+    _fields_ = [
+        ("x", ctypes.c_int),
+        ("y", ctypes.c_int),
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("border_width", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("visual", ctypes.c_void_p),
+        ("root", ctypes.c_ulong),
+        ("class", ctypes.c_int),
+        ("bit_gravity", ctypes.c_int),
+        ("win_gravity", ctypes.c_int),
+        ("backing_store", ctypes.c_int),
+        ("backing_planes", ctypes.c_ulong),
+        ("backing_pixel", ctypes.c_ulong),
+        ("save_under", ctypes.c_int),
+        ("colormap", ctypes.c_ulong),
+        ("map_installed", ctypes.c_int),
+        ("map_state", ctypes.c_int),
+        ("all_event_masks", ctypes.c_long),
+        ("your_event_mask", ctypes.c_long),
+        ("do_not_propagate_mask", ctypes.c_long),
+        ("override_redirect", ctypes.c_int),
+        ("screen", ctypes.c_void_p),
+    ]
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+# Xlib constants
+Z_PIXMAP = 2
+ALL_PLANES = 0xFFFFFFFFFFFFFFFF if ctypes.sizeof(ctypes.c_ulong) == 8 else 0xFFFFFFFF
+XA_CARDINAL = 6
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+XLIB = None
+DESTROY_IMAGE = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(XImage))
+
+def load_xlib():
+    # Loads libX11, libXext and libc once and declares the signatures that are used
+    global XLIB
+    if XLIB is not None:
+        return XLIB
+
+    x11 = ctypes.CDLL(ctypes.util.find_library("X11") or "libX11.so.6")
+    xext = ctypes.CDLL(ctypes.util.find_library("Xext") or "libXext.so.6")
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+    x11.XInitThreads()
+    x11.XOpenDisplay.restype = ctypes.c_void_p
+    x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+    x11.XDefaultRootWindow.restype = ctypes.c_ulong
+    x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+    x11.XInternAtom.restype = ctypes.c_ulong
+    x11.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+    x11.XQueryTree.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_ulong),
+                               ctypes.POINTER(ctypes.POINTER(ctypes.c_ulong)), ctypes.POINTER(ctypes.c_uint)]
+    x11.XGetWindowProperty.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_long, ctypes.c_long, ctypes.c_int,
+                                       ctypes.c_ulong, ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_int),
+                                       ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_void_p)]
+    x11.XGetWindowAttributes.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(XWindowAttributes)]
+    x11.XGetImage.restype = ctypes.POINTER(XImage)
+    x11.XGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_int, ctypes.c_uint, ctypes.c_uint, ctypes.c_ulong, ctypes.c_int]
+    x11.XFree.argtypes = [ctypes.c_void_p]
+    x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+
+    xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+    xext.XShmCreateImage.restype = ctypes.POINTER(XImage)
+    xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p,
+                                     ctypes.POINTER(XShmSegmentInfo), ctypes.c_uint, ctypes.c_uint]
+    xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+    xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+    xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(XImage), ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+
+    libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+    libc.shmat.restype = ctypes.c_void_p
+    libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+    libc.shmdt.argtypes = [ctypes.c_void_p]
+    libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+    XLIB = (x11, xext, libc)
+    return XLIB
+
+class X11FrameSource(FrameSource):
+    # Grabs the window of the process from an X server, e.g. Xvfb on headless machines. With the MIT-SHM
+    # extension the server writes every frame straight into a shared memory segment, so no pixel data
+    # goes over the X connection.
+    def __init__(self, pid: int, display: str = None):
+        super().__init__(pid)
+        self.display_name = display
+        self.display = None
+        self.window = None
+        self.image = None
+        self.shminfo = None
+        self.frame = None
+
+    def open(self):
+        self.x11, self.xext, self.libc = load_xlib()
+        self.display = self.x11.XOpenDisplay(self.display_name.encode() if self.display_name else None)
+        if not self.display:
+            raise RuntimeError(f"Unable to open X display {self.display_name or '$DISPLAY'}.")
+
+        self.window = self.find_window_by_pid(self.pid)
+        if self.window is None:
+            raise RuntimeError(f"Window for process with PID {self.pid} not found.")
+
+        attributes = XWindowAttributes()
+        self.x11.XGetWindowAttributes(self.display, self.window, ctypes.byref(attributes))
+        self.width = attributes.width
+        self.height = attributes.height
+
+        if self.xext.XShmQueryExtension(self.display):
+            self.open_shared_memory(attributes)
+        else:
+            print("X server does not support MIT-SHM, falling back to XGetImage.")
+        return self.width, self.height
+
+    def open_shared_memory(self, attributes: XWindowAttributes):
+        self.shminfo = XShmSegmentInfo()
+        image = self.xext.XShmCreateImage(self.display, attributes.visual, attributes.depth, Z_PIXMAP, None,
+                                          ctypes.byref(self.shminfo), self.width, self.height)
+        if not image:
+            raise RuntimeError("XShmCreateImage failed.")
+        if image.contents.bits_per_pixel != 32:
+            raise RuntimeError(f"Unsupported X image format with {image.contents.bits_per_pixel} bits per pixel.")
+
+        size = image.contents.bytes_per_line * image.contents.height
+        self.shminfo.shmid = self.libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if self.shminfo.shmid < 0:
+            raise OSError(ctypes.get_errno(), "shmget failed")
+        address = self.libc.shmat(self.shminfo.shmid, None, 0)
+        if address == ctypes.c_void_p(-1).value:
+            raise OSError(ctypes.get_errno(), "shmat failed")
+        self.shminfo.shmaddr = address
+        self.shminfo.readOnly = 0
+        image.contents.data = address
+        self.xext.XShmAttach(self.display, ctypes.byref(self.shminfo))
+        self.x11.XSync(self.display, 0)
+        # Marked for removal right away, the segment is freed once both sides detached
+        self.libc.shmctl(self.shminfo.shmid, IPC_RMID, None)
+
+        self.image = image
+        buffer = (ctypes.c_uint8 * size).from_address(address)
+        stride = image.contents.bytes_per_line // 4
+        self.frame = np.frombuffer(buffer, dtype=np.uint8).reshape(self.height, stride, 4)[:, :self.width]
+
+    def find_window_by_pid(self, pid: int):
+        # Walks the window tree for a window whose _NET_WM_PID matches the process
+        atom = self.x11.XInternAtom(self.display, b"_NET_WM_PID", 1)
+        if not atom:
+            return None
+
+        pending = [self.x11.XDefaultRootWindow(self.display)]
+        while pending:
+            window = pending.pop()
+            if self.window_pid(window, atom) == pid:
+                return window
+
+            root, parent = ctypes.c_ulong(), ctypes.c_ulong()
+            children = ctypes.POINTER(ctypes.c_ulong)()
+            count = ctypes.c_uint()
+            if self.x11.XQueryTree(self.display, window, ctypes.byref(root), ctypes.byref(parent), ctypes.byref(children), ctypes.byref(count)):
+                pending.extend(children[i] for i in range(count.value))
+                if children:
+                    self.x11.XFree(children)
+        return None
+
+    def window_pid(self, window: int, atom: int):
+        actual_type = ctypes.c_ulong()
+        actual_format = ctypes.c_int()
+        items = ctypes.c_ulong()
+        remaining = ctypes.c_ulong()
+        data = ctypes.c_void_p()
+        status = self.x11.XGetWindowProperty(self.display, window, atom, 0, 1, 0, XA_CARDINAL, ctypes.byref(actual_type),
+                                             ctypes.byref(actual_format), ctypes.byref(items), ctypes.byref(remaining), ctypes.byref(data))
+        if status != 0 or not data.value:
+            return None
+        pid = ctypes.cast(data, ctypes.POINTER(ctypes.c_ulong))[0] if items.value else None
+        self.x11.XFree(data)
+        return pid
+
+    def grab(self, out: np.ndarray):
+        if self.image is not None:
+            if not self.xext.XShmGetImage(self.display, self.window, self.image, 0, 0, ALL_PLANES):
+                raise RuntimeError("Unable to acquire screenshot! XShmGetImage failed.")
+            cv2.cvtColor(self.frame, cv2.COLOR_BGRA2BGR, dst=out)
+            return out
+
+        image = self.x11.XGetImage(self.display, self.window, 0, 0, self.width, self.height, ALL_PLANES, Z_PIXMAP)
+        if not image:
+            raise RuntimeError("Unable to acquire screenshot! XGetImage failed.")
+        try:
+            contents = image.contents
+            buffer = (ctypes.c_uint8 * (contents.bytes_per_line * contents.height)).from_address(contents.data)
+            frame = np.frombuffer(buffer, dtype=np.uint8).reshape(contents.height, contents.bytes_per_line // 4, 4)[:, :self.width]
+            cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR, dst=out)
+        finally:
+            DESTROY_IMAGE(image.contents.destroy_image)(image)
+        return out
+
+    def close(self):
+        if self.image is not None:
+            self.xext.XShmDetach(self.display, ctypes.byref(self.shminfo))
+            self.x11.XSync(self.display, 0)
+            self.frame = None
+            self.libc.shmdt(ctypes.c_void_p(self.shminfo.shmaddr))
+            # The data belongs to the shared memory segment and must not be freed by Xlib
+            self.image.contents.data = None
+            DESTROY_IMAGE(self.image.contents.destroy_image)(self.image)
+            self.image = None
+        if self.display:
+            self.x11.XCloseDisplay(self.display)
+            self.display = None
+
+class SyntheticFrameSource(FrameSource):
+    # Renders moving boxes on a fixed timeline, for testing the capture pipeline without a window
+    def __init__(self, pid: int, width: int = 640, height: int = 360, num_boxes: int = 16, seed: int = 0):
+        super().__init__(pid)
+        self.width = width
+        self.height = height
+        rng = np.random.default_rng(seed)
+        self.positions = rng.uniform(0, 1, (num_boxes, 2))
+        self.velocities = rng.uniform(-0.25, 0.25, (num_boxes, 2))
+        self.colors = rng.integers(64, 256, (num_boxes, 3))
+        self.start = None
+
+    def open(self):
+        self.start = time.perf_counter()
+        return self.width, self.height
+
+    def grab(self, out: np.ndarray):
+        out.fill(32)
+        elapsed = time.perf_counter() - self.start
+        # Boxes bounce between the borders, the position only depends on the elapsed time
+        positions = np.abs((self.positions + self.velocities * elapsed + 1) % 2 - 1)
+        size = max(self.height // 16, 2)
+        for (x, y), color in zip(positions, self.colors):
+            left = int(x * (self.width - size))
+            top = int(y * (self.height - size))
+            out[top:top + size, left:left + size] = color
+        return out
+
+FRAME_SOURCES = {
+    "win32": Win32FrameSource,
+    "x11": X11FrameSource,
+    "synthetic": SyntheticFrameSource,
+}
+
+def create_frame_source(name: str, pid: int):
+    if name == "auto":
+        name = "win32" if sys.platform == "win32" else "x11"
+    if name not in FRAME_SOURCES:
+        raise ValueError(f"Unknown frame source '{name}', expected one of {list(FRAME_SOURCES)}")
+    return FRAME_SOURCES[name](pid)
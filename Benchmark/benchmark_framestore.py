@@ -0,0 +1,170 @@
+import zlib
+import struct
+import cv2
+import numpy as np
+from benchmark_tracing import traced
+
+# File layout: header, chunks of consecutive grayscale frames, index with the frame timestamps and the
+# chunk offsets and sizes, footer pointing to the index
+FRAME_STORE_EXTENSION = ".frames"
+FRAME_STORE_MAGIC = b'BFRS'
+FRAME_STORE_VERSION = 1
+HEADER = struct.Struct('<4sIIIIIIB')  # magic, version, width, height, source width, source height, chunk frames, compression
+FOOTER = struct.Struct('<QQQ4s')  # index offset, frame count, chunk count, magic
+
+COMPRESSIONS = {"none": 0, "zlib": 1, "lz4": 2}
+
+def compress_chunk(data, compression: int):
+    if compression == COMPRESSIONS["zlib"]:
+        return zlib.compress(data, 1)
+    if compression == COMPRESSIONS["lz4"]:
+        import lz4.frame
+        return lz4.frame.compress(data)
+    return data
+
+def decompress_chunk(data, compression: int):
+    if compression == COMPRESSIONS["zlib"]:
+        return zlib.decompress(data)
+    if compression == COMPRESSIONS["lz4"]:
+        import lz4.frame
+        return lz4.frame.decompress(data)
+    return data
+
+class FrameStoreWriter:
+    # Downscales BGR frames to grayscale and writes them losslessly in chunks of chunk_frames frames
+    def __init__(self, path: str, width: int, height: int, scale: float = 0.5, chunk_frames: int = 64, compression: str = "none"):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown frame store compression '{compression}', expected one of {list(COMPRESSIONS)}")
+        self.path = path
+        self.source_width = width
+        self.source_height = height
+        self.width = max(int(round(width * scale)), 1)
+        self.height = max(int(round(height * scale)), 1)
+        self.chunk_frames = chunk_frames
+        self.compression = COMPRESSIONS[compression]
+
+        self.chunk = np.zeros((chunk_frames, self.height, self.width), dtype=np.uint8)
+        self.gray = np.zeros((height, width), dtype=np.uint8)
+        self.chunk_count = 0
+        self.timestamps = []
+        self.chunk_offsets = []
+        self.chunk_sizes = []
+
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(FRAME_STORE_MAGIC, FRAME_STORE_VERSION, self.width, self.height, width, height, chunk_frames, self.compression))
+
+    def write(self, frame: np.ndarray, timestamp: int):
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        slot = self.chunk[self.chunk_count]
+        if self.gray.shape == slot.shape:
+            np.copyto(slot, self.gray)
+        else:
+            cv2.resize(self.gray, (self.width, self.height), dst=slot, interpolation=cv2.INTER_AREA)
+        self.timestamps.append(timestamp)
+        self.chunk_count += 1
+        if self.chunk_count == self.chunk_frames:
+            self.flush()
+
+    @traced("framestore.flush")
+    def flush(self):
+        if self.chunk_count == 0:
+            return
+        data = compress_chunk(memoryview(self.chunk[:self.chunk_count]).cast('B'), self.compression)
+        self.chunk_offsets.append(self.file.tell())
+        self.chunk_sizes.append(len(data))
+        self.file.write(data)
+        self.chunk_count = 0
+
+    def close(self):
+        if self.file is None:
+            return
+        self.flush()
+        index_offset = self.file.tell()
+        self.file.write(np.asarray(self.timestamps, dtype=np.int64).tobytes())
+        self.file.write(np.asarray(self.chunk_offsets, dtype=np.uint64).tobytes())
+        self.file.write(np.asarray(self.chunk_sizes, dtype=np.uint64).tobytes())
+        self.file.write(FOOTER.pack(index_offset, len(self.timestamps), len(self.chunk_offsets), FRAME_STORE_MAGIC))
+        self.file.close()
+        self.file = None
+
+def shift_timestamps(path: str, offset_ns: int):
+    # Moves the timestamps of a closed frame store into another clock, e.g. of a recording made on another node
+    data = np.memmap(path, dtype=np.uint8, mode='r+')
+    try:
+        index_offset, frame_count, _, magic = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+        if magic != FRAME_STORE_MAGIC:
+            raise ValueError(f"{path} is incomplete, the capture was not closed.")
+        timestamps = data[index_offset:index_offset + frame_count * 8].view(np.int64)
+        timestamps += offset_ns
+        data.flush()
+    finally:
+        del data
+
+class FrameStore:
+    # Memory mapped reader with random access by frame index or timestamp. Uncompressed frames are views
+    # into the mapping, compressed chunks are decompressed once and kept until another chunk is needed.
+    def __init__(self, path: str):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+
+        magic, version, self.width, self.height, self.source_width, self.source_height, self.chunk_frames, self.compression = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != FRAME_STORE_MAGIC or version != FRAME_STORE_VERSION:
+            raise ValueError(f"{path} is not a frame store of version {FRAME_STORE_VERSION}.")
+
+        index_offset, self.frame_count, chunk_count, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+        if magic != FRAME_STORE_MAGIC:
+            raise ValueError(f"{path} is incomplete, the capture was not closed.")
+
+        self.timestamps = np.frombuffer(self.data, dtype=np.int64, count=self.frame_count, offset=index_offset)
+        offset = index_offset + self.frame_count * 8
+        self.chunk_offsets = np.frombuffer(self.data, dtype=np.uint64, count=chunk_count, offset=offset)
+        self.chunk_sizes = np.frombuffer(self.data, dtype=np.uint64, count=chunk_count, offset=offset + chunk_count * 8)
+
+        self.cached_chunk = -1
+        self.cached_frames = None
+
+    def __len__(self):
+        return self.frame_count
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    def chunk(self, chunk_index: int):
+        # All frames of one chunk as an array of shape (frames, height, width)
+        if chunk_index == self.cached_chunk:
+            return self.cached_frames
+
+        frames = min(self.chunk_frames, self.frame_count - chunk_index * self.chunk_frames)
+        offset = int(self.chunk_offsets[chunk_index])
+        size = int(self.chunk_sizes[chunk_index])
+        data = self.data[offset:offset + size]
+        if self.compression != COMPRESSIONS["none"]:
+            data = np.frombuffer(decompress_chunk(data, self.compression), dtype=np.uint8)
+        self.cached_chunk = chunk_index
+        self.cached_frames = data.reshape(frames, self.height, self.width)
+        return self.cached_frames
+
+    def frame(self, index: int):
+        if not 0 <= index < self.frame_count:
+            raise IndexError(f"Frame {index} out of range for {self.frame_count} frames.")
+        return self.chunk(index // self.chunk_frames)[index % self.chunk_frames]
+
+    def index_at(self, timestamp: int):
+        # Index of the last frame captured at or before the timestamp
+        return max(int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1, 0)
+
+    def frame_at(self, timestamp: int):
+        return self.frame(self.index_at(timestamp))
+
+    def chunks(self):
+        for chunk_index in range(len(self.chunk_offsets)):
+            yield self.chunk(chunk_index)
+
+    def close(self):
+        self.cached_frames = None
+        self.timestamps = None
+        self.chunk_offsets = None
+        self.chunk_sizes = None
+        self.data = None
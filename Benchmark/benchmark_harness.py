@@ -1,17 +1,15 @@
+import sys
 import subprocess
+import shlex
 import socket
 import struct
 import time
-import cv2
-import numpy as np
+import itertools
 import threading
-import win32gui
-import win32ui
-import win32process
-from ctypes import windll
-from PIL import Image
 from abc import ABC, abstractmethod
 from enum import Enum
+from benchmark_resources import ResourceSampler, DistributedResourceSampler
+from benchmark_tracing import span, traced
 
 class BenchmarkCommands(Enum):
     StartServer = b'\x01'
@@ -21,6 +19,160 @@ class BenchmarkCommands(Enum):
     DirectionalInput = b'\x05'
     SetObjectNumber = b'\x06'
 
+class BenchmarkAcks(Enum):
+    ControllerReady = b'\x80'
+    ServerStarted = b'\x81'
+    ClientConnected = b'\x82'
+    ObjectsSpawned = b'\x83'
+    ControllerMode = b'\x84'
+    CommandApplied = b'\x85'
+
+# Unity player arguments of headless builds and the flags of the ControllerMode acknowledgement
+HEADLESS_STARTUP = "-batchmode -nographics"
+CONTROLLER_BATCH_MODE = 1
+CONTROLLER_NO_GRAPHICS = 2
+
+# Input targets besides the client indices
+SERVER = -1
+ALL_CLIENTS = -2
+
+def process_command(process_path: str, port: int, startup: str):
+    # Builds get the control port followed by the startup arguments, Python scripts (e.g. benchmark_emulator.py)
+    # are run by the interpreter of the harness. Every process is asked for the framed protocol.
+    command = [sys.executable, process_path] if process_path.endswith(".py") else [process_path]
+    return command + [str(port), "-protocol", str(PROTOCOL_VERSION)] + shlex.split(startup, posix=False)
+
+def headless_startup(startup: str, headless: bool):
+    return f"{startup} {HEADLESS_STARTUP}".strip() if headless else startup
+
+def check_headless(modes: dict):
+    # modes maps the pid of every process to its ControllerMode flags, None for builds that do not report them.
+    # Returns False if any process runs with graphics and None if it can not be verified.
+    if any(mode is None for mode in modes.values()):
+        print("Controller does not report its mode, unable to verify that the builds run headless.")
+        return None
+    for pid, mode in modes.items():
+        if not (mode & CONTROLLER_BATCH_MODE and mode & CONTROLLER_NO_GRAPHICS):
+            print(f"Process {pid} did not start headless (batch mode {bool(mode & CONTROLLER_BATCH_MODE)}, "
+                  f"no graphics {bool(mode & CONTROLLER_NO_GRAPHICS)}).")
+            return False
+    print(f"Verified that {len(modes)} processes run headless.")
+    return True
+
+def verify_headless(connections: list, timeout: float = 5.0):
+    modes = {}
+    for connection in connections:
+        modes[connection.process.pid] = connection.controller_mode(timeout)
+        if modes[connection.process.pid] is None:
+            break  # The same build is launched for every role
+    return check_headless(modes)
+
+# Acknowledgements are the ack byte followed by an int32 value
+ACK_LENGTH = 5
+
+def parse_acks(buffer: bytes):
+    # Returns the complete acknowledgements in the buffer and the remaining bytes
+    acks = []
+    index = 0
+    while len(buffer) - index >= ACK_LENGTH:
+        try:
+            ack = BenchmarkAcks(buffer[index:index + 1])
+        except ValueError:
+            print(f"Received unknown acknowledgement {buffer[index]}.")
+            index += 1
+            continue
+        acks.append((ack, struct.unpack_from('i', buffer, index + 1)[0]))
+        index += ACK_LENGTH
+    return acks, buffer[index:]
+
+# Framed protocol of controllers started with "-protocol 2". Frames start with a magic byte that is no
+# acknowledgement, so the first byte a controller sends tells which protocol it speaks; older builds send plain
+# acknowledgements and get plain commands. A frame holds any number of messages with explicit payload lengths,
+# the controller applies all of them in the same tick.
+LEGACY_PROTOCOL = 1
+PROTOCOL_VERSION = 2
+FRAME_MAGIC = 0xBF
+FRAME_HEADER = struct.Struct('<BBBxII')  # magic, version, flags, body length, sequence
+FRAME_MESSAGE = struct.Struct('<BH')  # opcode, payload length
+FRAME_ACKNOWLEDGE = 0x01  # The controller answers the frame with CommandApplied
+COMMAND_APPLIED = struct.Struct('<II')  # sequence of the frame, tick (frame count) it was applied at
+MAX_FRAME_LENGTH = 1 << 20
+
+def encode_frame(messages: list, sequence: int, flags: int = 0):
+    # messages are (opcode, payload) with BenchmarkCommands or BenchmarkAcks opcodes
+    body = b''.join(FRAME_MESSAGE.pack(opcode.value[0], len(payload)) + payload for opcode, payload in messages)
+    return FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, flags, len(body), sequence) + body
+
+def parse_frames(buffer: bytes):
+    # Returns (flags, sequence, [(opcode, payload)]) of the complete frames in the buffer and the remaining bytes
+    frames = []
+    index = 0
+    while len(buffer) - index >= FRAME_HEADER.size:
+        magic, version, flags, length, sequence = FRAME_HEADER.unpack_from(buffer, index)
+        if magic != FRAME_MAGIC or length > MAX_FRAME_LENGTH:
+            print(f"Received malformed frame header, skipping byte {buffer[index]}.")
+            index += 1
+            continue
+        end = index + FRAME_HEADER.size + length
+        if end > len(buffer):
+            break  # Incomplete frame
+        if version != PROTOCOL_VERSION:
+            print(f"Received frame of unsupported protocol version {version}.")
+            index = end
+            continue
+
+        messages = []
+        position = index + FRAME_HEADER.size
+        while position + FRAME_MESSAGE.size <= end:
+            opcode, size = FRAME_MESSAGE.unpack_from(buffer, position)
+            position += FRAME_MESSAGE.size
+            messages.append((opcode, bytes(buffer[position:min(position + size, end)])))
+            position += size
+        frames.append((flags, sequence, messages))
+        index = end
+    return frames, buffer[index:]
+
+class ControllerStream:
+    # Acknowledgements received from one controller in either protocol. CommandApplied values are
+    # (sequence, tick), all other values are the int32 of the acknowledgement.
+    def __init__(self):
+        self.version = None  # Detected from the first received byte
+        self.buffer = b''
+
+    def feed(self, data: bytes):
+        buffer = self.buffer + data
+        if self.version is None and buffer:
+            self.version = PROTOCOL_VERSION if buffer[0] == FRAME_MAGIC else LEGACY_PROTOCOL
+        if self.version == LEGACY_PROTOCOL:
+            acks, self.buffer = parse_acks(buffer)
+            return acks
+
+        frames, self.buffer = parse_frames(buffer)
+        acks = []
+        for _, _, messages in frames:
+            for opcode, payload in messages:
+                try:
+                    ack = BenchmarkAcks(bytes([opcode]))
+                except ValueError:
+                    print(f"Received unknown acknowledgement {opcode}.")
+                    continue
+                if ack == BenchmarkAcks.CommandApplied:
+                    if len(payload) >= COMMAND_APPLIED.size:
+                        acks.append((ack, COMMAND_APPLIED.unpack_from(payload)))
+                else:
+                    acks.append((ack, struct.unpack_from('<i', payload)[0] if len(payload) >= 4 else 0))
+        return acks
+
+def encode_commands(commands: list, version: int, sequence: int, acknowledge: bool = False):
+    # One frame with all commands, or the concatenated plain commands for builds without the framed protocol
+    if version == LEGACY_PROTOCOL:
+        return b''.join(command.value + payload for command, payload in commands)
+    return encode_frame(commands, sequence, FRAME_ACKNOWLEDGE if acknowledge else 0)
+
+def input_payload(right: float, up: float, index: int = None):
+    # DirectionalInput of the network builds, the local build prefixes the index of the player
+    return struct.pack('ff', right, up) if index is None else struct.pack('iff', index, right, up)
+
 class BenchmarkHarnessBase(ABC):
     def __init__(self, process_path,  startup='', host='127.0.0.1'):
         self.process_path = process_path
@@ -43,95 +195,210 @@ class BenchmarkHarnessBase(ABC):
     def directional_input_client(self, client_idx: int, right: float, up: float):
         pass
 
+    def directional_input_clients(self, right: float, up: float):
+        for client_idx in range(self.num_clients):
+            self.directional_input_client(client_idx, right, up)
+
+    def directional_inputs(self, inputs: list):
+        # Inputs of one tick as (target, right, up) with a client index, SERVER or ALL_CLIENTS as target.
+        # Harnesses with framed connections send them as one frame per process.
+        for target, right, up in inputs:
+            if target == SERVER:
+                self.directional_input_server(right, up)
+            elif target == ALL_CLIENTS:
+                self.directional_input_clients(right, up)
+            else:
+                self.directional_input_client(target, right, up)
+
+    def applied_inputs(self):
+        # (sequence, tick, dispatch latency ns) of the acknowledged input frames since the last call
+        return []
+
+    def resource_sampler(self, rate_hz: float):
+        return ResourceSampler(self.process_ids(), rate_hz)
+
 class BenchmarkHarnessNetwork(BenchmarkHarnessBase):
-    def __init__(self, process_path,  num_clients, startup='', host='127.0.0.1'):
-        super().__init__(process_path, startup, host)
-        self.server = BenchmarkConnection(self.process_path, self.startup, self.host)
-        self.clients = [BenchmarkConnection(self.process_path, self.startup, self.host) for _ in range(num_clients)]
+    def __init__(self, process_path,  num_clients, startup='', host='127.0.0.1', client_startup=None, frame_source='auto',
+                 agents=None, placement=None, server_address=None, headless=False, acknowledge_inputs=False):
+        # Headless builds run in batch mode without graphics and can not be captured
+        super().__init__(process_path, headless_startup(startup, headless), host)
+        self.num_clients = num_clients
+        self.headless = headless
+        # Input frames are acknowledged with the tick they were applied at, see applied_inputs
+        self.acknowledge_inputs = acknowledge_inputs
+        # Clients can be launched with their own arguments, e.g. "-port <relay port>" to connect through a relay
+        self.client_startup = self.startup if client_startup is None else headless_startup(client_startup, headless)
+        # Roles ("server", "client_<index>") can be placed on named remote agents, the others are launched locally.
+        # Clients connect to the server through "-address", by default the host of the agent running the server.
+        self.agents = agents or {}
+        self.placement = placement or {}
+        if server_address is None and self.placement.get("server"):
+            server_address = self.agent("server").host
+        if server_address:
+            self.client_startup = f"{self.client_startup} -address {server_address}".strip()
+        self.server = self.connect("server", self.startup, frame_source)
+        self.clients = [self.connect(f"client_{index}", self.client_startup, frame_source) for index in range(num_clients)]
+        if headless:
+            verify_headless([self.server] + self.clients)
+
+    def agent(self, role: str):
+        name = self.placement.get(role)
+        if name is None:
+            return None
+        if name not in self.agents:
+            raise ValueError(f"No agent named {name} for {role}, available agents are {list(self.agents)}")
+        return self.agents[name]
+
+    def connect(self, role: str, startup: str, frame_source: str):
+        agent = self.agent(role)
+        if agent is None:
+            return BenchmarkConnection(self.process_path, startup, self.host, frame_source=frame_source, headless=self.headless)
+        return agent.launch(role, self.process_path, startup, frame_source=frame_source, headless=self.headless)
 
     def __del__(self):
         for client in self.clients:
             del client
         del self.server
 
+    @traced("harness.start")
     def start(self, num_objects):
         self.server.start_server(num_objects)
-        time.sleep(1)
+        self.server.wait_until_ready(BenchmarkAcks.ServerStarted, BenchmarkAcks.ObjectsSpawned)
         for client in self.clients:
             client.start_client()
-            time.sleep(1)
+            client.wait_until_ready(BenchmarkAcks.ClientConnected)
 
+    @traced("harness.stop")
     def stop(self):
         for client in self.clients:
             client.stop_client()
         self.server.stop_server()
 
+    def process_ids(self):
+        # Local processes only, processes on agents are sampled by their agent
+        processes = {"server": self.server.process.pid} if self.server.agent is None else {}
+        for index, client in enumerate(self.clients):
+            if client.agent is None:
+                processes[f"client_{index}"] = client.process.pid
+        return processes
+
+    def resource_sampler(self, rate_hz: float):
+        agents = {connection.agent.name: connection.agent for connection in [self.server] + self.clients if connection.agent}
+        if not agents:
+            return ResourceSampler(self.process_ids(), rate_hz)
+        return DistributedResourceSampler(self.process_ids(), list(agents.values()), rate_hz)
+
     def directional_input_server(self, right: float, up: float):
-        self.server.send_data(BenchmarkCommands.DirectionalInput.value + struct.pack('f', right) + struct.pack('f', up))
+        self.directional_inputs([(SERVER, right, up)])
 
     def directional_input_client(self, client_idx: int, right: float, up: float):
-        self.clients[client_idx].send_data(BenchmarkCommands.DirectionalInput.value + struct.pack('f', right) + struct.pack('f', up))
+        self.directional_inputs([(client_idx, right, up)])
+
+    def directional_input_clients(self, right: float, up: float):
+        self.directional_inputs([(ALL_CLIENTS, right, up)])
+
+    def directional_inputs(self, inputs: list):
+        # Every process gets one frame with its inputs, the frames of all processes are sent back to back
+        frames = {}
+        for target, right, up in inputs:
+            connections = [self.server] if target == SERVER else self.clients if target == ALL_CLIENTS else [self.clients[target]]
+            for connection in connections:
+                frames.setdefault(connection, []).append((BenchmarkCommands.DirectionalInput, input_payload(right, up)))
+        for connection, commands in frames.items():
+            connection.send_commands(commands, self.acknowledge_inputs)
+
+    def applied_inputs(self):
+        return [applied for connection in [self.server] + self.clients for applied in connection.applied_commands()]
 
 class BenchmarkHarnessLocal(BenchmarkHarnessBase):
-    def __init__(self, process_path,  num_clients, startup='', host='127.0.0.1'):
+    def __init__(self, process_path,  num_clients, startup='', host='127.0.0.1', frame_source='auto', acknowledge_inputs=False):
         super().__init__(process_path, startup, host)
-        self.process = BenchmarkConnection(self.process_path, self.startup, self.host)
+        self.process = BenchmarkConnection(self.process_path, self.startup, self.host, frame_source=frame_source)
         self.num_clients = num_clients
+        self.acknowledge_inputs = acknowledge_inputs
 
     def __del__(self):
         del self.process
 
+    @traced("harness.start")
     def start(self, num_objects):
         self.process.start_server(num_objects)
         for _ in range(self.num_clients):
             self.process.start_client()
-        time.sleep(1)
+        self.process.wait_until_ready(BenchmarkAcks.ServerStarted, BenchmarkAcks.ObjectsSpawned, *[BenchmarkAcks.ClientConnected] * self.num_clients)
 
+    @traced("harness.stop")
     def stop(self):
         for _ in range(self.num_clients):
             self.process.stop_client()
         self.process.stop_server()
 
+    def process_ids(self):
+        return {"local": self.process.process.pid}
+
     def directional_input_server(self, right: float, up: float):
-        self.process.send_data(BenchmarkCommands.DirectionalInput.value + struct.pack('i', -1) + struct.pack('f', right) + struct.pack('f', up))
+        self.directional_inputs([(SERVER, right, up)])
 
     def directional_input_client(self, client_idx: int, right: float, up: float):
-        self.process.send_data(BenchmarkCommands.DirectionalInput.value + struct.pack('i', client_idx) + struct.pack('f', right) + struct.pack('f', up))
+        self.directional_inputs([(client_idx, right, up)])
+
+    def directional_input_clients(self, right: float, up: float):
+        self.directional_inputs([(ALL_CLIENTS, right, up)])
+
+    def directional_inputs(self, inputs: list):
+        # The inputs of the server and all clients are applied in the same tick
+        commands = []
+        for target, right, up in inputs:
+            for index in range(self.num_clients) if target == ALL_CLIENTS else [target]:
+                commands.append((BenchmarkCommands.DirectionalInput, input_payload(right, up, index)))
+        self.process.send_commands(commands, self.acknowledge_inputs)
+
+    def applied_inputs(self):
+        return self.process.applied_commands()
 
 class BenchmarkConnection:
-    def __init__(self, process_path, startup='', host='127.0.0.1', fps=30):
+    def __init__(self, process_path, startup='', host='127.0.0.1', fps=30, ack_timeout=30.0, frame_source='auto', headless=False):
+        self.agent = None  # Agent that launched the process, None for local processes
+        self.headless = headless
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.bind((host, 0))
         self.socket.listen(1)
         self.port = self.socket.getsockname()[1]
 
-        self.process = subprocess.Popen([process_path, str(self.port), startup])
-        self.connection, addr = self.socket.accept()
+        with span("connection.spawn"):
+            self.process = subprocess.Popen(process_command(process_path, self.port, startup))
+        with span("connection.accept"):
+            self.connection, addr = self.socket.accept()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         print(f"Benchmark connection established on {addr}")
 
-        # Setup for window capturing
-        self.capture_active = False
-        self.capture_video_writer = None
-        self.capture_thread = None
-        self.fps = fps
-        self.hwnd = self.find_window_by_pid(self.process.pid)
-        if self.hwnd is None:
-            print(f"Window for process with PID {self.process.pid} not found.")
-        else:
-            rect = win32gui.GetWindowRect(self.hwnd)
-            left, top, right, bottom = rect
-            self.width = right - left
-            self.height = bottom - top
-
-            windll.user32.SetProcessDPIAware()
-            self.hwnd_dc = win32gui.GetWindowDC(self.hwnd)
-            self.mfc_dc = win32ui.CreateDCFromHandle(self.hwnd_dc)
-            self.save_dc = self.mfc_dc.CreateCompatibleDC()
+        self.init_acks(ack_timeout)
+        self.receive_thread = threading.Thread(target=self.receive_acks, daemon=True)
+        self.receive_thread.start()
 
-            self.bitmap = win32ui.CreateBitmap()
-            self.bitmap.CreateCompatibleBitmap(self.mfc_dc, self.width, self.height)
+        # Window capturing, the frame source is only opened by the first start_capture
+        self.capture_pipeline = None
+        self.capture_statistics = None
+        self.fps = fps
+        self.frame_source_name = frame_source
+        self.frame_source = None
+
+    def init_acks(self, ack_timeout: float):
+        # Acknowledgements sent back by the controller, builds without them fall back to fixed sleeps
+        self.ack_timeout = ack_timeout
+        self.ack_counts = {ack: 0 for ack in BenchmarkAcks}
+        self.ack_values = {}
+        self.ack_condition = threading.Condition()
+        self.stream = ControllerStream()
+        self.supports_acks = None
+        self.sequence = itertools.count(1)
+        self.pending_frames = {}  # sequence -> perf_counter_ns when a frame that asked for CommandApplied was sent
+        self.applied = []
 
     def __del__(self):
+        if self.frame_source:
+            self.frame_source.close()
+            self.frame_source = None
         if self.process and self.process.poll() is None:
             self.process.terminate()
             self.process.wait()
@@ -143,14 +410,85 @@ class BenchmarkConnection:
             self.socket = None
 
     def start_server(self, num_objects: int):
-        self.send_data(BenchmarkCommands.SetObjectNumber.value + struct.pack('I', num_objects))
-        self.send_data(BenchmarkCommands.StartServer.value)
+        self.send_commands([(BenchmarkCommands.SetObjectNumber, struct.pack('I', num_objects)), (BenchmarkCommands.StartServer, b'')])
     def stop_server(self):
-        self.send_data(BenchmarkCommands.StopServer.value)
+        self.send_commands([(BenchmarkCommands.StopServer, b'')])
     def start_client(self):
-        self.send_data(BenchmarkCommands.StartClient.value)
+        self.send_commands([(BenchmarkCommands.StartClient, b'')])
     def stop_client(self):
-        self.send_data(BenchmarkCommands.StopClient.value)
+        self.send_commands([(BenchmarkCommands.StopClient, b'')])
+
+    def receive_acks(self):
+        while self.connection:
+            try:
+                data = self.connection.recv(1024)
+            except OSError:
+                break
+            if not data:
+                break
+            self.receive(data)
+
+    def receive(self, data: bytes):
+        received = time.perf_counter_ns()
+        with self.ack_condition:
+            for ack, value in self.stream.feed(data):
+                if ack == BenchmarkAcks.CommandApplied:
+                    sequence, tick = value
+                    sent = self.pending_frames.pop(sequence, None)
+                    if sent is not None:
+                        self.applied.append((sequence, tick, received - sent))
+                    continue
+                self.ack_counts[ack] += 1
+                self.ack_values[ack] = value
+            self.ack_condition.notify_all()
+
+    def protocol_version(self, timeout: float = 2.0):
+        # Protocol of the controller, known once it sent its first bytes right after connecting
+        with self.ack_condition:
+            if self.stream.version is None and not self.ack_condition.wait_for(lambda: self.stream.version is not None, timeout):
+                print("Controller did not announce its protocol, sending plain commands.")
+                self.stream.version = LEGACY_PROTOCOL
+            return self.stream.version
+
+    def send_commands(self, commands: list, acknowledge: bool = False):
+        # Sends (command, payload) pairs as one frame that the controller applies in a single tick. With acknowledge
+        # the controller reports the tick, see applied_commands. Returns the sequence number of the frame.
+        version = self.protocol_version()
+        sequence = next(self.sequence)
+        if acknowledge and version != LEGACY_PROTOCOL:
+            with self.ack_condition:
+                self.pending_frames[sequence] = time.perf_counter_ns()
+        self.send_data(encode_commands(commands, version, sequence, acknowledge))
+        return sequence
+
+    def applied_commands(self):
+        # (sequence, tick, latency ns from sending to receiving CommandApplied) since the last call
+        with self.ack_condition:
+            applied, self.applied = self.applied, []
+        return applied
+
+    def wait_for_ack(self, ack: BenchmarkAcks, timeout: float):
+        # Consumes one received acknowledgement, so acks that arrived before the call are not lost
+        with self.ack_condition:
+            if not self.ack_condition.wait_for(lambda: self.ack_counts[ack] > 0, timeout):
+                return False
+            self.ack_counts[ack] -= 1
+            return True
+
+    @traced("connection.wait_ready")
+    def wait_until_ready(self, *acks: BenchmarkAcks):
+        if self.supports_acks is None:
+            # The controller announces itself right after connecting
+            self.supports_acks = self.wait_for_ack(BenchmarkAcks.ControllerReady, 2.0)
+            if not self.supports_acks:
+                print("Controller does not send acknowledgements, falling back to fixed delays.")
+        if not self.supports_acks:
+            time.sleep(1)
+            return
+
+        for ack in acks:
+            if not self.wait_for_ack(ack, self.ack_timeout):
+                print(f"Timed out after {self.ack_timeout}s waiting for {ack.name}.")
 
     def send_data(self, data: bytes):
         if self.connection:
@@ -161,66 +499,28 @@ class BenchmarkConnection:
         else:
             print("No client connection available to send data.")
 
-    def start_capture(self, output_video_path: str):
-        def capture():
-            self.capture_active = True
-            capture_video_writer = cv2.VideoWriter(output_video_path, cv2.VideoWriter_fourcc(*'XVID'), self.fps, (self.width, self.height))
-
-            print("Capture started.")
-            frame_interval = 1.0 / self.fps
-            next_frame_time = time.time()  # Fixed time reference
-
-            while self.capture_active:
-                frame = self.capture_window()
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                capture_video_writer.write(frame)
-
-                # Wait until the next frame time
-                next_frame_time += frame_interval
-                sleep_time = max(0, next_frame_time - time.time())
-                time.sleep(sleep_time)
-
-            print("Capture stopped.")
-            capture_video_writer.release()
-
-        # Create and start the capture thread
-        self.capture_thread = threading.Thread(target=capture)
-        self.capture_thread.start()
+    def controller_mode(self, timeout: float):
+        # ControllerMode flags reported after connecting, None for builds that do not report them
+        if not self.wait_for_ack(BenchmarkAcks.ControllerMode, timeout):
+            return None
+        return self.ack_values[BenchmarkAcks.ControllerMode]
+
+    def start_capture(self, output_video_path: str, **writer_options):
+        if self.headless:
+            print("Headless processes have no window to capture.")
+            return
+        # Only imported when capturing, the traffic benchmark never loads the capture dependencies
+        from benchmark_recording import CapturePipeline
+        from benchmark_framesource import create_frame_source
+        if self.frame_source is None:
+            frame_source = create_frame_source(self.frame_source_name, self.process.pid)
+            frame_source.open()
+            self.frame_source = frame_source
+        self.capture_pipeline = CapturePipeline(self.frame_source.grab, self.frame_source.width, self.frame_source.height, output_video_path, self.fps, writer_options=writer_options)
+        self.capture_pipeline.start()
 
     def stop_capture(self):
-        if self.capture_thread:
-            self.capture_active = False
-            self.capture_thread.join()
-
-    def find_window_by_pid(self, pid):
-        # Adapted from https://stackoverflow.com/questions/70618975/python-get-windowtitle-from-process-id-or-process-name
-        def enum_window_callback(hwnd, lParam):
-            _, found_pid = win32process.GetWindowThreadProcessId(hwnd)
-            if found_pid == pid:
-                lParam.append(hwnd)
-            return True
-        
-        hwnd_list = []
-        win32gui.EnumWindows(enum_window_callback, hwnd_list)
-        return hwnd_list[0] if hwnd_list else None
-
-    def capture_window(self):
-        # Adapted from https://github.com/BoboTiG/python-mss/issues/180
-        self.save_dc.SelectObject(self.bitmap)
-
-        result = windll.user32.PrintWindow(self.hwnd, self.save_dc.GetSafeHdc(), 3)
-
-        bmpinfo = self.bitmap.GetInfo()
-        bmpstr = self.bitmap.GetBitmapBits(True)
-
-        im = Image.frombuffer("RGB", (bmpinfo["bmWidth"], bmpinfo["bmHeight"]), bmpstr, "raw", "BGRX", 0, 1)
-
-        if result != 1:
-            win32gui.DeleteObject(self.bitmap.GetHandle())
-            self.save_dc.DeleteDC()
-            self.mfc_dc.DeleteDC()
-            win32gui.ReleaseDC(self.hwnd, self.hwnd_dc)
-            raise RuntimeError(f"Unable to acquire screenshot! Result: {result}")
-
-        open_cv_image = np.array(im)[:, :, ::-1].copy()
-        return open_cv_image
+        if self.capture_pipeline:
+            self.capture_pipeline.stop()
+            self.capture_statistics = self.capture_pipeline.statistics()
+            self.capture_pipeline = None
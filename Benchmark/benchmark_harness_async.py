@@ -0,0 +1,285 @@
+import time
+import struct
+import asyncio
+import itertools
+import secrets
+import threading
+from benchmark_tracing import traced
+from benchmark_harness import BenchmarkHarnessBase, BenchmarkCommands, BenchmarkAcks, ControllerStream, LEGACY_PROTOCOL, SERVER, ALL_CLIENTS, \
+    encode_commands, input_payload, process_command, headless_startup, check_headless
+
+class AsyncBenchmarkConnection:
+    def __init__(self, token: int, process):
+        self.token = token
+        self.process = process
+        self.reader = None
+        self.writer = None
+        self.ack_counts = {ack: 0 for ack in BenchmarkAcks}
+        self.ack_values = {}
+        self.ack_condition = asyncio.Condition()
+        self.receive_task = None
+        self.stream = None
+        self.sequence = itertools.count(1)
+        self.pending_frames = {}  # sequence -> perf_counter_ns when a frame that asked for CommandApplied was sent
+        self.applied = []
+
+    def attach(self, reader, writer, stream: ControllerStream, acks: list):
+        # The stream already detected the protocol during the handshake
+        self.reader = reader
+        self.writer = writer
+        self.stream = stream
+        self.receive_task = asyncio.ensure_future(self.receive_acks(acks))
+
+    async def receive_acks(self, acks: list):
+        # Acks that arrived together with the handshake are counted right away
+        while True:
+            received = time.perf_counter_ns()
+            async with self.ack_condition:
+                for ack, value in acks:
+                    if ack == BenchmarkAcks.CommandApplied:
+                        sequence, tick = value
+                        sent = self.pending_frames.pop(sequence, None)
+                        if sent is not None:
+                            self.applied.append((sequence, tick, received - sent))
+                        continue
+                    self.ack_counts[ack] += 1
+                    self.ack_values[ack] = value
+                self.ack_condition.notify_all()
+
+            try:
+                data = await self.reader.read(1024)
+            except OSError:
+                break
+            if not data:
+                break
+            acks = self.stream.feed(data)
+
+    async def wait_for_ack(self, ack: BenchmarkAcks, timeout: float):
+        # Consumes one received acknowledgement, same semantics as BenchmarkConnection.wait_for_ack
+        async with self.ack_condition:
+            try:
+                await asyncio.wait_for(self.ack_condition.wait_for(lambda: self.ack_counts[ack] > 0), timeout)
+            except asyncio.TimeoutError:
+                print(f"Timed out after {timeout}s waiting for {ack.name} from {self.token:08x}.")
+                return False
+            self.ack_counts[ack] -= 1
+            return True
+
+    async def controller_mode(self, timeout: float):
+        # ControllerMode flags reported after connecting, None for builds that do not report them
+        async with self.ack_condition:
+            try:
+                await asyncio.wait_for(self.ack_condition.wait_for(lambda: self.ack_counts[BenchmarkAcks.ControllerMode] > 0), timeout)
+            except asyncio.TimeoutError:
+                return None
+            self.ack_counts[BenchmarkAcks.ControllerMode] -= 1
+            return self.ack_values[BenchmarkAcks.ControllerMode]
+
+    async def send_data(self, data: bytes):
+        if self.writer is None:
+            print("No client connection available to send data.")
+            return
+        try:
+            self.writer.write(data)
+            await self.writer.drain()
+        except Exception as e:
+            print(f"Error sending data: {e}")
+
+    async def send_commands(self, commands: list, acknowledge: bool = False):
+        # Same framing as BenchmarkConnection.send_commands
+        sequence = next(self.sequence)
+        if acknowledge and self.stream.version != LEGACY_PROTOCOL:
+            self.pending_frames[sequence] = time.perf_counter_ns()
+        await self.send_data(encode_commands(commands, self.stream.version, sequence, acknowledge))
+        return sequence
+
+    def applied_commands(self):
+        applied, self.applied = self.applied, []
+        return applied
+
+    async def start_server(self, num_objects: int):
+        await self.send_commands([(BenchmarkCommands.SetObjectNumber, struct.pack('I', num_objects)), (BenchmarkCommands.StartServer, b'')])
+    async def stop_server(self):
+        await self.send_commands([(BenchmarkCommands.StopServer, b'')])
+    async def start_client(self):
+        await self.send_commands([(BenchmarkCommands.StartClient, b'')])
+    async def stop_client(self):
+        await self.send_commands([(BenchmarkCommands.StopClient, b'')])
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        if self.receive_task:
+            self.receive_task.cancel()
+            self.receive_task = None
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+            await self.process.wait()
+
+class AsyncBenchmarkHarness:
+    # Launches the server and all clients in parallel and accepts every control connection on a single
+    # listening socket. Each process gets a "-token" argument and echoes it with its ControllerReady ack.
+    def __init__(self, process_path, num_clients, startup='', host='127.0.0.1', client_startup=None, connect_timeout=120.0, ack_timeout=30.0, headless=False,
+                 acknowledge_inputs=False):
+        self.process_path = process_path
+        self.num_clients = num_clients
+        self.headless = headless
+        self.acknowledge_inputs = acknowledge_inputs
+        self.startup = headless_startup(startup, headless)
+        self.client_startup = self.startup if client_startup is None else headless_startup(client_startup, headless)
+        self.host = host
+        self.connect_timeout = connect_timeout
+        self.ack_timeout = ack_timeout
+        self.listener = None
+        self.pending = {}
+        self.connections = {}
+        self.server = None
+        self.clients = []
+
+    async def launch(self):
+        self.listener = await asyncio.start_server(self.on_connection, self.host, 0)
+        port = self.listener.sockets[0].getsockname()[1]
+
+        spawns = [self.spawn(port, self.startup)] + [self.spawn(port, self.client_startup) for _ in range(self.num_clients)]
+        connections = await asyncio.gather(*spawns)
+        self.server, self.clients = connections[0], list(connections[1:])
+
+        try:
+            await asyncio.wait_for(asyncio.gather(*self.pending.values()), self.connect_timeout)
+        except asyncio.TimeoutError:
+            missing = [f"{token:08x}" for token, future in self.pending.items() if not future.done()]
+            raise RuntimeError(f"{len(missing)} of {self.num_clients + 1} processes did not connect: {missing}")
+        finally:
+            self.pending.clear()
+        print(f"Benchmark connections established for server and {self.num_clients} clients on port {port}")
+        if self.headless:
+            await self.verify_headless()
+
+    async def verify_headless(self, timeout: float = 5.0):
+        connections = [self.server] + self.clients
+        modes = await asyncio.gather(*[connection.controller_mode(timeout) for connection in connections])
+        return check_headless({connection.process.pid: mode for connection, mode in zip(connections, modes)})
+
+    async def spawn(self, port: int, startup: str):
+        token = secrets.randbits(31)
+        while token in self.pending:
+            token = secrets.randbits(31)
+        # Registered before spawning, the process may connect before create_subprocess_exec returns
+        self.pending[token] = asyncio.get_running_loop().create_future()
+        connection = AsyncBenchmarkConnection(token, None)
+        self.connections[token] = connection
+        connection.process = await asyncio.create_subprocess_exec(*process_command(self.process_path, port, f"-token {token} {startup}"))
+        return connection
+
+    async def on_connection(self, reader, writer):
+        # The first acknowledgement identifies the process that connected
+        stream = ControllerStream()
+        try:
+            while True:
+                data = await asyncio.wait_for(reader.read(1024), self.connect_timeout)
+                if not data:
+                    writer.close()
+                    return
+                acks = stream.feed(data)
+                if acks:
+                    break
+        except asyncio.TimeoutError:
+            writer.close()
+            return
+
+        ack, token = acks[0]
+        future = self.pending.get(token)
+        if ack != BenchmarkAcks.ControllerReady or future is None or future.done():
+            print(f"Rejected control connection with unknown handshake {ack.name} {token:08x}.")
+            writer.close()
+            return
+
+        # Acks that arrived together with the handshake are handed to the connection
+        connection = self.connections[token]
+        connection.attach(reader, writer, stream, acks[1:])
+        future.set_result(connection)
+
+    async def start(self, num_objects):
+        await self.server.start_server(num_objects)
+        await self.server.wait_for_ack(BenchmarkAcks.ServerStarted, self.ack_timeout)
+        await self.server.wait_for_ack(BenchmarkAcks.ObjectsSpawned, self.ack_timeout)
+        await asyncio.gather(*[client.start_client() for client in self.clients])
+        await asyncio.gather(*[client.wait_for_ack(BenchmarkAcks.ClientConnected, self.ack_timeout) for client in self.clients])
+
+    async def stop(self):
+        await asyncio.gather(*[client.stop_client() for client in self.clients])
+        await self.server.stop_server()
+
+    async def directional_inputs(self, inputs: list):
+        # One frame per process like BenchmarkHarnessNetwork.directional_inputs, written concurrently
+        frames = {}
+        for target, right, up in inputs:
+            connections = [self.server] if target == SERVER else self.clients if target == ALL_CLIENTS else [self.clients[target]]
+            for connection in connections:
+                frames.setdefault(connection, []).append((BenchmarkCommands.DirectionalInput, input_payload(right, up)))
+        await asyncio.gather(*[connection.send_commands(commands, self.acknowledge_inputs) for connection, commands in frames.items()])
+
+    async def applied_inputs(self):
+        return [applied for connection in [self.server] + self.clients for applied in connection.applied_commands()]
+
+    async def close(self):
+        await asyncio.gather(*[connection.close() for connection in [self.server] + self.clients if connection])
+        if self.listener:
+            self.listener.close()
+            await self.listener.wait_closed()
+            self.listener = None
+
+class BenchmarkHarnessNetworkAsync(BenchmarkHarnessBase):
+    # Blocking facade over AsyncBenchmarkHarness, so the existing benchmark() scenarios can drive it.
+    # The event loop runs in a background thread.
+    def __init__(self, process_path, num_clients, startup='', host='127.0.0.1', client_startup=None, headless=False, acknowledge_inputs=False):
+        super().__init__(process_path, startup, host)
+        self.num_clients = num_clients
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.harness = AsyncBenchmarkHarness(process_path, num_clients, startup, host, client_startup, headless=headless, acknowledge_inputs=acknowledge_inputs)
+        self.launch()
+
+    def __del__(self):
+        if self.loop.is_running():
+            self.run(self.harness.close())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    @traced("harness.launch")
+    def launch(self):
+        self.run(self.harness.launch())
+
+    @traced("harness.start")
+    def start(self, num_objects):
+        self.run(self.harness.start(num_objects))
+
+    @traced("harness.stop")
+    def stop(self):
+        self.run(self.harness.stop())
+
+    def process_ids(self):
+        processes = {"server": self.harness.server.process.pid}
+        for index, client in enumerate(self.harness.clients):
+            processes[f"client_{index}"] = client.process.pid
+        return processes
+
+    def directional_input_server(self, right: float, up: float):
+        self.directional_inputs([(SERVER, right, up)])
+
+    def directional_input_client(self, client_idx: int, right: float, up: float):
+        self.directional_inputs([(client_idx, right, up)])
+
+    def directional_input_clients(self, right: float, up: float):
+        self.directional_inputs([(ALL_CLIENTS, right, up)])
+
+    def directional_inputs(self, inputs: list):
+        self.run(self.harness.directional_inputs(inputs))
+
+    def applied_inputs(self):
+        return self.run(self.harness.applied_inputs())
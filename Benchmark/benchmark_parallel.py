@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+from benchmark_cache import process_name
+from benchmark_resources import set_affinity
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+def split_cpus(cpus: list, parts: int):
+    # Disjoint, equally sized core sets, remaining cores are left to the controller
+    size = len(cpus) // parts
+    if size == 0:
+        print(f"Only {len(cpus)} cores for {parts} parallel instances, the instances share all cores.")
+        return [set(cpus)] * parts
+    return [set(cpus[index * size:(index + 1) * size]) for index in range(parts)]
+
+def udp_ports(pid: int):
+    # Local ports of the UDP sockets of a process
+    if os.path.exists(f"/proc/{pid}/fd"):
+        inodes = set()
+        try:
+            for fd in os.listdir(f"/proc/{pid}/fd"):
+                target = os.readlink(f"/proc/{pid}/fd/{fd}")
+                if target.startswith("socket:["):
+                    inodes.add(target[8:-1])
+        except OSError:
+            pass
+        ports = set()
+        for table in ("/proc/net/udp", "/proc/net/udp6"):
+            try:
+                with open(table) as file:
+                    next(file)
+                    for line in file:
+                        fields = line.split()
+                        if fields[9] in inodes:
+                            ports.add(int(fields[1].rsplit(':', 1)[1], 16))
+            except OSError:
+                pass
+        return ports
+
+    try:
+        import psutil
+        process = psutil.Process(pid)
+        connections = process.net_connections(kind='udp') if hasattr(process, 'net_connections') else process.connections(kind='udp')
+        return {connection.laddr.port for connection in connections}
+    except Exception:
+        return set()
+
+def process_affinity(pid: int):
+    try:
+        if hasattr(os, 'sched_getaffinity'):
+            return set(os.sched_getaffinity(pid))
+        import psutil
+        return set(psutil.Process(pid).cpu_affinity())
+    except Exception:
+        return None
+
+class FrameworkInstance:
+    # One framework build with the game port, relay port and cores of the slot it runs in
+    def __init__(self, path: str):
+        self.path = path
+        self.name = process_name(path)
+        self.slot = None
+        self.port = None
+        self.relay_port = None
+        self.cpus = None
+        self.processes = {}  # Registered by the benchmark once the processes of the instance are launched
+        self.warnings = []
+
+    def assign(self, slot: int, port: int, relay_port: int, cpus: set):
+        self.slot = slot
+        self.port = port
+        self.relay_port = relay_port
+        self.cpus = cpus
+
+    def startup(self):
+        return f"-port {self.port}"
+
+    def register(self, processes: dict):
+        # Pins the processes of the instance to its cores and makes them visible to the cross-talk check
+        for pid in processes.values():
+            set_affinity(pid, self.cpus)
+        self.processes = dict(processes)
+
+    def ports(self):
+        return {port for port in (self.port, self.relay_port) if port is not None}
+
+def check_cross_talk(instances: list):
+    # Returns (instance, message) for everything that lets concurrently running instances influence
+    # each other's measurements: shared ports, overlapping or escaped cores and sockets on foreign ports
+    warnings = []
+    for index, instance in enumerate(instances):
+        for other in instances[index + 1:]:
+            if instance.ports() & other.ports():
+                warnings.append((instance, f"shares ports {sorted(instance.ports() & other.ports())} with {other.name}"))
+            if instance.cpus and other.cpus and instance.cpus & other.cpus and instance.cpus != other.cpus:
+                warnings.append((instance, f"shares cores {sorted(instance.cpus & other.cpus)} with {other.name}"))
+
+        foreign_ports = set().union(*[other.ports() for other in instances if other is not instance])
+        for role, pid in instance.processes.items():
+            affinity = process_affinity(pid)
+            if instance.cpus and affinity is not None and not affinity <= instance.cpus:
+                warnings.append((instance, f"{role} runs on cores {sorted(affinity - instance.cpus)} outside of its set"))
+
+            ports = udp_ports(pid)
+            if ports & foreign_ports:
+                warnings.append((instance, f"{role} uses ports {sorted(ports & foreign_ports)} of another instance"))
+            # A server that listens but not on its assigned port ignored the -port argument and collides with
+            # every other instance doing the same
+            if role == "server" and ports and instance.port not in ports:
+                warnings.append((instance, f"server does not listen on its port {instance.port} but on {sorted(ports)}"))
+    return warnings
+
+class ParallelScheduler:
+    # Runs the benchmarks of several framework builds at once. Each instance gets a slot with its own game
+    # port, relay port and a disjoint core set, instances beyond the number of slots wait for a free one.
+    # run_instance(instance) runs the whole benchmark of one instance in its own thread.
+    def __init__(self, paths: list, run_instance, slots: int, base_port: int, port_stride: int = 2, cpus: list = None, check_interval: float = 2.0):
+        self.instances = [FrameworkInstance(path) for path in paths]
+        self.run_instance = run_instance
+        self.slots = max(min(slots, len(paths)), 1)
+        self.ports = [base_port + slot * port_stride for slot in range(self.slots)]
+        self.cpu_sets = split_cpus(cpus if cpus is not None else available_cpus(), self.slots)
+        self.check_interval = check_interval
+        self.errors = {}
+
+    def run(self):
+        waiting = list(self.instances)
+        running = {}  # slot -> (instance, thread)
+        last_check = 0
+        reported = set()
+        while waiting or running:
+            for slot in range(self.slots):
+                if slot in running or not waiting:
+                    continue
+                instance = waiting.pop(0)
+                instance.assign(slot, self.ports[slot], self.ports[slot] + 1, self.cpu_sets[slot])
+                print(f"Starting {instance.name} on port {instance.port} with cores {sorted(instance.cpus)}.")
+                thread = threading.Thread(target=self.run_guarded, args=(instance,), name=instance.name)
+                thread.start()
+                running[slot] = (instance, thread)
+
+            time.sleep(0.1)
+
+            if time.monotonic() - last_check >= self.check_interval:
+                last_check = time.monotonic()
+                for instance, message in check_cross_talk([instance for instance, _ in running.values()]):
+                    if (instance.name, message) not in reported:
+                        reported.add((instance.name, message))
+                        instance.warnings.append(message)
+                        print(f"Cross-talk in {instance.name}: {message}")
+
+            for slot, (instance, thread) in list(running.items()):
+                if not thread.is_alive():
+                    thread.join()
+                    del running[slot]
+                    print(f"Finished {instance.name}.")
+
+        for instance in self.instances:
+            if instance.warnings:
+                print(f"Measurements of {instance.name} may be skewed: {'; '.join(instance.warnings)}")
+        return self.errors
+
+    def run_guarded(self, instance: FrameworkInstance):
+        try:
+            self.run_instance(instance)
+        except Exception as e:
+            self.errors[instance.name] = e
+            print(f"Benchmark of {instance.name} failed: {e}")
@@ -0,0 +1,302 @@
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import threading
+import subprocess
+import numpy as np
+from abc import ABC, abstractmethod
+from benchmark_timeseries import TrafficTimeSeries
+from benchmark_capture import RawSocketTrafficCapture, parse_udp_headers, store_results, LINK_HEADER_LENGTHS
+
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_HEADER = struct.Struct('IHHiIII')
+PCAP_RECORD_HEADER = struct.Struct('IIII')
+# Maximum IPv4 header plus the UDP ports
+MAX_HEADER_LENGTH = 60 + 4
+
+def markers_path(pcap_path: str):
+    return pcap_path + ".markers.json"
+
+class PcapRecorder(ABC):
+    # Records one continuous capture of all UDP traffic for a whole sweep and keeps run markers next to it.
+    # The port only labels the capture, it is applied when the capture is analyzed, so the traffic of any
+    # other port can be analyzed later from the same file.
+    def __init__(self, port: int, interface: str, output_path: str):
+        self.port = port
+        self.interface = interface
+        self.output_path = output_path
+        self.markers = []
+        self.open_markers = {}
+        self.error = None  # Set if the recording failed, its runs must not be stored
+
+    @abstractmethod
+    def start(self):
+        pass
+
+    @abstractmethod
+    def stop(self):
+        pass
+
+    def mark_start(self, label: str):
+        self.open_markers[label] = time.time_ns()
+
+    def mark_stop(self, label: str):
+        start = self.open_markers.pop(label, None)
+        if start is None:
+            print(f"Run marker {label} was stopped without being started.")
+            return
+        self.markers.append({"label": label, "start": start, "stop": time.time_ns()})
+        self.save_markers()
+
+    def save_markers(self):
+        with open(markers_path(self.output_path), 'w') as file:
+            json.dump(self.markers, file)
+
+class RawSocketPcapRecorder(PcapRecorder):
+    # Linux only, writes the frames received by the raw socket capture engine into a nanosecond pcap
+    def __init__(self, port: int, interface: str, output_path: str, snap_length: int = 128):
+        super().__init__(port, interface, output_path)
+        self.engine = RawSocketTrafficCapture(port, interface, snap_length=snap_length)
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.cancel_event.clear()
+        self.thread = threading.Thread(target=self.record)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread:
+            self.cancel_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def record(self):
+        engine = self.engine
+        try:
+            sock = engine.open_socket(filter_port=False)
+        except (OSError, AttributeError) as e:
+            self.error = f"Error opening raw socket on {self.interface}: {e}"
+            print(self.error)
+            return
+
+        print("Traffic recording started...")
+        with open(self.output_path, 'wb', buffering=1024 * 1024) as file:
+            file.write(PCAP_HEADER.pack(PCAP_MAGIC_NS, 2, 4, 0, 0, engine.snap_length, 1))
+            try:
+                while not self.cancel_event.is_set():
+                    n = engine.read_batch(sock, self.cancel_event)
+                    for j in range(n):
+                        length = int(engine.lengths[j])
+                        captured = min(length, engine.snap_length)
+                        seconds, nanoseconds = divmod(int(engine.timestamps[j]), 1_000_000_000)
+                        file.write(PCAP_RECORD_HEADER.pack(seconds, nanoseconds, captured, length))
+                        file.write(engine.frame_views[j][:captured])
+            except Exception as e:
+                self.error = f"Error during traffic recording: {e}"
+                print(self.error)
+            finally:
+                engine.close_socket(sock)
+        print("Traffic recording stopped.")
+
+class DumpcapPcapRecorder(PcapRecorder):
+    # Uses the dumpcap binary shipped with Wireshark, which writes straight to disk without dissecting
+    def __init__(self, port: int, interface: str, output_path: str, snap_length: int = 128, executable: str = "dumpcap"):
+        super().__init__(port, interface, output_path)
+        self.snap_length = snap_length
+        self.executable = executable
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen([
+            self.executable,
+            "-i", self.interface,
+            "-f", "udp",
+            "-s", str(self.snap_length),
+            "-P",  # classic pcap instead of pcapng
+            "-q",
+            "-w", self.output_path
+        ])
+        # dumpcap creates the file once the capture is running
+        while not os.path.exists(self.output_path) and self.process.poll() is None:
+            time.sleep(0.05)
+        if self.process.poll() is not None:
+            self.error = f"dumpcap exited with code {self.process.returncode}"
+            print(self.error)
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+        elif self.process and not self.error:
+            self.error = f"dumpcap exited with code {self.process.returncode} during the recording"
+            print(self.error)
+        self.process = None
+
+PCAP_RECORDERS = {
+    "raw": RawSocketPcapRecorder,
+    "dumpcap": DumpcapPcapRecorder,
+}
+
+def create_pcap_recorder(name: str, port: int, interface: str, output_path: str):
+    if name == "auto":
+        name = "raw" if sys.platform.startswith("linux") else "dumpcap"
+    if name not in PCAP_RECORDERS:
+        raise ValueError(f"Unknown pcap recorder '{name}', expected one of {list(PCAP_RECORDERS)}")
+    return PCAP_RECORDERS[name](port, interface, output_path)
+
+class PcapIndex:
+    # Memory-maps a classic pcap file and indexes every record once. The index only depends
+    # on the file, so any port filter or run segmentation can be applied afterwards.
+    def __init__(self, pcap_path: str, use_cache: bool = True):
+        self.path = pcap_path
+        self.data = np.memmap(pcap_path, dtype=np.uint8, mode='r')
+        self.read_header()
+
+        cache_path = pcap_path + ".idx.npz"
+        stat = os.stat(pcap_path)
+        if use_cache and os.path.exists(cache_path):
+            cache = np.load(cache_path)
+            if int(cache["file_size"]) == stat.st_size and int(cache["file_mtime"]) == stat.st_mtime_ns:
+                self.load(cache)
+                return
+
+        self.build()
+        if use_cache:
+            np.savez(cache_path, file_size=stat.st_size, file_mtime=stat.st_mtime_ns, offsets=self.offsets,
+                     captured=self.captured, lengths=self.lengths, timestamps=self.timestamps,
+                     valid=self.valid, src_ports=self.src_ports, dst_ports=self.dst_ports)
+
+    def read_header(self):
+        magic = int(self.data[:4].view('<u4')[0])
+        if magic in (PCAP_MAGIC_NS, PCAP_MAGIC_US):
+            self.endian = '<'
+        else:
+            magic = int(self.data[:4].view('>u4')[0])
+            if magic not in (PCAP_MAGIC_NS, PCAP_MAGIC_US):
+                raise ValueError(f"{self.path} is not a classic pcap file (pcapng must be converted or recorded with -P)")
+            self.endian = '>'
+        self.time_scale = 1 if magic == PCAP_MAGIC_NS else 1000
+        self.link_type = struct.unpack_from(self.endian + 'I', self.data, 20)[0] & 0x0FFFFFFF
+        if self.link_type not in LINK_HEADER_LENGTHS:
+            raise ValueError(f"Unsupported link type {self.link_type} in {self.path}")
+        self.link_offset = LINK_HEADER_LENGTHS[self.link_type]
+
+    def build(self):
+        # Records are chained by their captured length, so finding them is a sequential walk. Only the
+        # captured length is read per record in Python (well under a second per million records), the other
+        # header fields are gathered with numpy afterwards and the index is cached next to the file.
+        captured_length = struct.Struct(self.endian + 'I')
+        buffer = memoryview(self.data)
+        size = len(buffer)
+        offsets = []
+
+        position = PCAP_HEADER.size + PCAP_RECORD_HEADER.size
+        while position <= size:
+            caplen = captured_length.unpack_from(buffer, position - 8)[0]
+            if position + caplen > size:
+                break  # Truncated trailing record of a capture that was still running
+            offsets.append(position)
+            position += caplen + PCAP_RECORD_HEADER.size
+
+        self.offsets = np.array(offsets, dtype=np.int64)
+        headers = self.gather(self.offsets - PCAP_RECORD_HEADER.size, PCAP_RECORD_HEADER.size)
+        seconds, fraction, captured, lengths = headers.view(self.endian + 'u4').astype(np.int64).T
+        self.captured = captured
+        self.lengths = lengths
+        self.timestamps = seconds * 1_000_000_000 + fraction * self.time_scale
+        self.valid, self.src_ports, self.dst_ports = self.parse_headers()
+
+    def gather(self, positions: np.ndarray, width: int, limits: np.ndarray = None, chunk_size: int = 1 << 16):
+        # width bytes from every position of the mapped file, zeroed beyond the limit of each row. The chunks
+        # bound the int64 index temporaries to a few tens of MB.
+        columns = np.arange(width, dtype=np.int64)
+        rows = np.zeros((len(positions), width), dtype=np.uint8)
+        for start in range(0, len(positions), chunk_size):
+            end = min(start + chunk_size, len(positions))
+            indices = np.minimum(positions[start:end, None] + columns, len(self.data) - 1)
+            rows[start:end] = self.data[indices]
+            if limits is not None:
+                rows[start:end][columns >= limits[start:end, None]] = 0
+        return rows
+
+    def load(self, cache):
+        self.offsets = cache["offsets"]
+        self.captured = cache["captured"]
+        self.lengths = cache["lengths"]
+        self.timestamps = cache["timestamps"]
+        self.valid = cache["valid"]
+        self.src_ports = cache["src_ports"]
+        self.dst_ports = cache["dst_ports"]
+
+    def parse_headers(self, chunk_size: int = 1 << 16):
+        valid = np.zeros(len(self.offsets), dtype=bool)
+        src_ports = np.zeros(len(self.offsets), dtype=np.uint16)
+        dst_ports = np.zeros(len(self.offsets), dtype=np.uint16)
+
+        # Gather the header bytes of every record straight from the mapped file in chunks
+        width = self.link_offset + MAX_HEADER_LENGTH
+        for start in range(0, len(self.offsets), chunk_size):
+            end = min(start + chunk_size, len(self.offsets))
+            frames = self.gather(self.offsets[start:end], width, self.captured[start:end], chunk_size)
+            valid[start:end], src_ports[start:end], dst_ports[start:end] = parse_udp_headers(frames, self.link_offset)
+            valid[start:end] &= self.captured[start:end] >= self.link_offset + 24
+
+        return valid, src_ports, dst_ports
+
+def analyze_segments(index: PcapIndex, port: int, markers: list):
+    # Returns one results dict per marker, all segments are computed with prefix sums
+    to_server = index.valid & (index.dst_ports == port)
+    from_server = index.valid & ~to_server & (index.src_ports == port)
+
+    def prefix(values):
+        return np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+
+    bytes_to = prefix(np.where(to_server, index.lengths, 0))
+    bytes_from = prefix(np.where(from_server, index.lengths, 0))
+    packets_to = prefix(to_server)
+    packets_from = prefix(from_server)
+
+    starts = np.searchsorted(index.timestamps, [marker["start"] for marker in markers], side='left')
+    stops = np.searchsorted(index.timestamps, [marker["stop"] for marker in markers], side='right')
+
+    segments = []
+    for marker, start, stop in zip(markers, starts, stops):
+        results = {"label": marker["label"]}
+        store_results(results,
+                      int(bytes_to[stop] - bytes_to[start]),
+                      int(bytes_from[stop] - bytes_from[start]),
+                      int(packets_to[stop] - packets_to[start]),
+                      int(packets_from[stop] - packets_from[start]))
+        segments.append(results)
+    return segments
+
+def segment_series(index: PcapIndex, port: int, marker: dict, **kwargs):
+    # Per tick and per flow breakdown of a single run segment, see TrafficTimeSeries
+    start = np.searchsorted(index.timestamps, marker["start"], side='left')
+    stop = np.searchsorted(index.timestamps, marker["stop"], side='right')
+    series = TrafficTimeSeries(port, marker["start"], **kwargs)
+    series.add(index.timestamps[start:stop], index.lengths[start:stop], index.valid[start:stop],
+               index.src_ports[start:stop], index.dst_ports[start:stop])
+    return series
+
+def load_markers(pcap_path: str):
+    with open(markers_path(pcap_path)) as file:
+        return json.load(file)
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-analyze a recorded benchmark traffic capture.")
+    parser.add_argument("pcap", help="pcap file written by a PcapRecorder")
+    parser.add_argument("--port", type=int, default=24856, help="server UDP port used to classify the traffic")
+    args = parser.parse_args()
+
+    index = PcapIndex(args.pcap)
+    for results in analyze_segments(index, args.port, load_markers(args.pcap)):
+        print(results)
+
+if __name__ == "__main__":
+    sys.exit(main())
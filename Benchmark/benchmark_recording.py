@@ -0,0 +1,133 @@
+import cv2
+import time
+import queue
+import threading
+import numpy as np
+from benchmark_framestore import FrameStoreWriter, FRAME_STORE_EXTENSION
+from benchmark_tracing import TRACER, span
+
+class VideoFileWriter:
+    # Lossy video file, the frame timestamps are not stored
+    def __init__(self, path: str, width: int, height: int, fps: float):
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'XVID'), fps, (width, height))
+
+    def write(self, frame: np.ndarray, timestamp: int):
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+def create_frame_writer(path: str, width: int, height: int, fps: float, **options):
+    # Frame stores for paths ending in .frames, XVID video files otherwise
+    if path.endswith(FRAME_STORE_EXTENSION):
+        return FrameStoreWriter(path, width, height, **options)
+    return VideoFileWriter(path, width, height, fps)
+
+class CapturePipeline:
+    # Grabs frames on a fixed timeline into a pool of reusable buffers and hands them to an encoder thread
+    # through a bounded queue, so a slow encoder never delays the grab of the next frame.
+    # grab(out) has to write one BGR frame of shape (height, width, 3) into the given buffer.
+    def __init__(self, grab, width: int, height: int, output_path: str, fps: float = 30.0, pool_size: int = 8, writer_options: dict = None):
+        self.grab = grab
+        self.width = width
+        self.height = height
+        self.output_path = output_path
+        self.fps = fps
+        self.writer_options = writer_options or {}
+        self.interval_ns = int(1e9 / fps)
+
+        self.buffers = np.zeros((pool_size, height, width, 3), dtype=np.uint8)
+        self.free = queue.Queue()
+        self.filled = queue.Queue(maxsize=pool_size)
+        self.timestamps = []
+
+        self.active = False
+        self.grab_thread = None
+        self.encode_thread = None
+        self.writer = None
+
+        self.grabbed_frames = 0
+        self.encoded_frames = 0
+        self.dropped_frames = 0  # Grabs without a free buffer because the encoder fell behind
+        self.late_frames = 0  # Timeline slots missed because a grab started more than one interval late
+        self.grab_ns = 0
+
+    def start(self):
+        for index in range(len(self.buffers)):
+            self.free.put(index)
+        self.writer = create_frame_writer(self.output_path, self.width, self.height, self.fps, **self.writer_options)
+        self.active = True
+        self.encode_thread = threading.Thread(target=self.encode)
+        self.grab_thread = threading.Thread(target=self.capture)
+        self.encode_thread.start()
+        self.grab_thread.start()
+        print("Capture started.")
+
+    def stop(self):
+        if not self.grab_thread:
+            return
+        self.active = False
+        self.grab_thread.join()
+        self.filled.put(None)
+        self.encode_thread.join()
+        self.writer.close()
+        self.grab_thread = None
+        self.encode_thread = None
+        print(f"Capture stopped: {self.statistics()}")
+
+    def capture(self):
+        next_frame = time.perf_counter_ns()  # Fixed time reference
+        repeats = 1
+        while self.active:
+            # Wait until the next frame time
+            delay = next_frame - time.perf_counter_ns()
+            if delay > 0:
+                time.sleep(delay / 1e9)
+
+            # Slots that passed while waiting for the previous grab are filled with this frame, so the
+            # video keeps its fixed frame rate timeline
+            missed = (time.perf_counter_ns() - next_frame) // self.interval_ns
+            if missed > 0:
+                self.late_frames += missed
+                repeats += missed
+                next_frame += missed * self.interval_ns
+            next_frame += self.interval_ns
+
+            try:
+                index = self.free.get_nowait()
+            except queue.Empty:
+                self.dropped_frames += 1
+                repeats += 1
+                continue
+
+            timestamp = time.perf_counter_ns()
+            self.grab(self.buffers[index])
+            grabbed = time.perf_counter_ns()
+            self.grab_ns += grabbed - timestamp
+            if TRACER.enabled:
+                TRACER.record("capture.grab", timestamp, grabbed)
+            self.grabbed_frames += 1
+            self.filled.put((index, timestamp, repeats))
+            repeats = 1
+
+    def encode(self):
+        while True:
+            item = self.filled.get()
+            if item is None:
+                break
+            index, timestamp, repeats = item
+            with span("capture.encode"):
+                for _ in range(repeats):
+                    self.writer.write(self.buffers[index], timestamp)
+                    self.timestamps.append(timestamp)
+            self.encoded_frames += repeats
+            self.free.put(index)
+
+    def statistics(self):
+        return {
+            "grabbed_frames": self.grabbed_frames,
+            "encoded_frames": self.encoded_frames,
+            "dropped_frames": self.dropped_frames,
+            "late_frames": self.late_frames,
+            "mean_grab_ms": self.grab_ns / max(self.grabbed_frames, 1) / 1e6,
+        }
@@ -0,0 +1,215 @@
+import heapq
+import random
+import socket
+import asyncio
+import threading
+from benchmark_capture import store_results
+
+# Ethernet, IPv4 and UDP header, so relay byte counts line up with the link layer frames the capture backends count
+UDP_HEADER_OVERHEAD = 14 + 20 + 8
+
+class ImpairmentProfile:
+    def __init__(self, name: str = "none", latency_ms: float = 0.0, jitter_ms: float = 0.0, loss: float = 0.0,
+                 reorder: float = 0.0, reorder_delay_ms: float = 10.0, bandwidth_kbps: float = 0.0, max_queue_ms: float = 1000.0):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_delay_ms = reorder_delay_ms
+        self.bandwidth_kbps = bandwidth_kbps  # 0 disables the bandwidth cap
+        self.max_queue_ms = max_queue_ms
+
+    def __repr__(self):
+        return (f"ImpairmentProfile({self.name}: latency={self.latency_ms}ms, jitter={self.jitter_ms}ms, loss={self.loss}, "
+                f"reorder={self.reorder}, bandwidth={self.bandwidth_kbps}kbps)")
+
+class RelayDirection:
+    # Counters and bandwidth state of one direction of the relay
+    def __init__(self, profile: ImpairmentProfile, rng: random.Random):
+        self.profile = profile
+        self.rng = rng
+        self.bytes = 0
+        self.packets = 0
+        self.dropped_packets = 0
+        self.next_free = 0.0
+
+    def schedule(self, now: float, size: int):
+        # Returns the delivery time of the datagram or None if it is dropped
+        profile = self.profile
+        self.bytes += size + UDP_HEADER_OVERHEAD
+        self.packets += 1
+
+        if profile.loss > 0 and self.rng.random() < profile.loss:
+            self.dropped_packets += 1
+            return None
+
+        departure = now
+        if profile.bandwidth_kbps > 0:
+            departure = max(now, self.next_free)
+            if (departure - now) * 1000 > profile.max_queue_ms:
+                self.dropped_packets += 1  # Tail drop once the bottleneck queue is full
+                return None
+            departure += (size + UDP_HEADER_OVERHEAD) * 8 / (profile.bandwidth_kbps * 1000)
+            self.next_free = departure
+
+        delay_ms = profile.latency_ms
+        if profile.jitter_ms > 0:
+            delay_ms = max(0.0, delay_ms + self.rng.uniform(-profile.jitter_ms, profile.jitter_ms))
+        if profile.reorder > 0 and self.rng.random() < profile.reorder:
+            delay_ms += profile.reorder_delay_ms
+        return departure + delay_ms / 1000
+
+class UdpRelay:
+    # Sits between the clients and the server port, impairs the link and counts the traffic per direction.
+    # Each client gets its own upstream socket, so the server still sees one flow per client.
+    def __init__(self, listen_port: int, server_port: int, profile: ImpairmentProfile = None, host: str = '127.0.0.1',
+                 seed: int = None, batch_size: int = 256, buffer_size: int = 4 * 1024 * 1024):
+        self.listen_port = listen_port
+        self.server_port = server_port
+        self.profile = profile or ImpairmentProfile()
+        self.host = host
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+
+        rng = random.Random(seed)
+        self.to_server = RelayDirection(self.profile, rng)
+        self.from_server = RelayDirection(self.profile, rng)
+
+        self.loop = None
+        self.thread = None
+        self.stopped = None
+        self.ready = threading.Event()
+        self.error = None
+        self.listen_socket = None
+        self.upstreams = {}
+        self.clients = 0  # Client addresses seen since start, clients that bypass the relay never show up
+        self.queue = []
+        self.sequence = 0
+        self.timer = None
+
+    def start(self):
+        self.ready.clear()
+        self.error = None
+        self.clients = 0
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.serve()))
+        self.thread.start()
+        self.ready.wait()
+        if self.error:
+            # E.g. the listen port is in use
+            self.thread.join()
+            self.thread = None
+            raise self.error
+
+    def stop(self):
+        if self.thread:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join()
+            self.thread = None
+
+    def results(self):
+        results = {}
+        store_results(results, self.to_server.bytes, self.from_server.bytes, self.to_server.packets, self.from_server.packets)
+        results["dropped_to_server"] = self.to_server.dropped_packets
+        results["dropped_from_server"] = self.from_server.dropped_packets
+        return results
+
+    def create_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer_size)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.buffer_size)
+        sock.setblocking(False)
+        return sock
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        try:
+            self.listen_socket = self.create_socket()
+            self.listen_socket.bind((self.host, self.listen_port))
+        except OSError as e:
+            if self.listen_socket:
+                self.listen_socket.close()
+            self.error = e
+            self.ready.set()
+            return
+        self.loop.add_reader(self.listen_socket, self.on_client_readable)
+        print(f"Relay {self.host}:{self.listen_port} -> {self.server_port} started with {self.profile}")
+        self.ready.set()
+
+        try:
+            await self.stopped.wait()
+        finally:
+            if self.timer:
+                self.timer.cancel()
+            self.loop.remove_reader(self.listen_socket)
+            self.listen_socket.close()
+            for upstream in self.upstreams.values():
+                self.loop.remove_reader(upstream)
+                upstream.close()
+            self.upstreams.clear()
+            self.queue.clear()
+            print("Relay stopped.")
+
+    def on_client_readable(self):
+        # Drains up to batch_size datagrams per wakeup, the closest python gets to recvmmsg
+        now = self.loop.time()
+        for _ in range(self.batch_size):
+            try:
+                data, address = self.listen_socket.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                continue  # ICMP port unreachable from a client that already stopped
+
+            upstream = self.upstreams.get(address)
+            if upstream is None:
+                upstream = self.create_socket()
+                upstream.connect((self.host, self.server_port))
+                self.loop.add_reader(upstream, self.on_server_readable, upstream, address)
+                self.upstreams[address] = upstream
+                self.clients += 1
+
+            deliver_at = self.to_server.schedule(now, len(data))
+            if deliver_at is not None:
+                self.enqueue(now, deliver_at, upstream, data, None)
+        self.flush()
+
+    def on_server_readable(self, upstream, address):
+        now = self.loop.time()
+        for _ in range(self.batch_size):
+            try:
+                data = upstream.recv(65535)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                continue
+
+            deliver_at = self.from_server.schedule(now, len(data))
+            if deliver_at is not None:
+                self.enqueue(now, deliver_at, self.listen_socket, data, address)
+        self.flush()
+
+    def enqueue(self, now, deliver_at, sock, data, address):
+        self.sequence += 1
+        heapq.heappush(self.queue, (deliver_at, self.sequence, sock, data, address))
+
+    def flush(self):
+        # Sends every datagram that is due and re-arms a single timer for the next one
+        now = self.loop.time()
+        queue = self.queue
+        while queue and queue[0][0] <= now:
+            _, _, sock, data, address = heapq.heappop(queue)
+            try:
+                if address is None:
+                    sock.send(data)
+                else:
+                    sock.sendto(data, address)
+            except OSError:
+                pass  # Full socket buffer or receiver gone, same as a dropped datagram on the wire
+
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if queue:
+            self.timer = self.loop.call_at(queue[0][0], self.flush)
@@ -0,0 +1,242 @@
+import os
+import time
+import threading
+import numpy as np
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# Columns of the sample ring buffers
+SAMPLE_TIME, SAMPLE_CPU, SAMPLE_RSS, SAMPLE_IO = range(4)
+
+RESOURCE_COLUMNS = [
+    "Mean Server CPU %",
+    "P95 Server CPU %",
+    "Max Server CPU %",
+    "Peak Server RSS MB",
+    "Mean Clients CPU %",
+    "P95 Clients CPU %",
+    "Max Clients CPU %",
+    "Peak Clients RSS MB",
+]
+
+class ProcReader:
+    # Keeps the /proc files of one process open and re-reads them with pread
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.stat = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+        self.statm = os.open(f"/proc/{pid}/statm", os.O_RDONLY)
+        try:
+            self.io = os.open(f"/proc/{pid}/io", os.O_RDONLY)
+        except OSError:
+            self.io = None  # Not readable without ptrace permissions on some systems
+
+    def read(self):
+        # Returns cpu seconds, resident bytes and read + written bytes (including sockets)
+        stat = os.pread(self.stat, 1024, 0)
+        fields = stat[stat.rindex(b')') + 2:].split()
+        cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        rss = int(os.pread(self.statm, 256, 0).split()[1]) * PAGE_SIZE
+        io = 0
+        if self.io is not None:
+            for line in os.pread(self.io, 512, 0).splitlines():
+                if line.startswith(b'rchar') or line.startswith(b'wchar'):
+                    io += int(line.split()[1])
+        return cpu, rss, io
+
+    def close(self):
+        for fd in (self.stat, self.statm, self.io):
+            if fd is not None:
+                os.close(fd)
+
+class PsutilReader:
+    # Fallback for systems without procfs, e.g. Windows
+    def __init__(self, pid: int):
+        import psutil
+        self.process = psutil.Process(pid)
+
+    def read(self):
+        with self.process.oneshot():
+            times = self.process.cpu_times()
+            rss = self.process.memory_info().rss
+            try:
+                counters = self.process.io_counters()
+                io = counters.read_bytes + counters.write_bytes
+            except (AttributeError, NotImplementedError):
+                io = 0
+        return times.user + times.system, rss, io
+
+    def close(self):
+        pass
+
+def create_reader(pid: int):
+    if os.path.exists(f"/proc/{pid}/stat"):
+        return ProcReader(pid)
+    return PsutilReader(pid)
+
+class ResourceSampler:
+    # Samples CPU, memory and IO of the benchmark processes at a fixed rate into preallocated ring buffers
+    def __init__(self, processes: dict, rate_hz: float = 10.0, capacity: int = 4096):
+        self.names = list(processes)
+        self.pids = [processes[name] for name in self.names]
+        self.interval_ns = int(1e9 / rate_hz)
+        self.capacity = capacity
+        self.samples = np.zeros((len(self.pids), capacity, 4), dtype=np.float64)
+        self.count = 0
+        self.readers = []
+        self.active = False
+        self.thread = None
+
+    def start(self):
+        self.readers = []
+        for pid in self.pids:
+            try:
+                self.readers.append(create_reader(pid))
+            except (OSError, ImportError) as e:
+                print(f"Unable to sample resources of process {pid}: {e}")
+                self.readers.append(None)
+        self.samples.fill(0)
+        self.count = 0
+        self.active = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread:
+            self.active = False
+            self.thread.join()
+            self.thread = None
+        for reader in self.readers:
+            if reader:
+                reader.close()
+        self.readers = []
+
+    def sample(self):
+        next_sample = time.perf_counter_ns()
+        while self.active:
+            slot = self.count % self.capacity
+            now = time.perf_counter_ns() / 1e9
+            for index, reader in enumerate(self.readers):
+                if reader is None:
+                    continue
+                try:
+                    cpu, rss, io = reader.read()
+                except Exception:
+                    continue  # The process exited or is not readable
+                self.samples[index, slot] = (now, cpu, rss, io)
+            self.count += 1
+
+            next_sample += self.interval_ns
+            delay = next_sample - time.perf_counter_ns()
+            if delay > 0:
+                time.sleep(delay / 1e9)
+
+    def ordered(self, index: int):
+        # Samples of one process in chronological order
+        if self.count <= self.capacity:
+            samples = self.samples[index, :self.count]
+        else:
+            slot = self.count % self.capacity
+            samples = np.concatenate((self.samples[index, slot:], self.samples[index, :slot]))
+        return samples[samples[:, SAMPLE_TIME] > 0]
+
+    def cpu_percent(self, index: int):
+        samples = self.ordered(index)
+        if len(samples) < 2:
+            return np.zeros(0)
+        elapsed = np.diff(samples[:, SAMPLE_TIME])
+        return np.diff(samples[:, SAMPLE_CPU]) / np.maximum(elapsed, 1e-9) * 100
+
+    def aggregate(self, names: list):
+        indices = [self.names.index(name) for name in names if name in self.names]
+        cpu = np.concatenate([self.cpu_percent(index) for index in indices]) if indices else np.zeros(0)
+        samples = [self.ordered(index) for index in indices]
+        rss = [process[:, SAMPLE_RSS].max(initial=0) for process in samples]
+        io = [np.ptp(process[:, SAMPLE_IO]) if len(process) else 0 for process in samples]
+        return {
+            "mean_cpu": float(np.mean(cpu)) if len(cpu) else 0.0,
+            "p95_cpu": float(np.percentile(cpu, 95)) if len(cpu) else 0.0,
+            "max_cpu": float(np.max(cpu)) if len(cpu) else 0.0,
+            "peak_rss_mb": float(max(rss, default=0) / (1024 * 1024)),
+            "io_bytes": float(sum(io)),
+        }
+
+    def results(self):
+        # Server is the "server" or "local" process, every other process is a client
+        server_names = [name for name in self.names if name in ("server", "local")]
+        client_names = [name for name in self.names if name not in server_names]
+        return {"server": self.aggregate(server_names), "clients": self.aggregate(client_names)}
+
+    def export(self):
+        # Chronological samples per process name, e.g. to send them from a remote agent
+        return {name: self.ordered(index).tolist() for index, name in enumerate(self.names)}
+
+def load_samples(samples: dict):
+    # ResourceSampler over exported samples, e.g. merged from several nodes. Timestamps of different nodes
+    # are never compared, only differences within one process are used.
+    capacity = max([len(rows) for rows in samples.values()] + [1])
+    sampler = ResourceSampler({name: 0 for name in samples}, capacity=capacity)
+    for index, rows in enumerate(samples.values()):
+        if rows:
+            sampler.samples[index, :len(rows)] = rows
+    sampler.count = capacity
+    return sampler
+
+class DistributedResourceSampler:
+    # Samples the local processes and collects the samples of the processes launched by remote agents,
+    # same interface as ResourceSampler
+    def __init__(self, processes: dict, agents: list, rate_hz: float = 10.0):
+        self.local = ResourceSampler(processes, rate_hz) if processes else None
+        self.agents = agents
+        self.rate_hz = rate_hz
+        self.remote = {}
+
+    def start(self):
+        self.remote = {}
+        if self.local:
+            self.local.start()
+        for agent in self.agents:
+            agent.start_sampling(self.rate_hz)
+
+    def stop(self):
+        if self.local:
+            self.local.stop()
+        for agent in self.agents:
+            self.remote.update(agent.stop_sampling())
+
+    def results(self):
+        samples = self.local.export() if self.local else {}
+        samples.update(self.remote)
+        return load_samples(samples).results()
+
+def set_affinity(pid: int, cpus):
+    # Pins a process (0 for the calling one) to the given cores, does nothing without cores
+    if not cpus:
+        return
+    try:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(pid, cpus)
+        else:
+            import psutil
+            psutil.Process(pid or os.getpid()).cpu_affinity(sorted(cpus))
+    except Exception as e:
+        print(f"Unable to set the CPU affinity of process {pid}: {e}")
+
+def resource_row(run_resources: list):
+    # Averages the per run aggregates into the RESOURCE_COLUMNS of the CSV files
+    def mean(role, key):
+        return float(np.mean([resources[role][key] for resources in run_resources])) if run_resources else 0.0
+
+    def peak(role, key):
+        return float(np.max([resources[role][key] for resources in run_resources])) if run_resources else 0.0
+
+    return [
+        mean("server", "mean_cpu"),
+        mean("server", "p95_cpu"),
+        peak("server", "max_cpu"),
+        peak("server", "peak_rss_mb"),
+        mean("clients", "mean_cpu"),
+        mean("clients", "p95_cpu"),
+        peak("clients", "max_cpu"),
+        peak("clients", "peak_rss_mb"),
+    ]
@@ -0,0 +1,161 @@
+import time
+import numpy as np
+from benchmark_harness import BenchmarkHarnessBase
+from benchmark_tracing import traced
+
+class ScenarioEvent:
+    def __init__(self, at: float, target: int, right: float, up: float, coalesce: bool = False):
+        self.at = at
+        self.target = target
+        self.right = right
+        self.up = up
+        self.coalesce = coalesce  # Stream samples may be skipped when a newer sample for the same target is already due
+
+    def definition(self):
+        return (round(self.at, 6), self.target, self.right, self.up, self.coalesce)
+
+class Scenario:
+    # Declarative input timeline, times are in seconds relative to the start of the scenario
+    def __init__(self, name: str, duration: float = None):
+        self.name = name
+        self.events = []
+        self.fixed_duration = duration
+
+    def input(self, at: float, target: int, right: float, up: float):
+        self.events.append(ScenarioEvent(at, target, right, up))
+        return self
+
+    def hold(self, at: float, duration: float, target: int, right: float, up: float):
+        self.input(at, target, right, up)
+        return self.input(at + duration, target, 0.0, 0.0)
+
+    def stream(self, at: float, duration: float, target: int, function, rate: float = 60.0):
+        # Continuous analog input, function maps the elapsed time of the stream to (right, up)
+        for k in range(int(round(duration * rate))):
+            right, up = function(k / rate)
+            self.events.append(ScenarioEvent(at + k / rate, target, float(right), float(up), coalesce=True))
+        return self.input(at + duration, target, 0.0, 0.0)
+
+    @property
+    def duration(self):
+        if self.fixed_duration is not None:
+            return self.fixed_duration
+        return max((event.at for event in self.events), default=0.0)
+
+    def sorted_events(self):
+        return sorted(self.events, key=lambda event: event.at)
+
+    def definition(self):
+        # Stable description of the scenario, e.g. for cache keys
+        return (self.name, self.duration, tuple(event.definition() for event in self.sorted_events()))
+
+class ScenarioResult:
+    def __init__(self, scenario: Scenario, start_ns: int, start_wall_ns: int, planned_ns: np.ndarray, dispatched_ns: np.ndarray, completed_ns: np.ndarray, skipped: int,
+                 applied: list = None):
+        self.scenario = scenario
+        self.start_ns = start_ns  # time.perf_counter_ns() at the start of the timeline
+        self.start_wall_ns = start_wall_ns
+        self.planned_ns = planned_ns
+        self.dispatched_ns = dispatched_ns
+        self.completed_ns = completed_ns
+        self.skipped = skipped
+        # (sequence, tick, latency ns) of input frames the controllers acknowledged, see acknowledge_inputs
+        self.applied_ns = np.array([latency for _, _, latency in applied or []], dtype=np.int64)
+
+    def first_input_ns(self):
+        # perf_counter_ns of the first dispatched input, the common origin to align captures of different runs
+        dispatched = self.dispatched_ns[self.dispatched_ns >= 0]
+        return self.start_ns + int(dispatched[0]) if len(dispatched) else self.start_ns
+
+    def statistics(self):
+        dispatched = self.dispatched_ns >= 0
+        lateness_ms = (self.dispatched_ns[dispatched] - self.planned_ns[dispatched]) / 1e6
+        send_ms = (self.completed_ns[dispatched] - self.dispatched_ns[dispatched]) / 1e6
+        if len(lateness_ms) == 0:
+            return {"events": 0, "skipped": self.skipped}
+        statistics = {
+            "events": int(len(lateness_ms)),
+            "skipped": self.skipped,
+            "mean_lateness_ms": float(np.mean(lateness_ms)),
+            "p95_lateness_ms": float(np.percentile(lateness_ms, 95)),
+            "max_lateness_ms": float(np.max(lateness_ms)),
+            "jitter_ms": float(np.std(lateness_ms)),
+            "mean_send_ms": float(np.mean(send_ms)),
+            "max_send_ms": float(np.max(send_ms)),
+        }
+        if len(self.applied_ns):
+            # Time from sending an input frame until its acknowledgement arrived, the controller applied it in between
+            applied_ms = self.applied_ns / 1e6
+            statistics.update({
+                "applied_frames": int(len(applied_ms)),
+                "mean_applied_ms": float(np.mean(applied_ms)),
+                "p95_applied_ms": float(np.percentile(applied_ms, 95)),
+                "max_applied_ms": float(np.max(applied_ms)),
+            })
+        return statistics
+
+def dispatch(harness: BenchmarkHarnessBase, events: list):
+    # Events planned for the same time are sent together, framed connections apply them in the same tick
+    harness.directional_inputs([(event.target, event.right, event.up) for event in events])
+
+def wait_until(deadline_ns: int, spin_ns: int):
+    # Sleep coarsely and spin for the last part, time.sleep alone overshoots by up to a timer tick
+    while True:
+        remaining = deadline_ns - time.perf_counter_ns()
+        if remaining <= 0:
+            return
+        if remaining > spin_ns:
+            time.sleep((remaining - spin_ns) / 1e9)
+
+@traced("scenario")
+def run_scenario(harness: BenchmarkHarnessBase, scenario: Scenario, spin_ms: float = 2.0):
+    # Every event is scheduled against the absolute start time, so delays never accumulate
+    events = scenario.sorted_events()
+    planned = np.array([int(event.at * 1e9) for event in events], dtype=np.int64)
+    dispatched = np.full(len(events), -1, dtype=np.int64)
+    completed = np.full(len(events), -1, dtype=np.int64)
+    spin_ns = int(spin_ms * 1e6)
+    skipped = 0
+
+    # Index of the next event for the same target, streams of several targets are interleaved in the timeline
+    next_same = np.full(len(events), -1, dtype=np.int64)
+    following = {}
+    for position in range(len(events) - 1, -1, -1):
+        next_same[position] = following.get(events[position].target, -1)
+        following[events[position].target] = position
+
+    harness.applied_inputs()  # Discard acknowledgements of inputs sent before the scenario
+    start_wall = time.time_ns()
+    start = time.perf_counter_ns()
+    index = 0
+    while index < len(events):
+        wait_until(start + planned[index], spin_ns)
+        end = index + 1
+        while end < len(events) and planned[end] == planned[index]:
+            end += 1
+
+        batch = []
+        for position in range(index, end):
+            event = events[position]
+            # Drop stream samples that are already superseded by the next sample for the same target
+            successor = next_same[position]
+            if event.coalesce and successor >= 0 and events[successor].coalesce and time.perf_counter_ns() >= start + planned[successor]:
+                skipped += 1
+                continue
+            batch.append(position)
+
+        if batch:
+            dispatched[batch] = time.perf_counter_ns() - start
+            dispatch(harness, [events[position] for position in batch])
+            completed[batch] = time.perf_counter_ns() - start
+        index = end
+
+    wait_until(start + int(scenario.duration * 1e9), spin_ns)
+    return ScenarioResult(scenario, start, start_wall, planned, dispatched, completed, skipped, harness.applied_inputs())
+
+# The input sequence both benchmarks used so far
+DEFAULT_SCENARIO = Scenario("default") \
+    .input(0.0, 0, 0.0, 1.0) \
+    .input(3.0, 0, 1.0, -1.0) \
+    .input(4.0, 0, 0.0, 0.0) \
+    .hold(4.0, 5.0, 1, 0.0, 1.0)
@@ -0,0 +1,408 @@
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import numpy as np
+from benchmark_harness import BenchmarkConnection, BenchmarkCommands, BenchmarkAcks, FRAME_ACKNOWLEDGE, COMMAND_APPLIED, \
+    input_payload, encode_frame, parse_frames
+from benchmark_capture import parse_udp_headers, count_udp_traffic, LINK_HEADER_LENGTHS, IPPROTO_UDP
+from benchmark_pcap import PcapIndex, analyze_segments, PCAP_HEADER, PCAP_MAGIC_NS
+from benchmark_timeseries import TrafficTimeSeries
+
+# Measures the overhead of the harness itself on synthetic input: window grabs and frame stores, frame
+# differences and averages, the traffic parsers and the command round trip to a controller. Results are
+# appended to a history file and compared against the previous results of the same machine.
+
+FRAME_WIDTH = 1280
+FRAME_HEIGHT = 720
+FRAME_SCALE = 0.5
+SERVER_PORT = 24856
+SNAP_LENGTH = 128
+
+def best_seconds(function, repeat: int):
+    # Shortest of several runs, the one least disturbed by the rest of the machine
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        function()
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return max(best, 1) / 1e9
+
+def rate(items: int, seconds: float, unit: str):
+    return {"value": items / seconds, "unit": unit, "higher_is_better": True}
+
+def cost(items: int, seconds: float, unit: str = "us"):
+    return {"value": seconds / items * 1e6, "unit": unit, "higher_is_better": False}
+
+def synthetic_frames(count: int, width: int = FRAME_WIDTH, height: int = FRAME_HEIGHT, seed: int = 0):
+    from benchmark_framesource import SyntheticFrameSource
+    source = SyntheticFrameSource(0, width, height, seed=seed)
+    source.open()
+    frames = np.zeros((count, height, width, 3), dtype=np.uint8)
+    for index in range(count):
+        # The synthetic timeline advances with the wall time, shift it so consecutive frames differ
+        source.start -= 1 / 30
+        source.grab(frames[index])
+    return frames
+
+def write_store(path: str, frames, origin_ns: int, interval_ns: int):
+    from benchmark_framestore import FrameStoreWriter
+    height, width = frames[0].shape[:2]
+    writer = FrameStoreWriter(path, width, height, scale=FRAME_SCALE)
+    for index, frame in enumerate(frames):
+        writer.write(frame, origin_ns + index * interval_ns)
+    writer.close()
+
+def bench_capture(directory: str, frames: int, repeat: int):
+    from benchmark_framesource import SyntheticFrameSource
+    source = SyntheticFrameSource(0, FRAME_WIDTH, FRAME_HEIGHT)
+    source.open()
+    buffer = np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+
+    def grab():
+        for _ in range(frames):
+            source.grab(buffer)
+
+    # Views repeating the recorded frames, built once so only the frame store is timed
+    recorded = synthetic_frames(min(frames, 64))
+    sequence = [recorded[index % len(recorded)] for index in range(frames)]
+    path = os.path.join(directory, "capture.frames")
+
+    def store():
+        write_store(path, sequence, 0, 1)
+
+    return {
+        "capture.grab": rate(frames, best_seconds(grab, repeat), "frames/s"),
+        "capture.store": rate(frames, best_seconds(store, repeat), "frames/s"),
+    }
+
+def bench_difference(frames: int, clients: int, repeat: int):
+    from benchmark_analysis import FrameDifference
+    import cv2
+    shape = (int(round(FRAME_HEIGHT * FRAME_SCALE)), int(round(FRAME_WIDTH * FRAME_SCALE)))
+    gray = [cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+            for frame in synthetic_frames(clients + 1)]
+    engine = FrameDifference(shape)
+
+    def compare():
+        for _ in range(frames):
+            engine.compare(gray[0], gray[1:2])
+
+    def average():
+        for _ in range(frames):
+            engine.compare(gray[0], gray[1:])
+
+    return {
+        "analysis.compare": cost(frames, best_seconds(compare, repeat)),
+        "analysis.average": cost(frames, best_seconds(average, repeat)),
+    }
+
+def bench_videos(directory: str, frames: int, clients: int, repeat: int):
+    # Baseline and run recordings of the same synthetic scene, matched by capture time like a real run
+    from benchmark_analysis import compare_videos
+    interval_ns = 1_000_000_000 // 30
+    baseline_path = os.path.join(directory, "baseline.frames")
+    groups = {
+        "server": [os.path.join(directory, "server.frames")],
+        "clients": [os.path.join(directory, f"client_{index}.frames") for index in range(clients)],
+    }
+    write_store(baseline_path, synthetic_frames(frames, seed=0), 0, interval_ns)
+    for index, path in enumerate(groups["server"] + groups["clients"]):
+        write_store(path, synthetic_frames(frames, seed=index + 1), 5_000_000, interval_ns)
+
+    seconds = best_seconds(lambda: compare_videos(baseline_path, groups, 0, 5_000_000), repeat)
+    return {"analysis.compare_videos": rate(frames, seconds, "frames/s")}
+
+def synthetic_udp_frames(packets: int, clients: int, port: int = SERVER_PORT, seed: int = 0):
+    # Ethernet, IPv4 and UDP headers of the server traffic of several clients, every tenth packet is TCP
+    rng = np.random.default_rng(seed)
+    link = LINK_HEADER_LENGTHS[1]
+    frames = np.zeros((packets, SNAP_LENGTH), dtype=np.uint8)
+    lengths = rng.integers(60, 1400, packets).astype(np.int64)
+    frames[:, link] = 0x45
+    frames[:, link + 2] = (lengths - link) >> 8
+    frames[:, link + 3] = (lengths - link) & 0xFF
+    frames[:, link + 9] = IPPROTO_UDP
+    frames[::10, link + 9] = 6
+
+    client_ports = 50000 + rng.integers(0, clients, packets)
+    to_server = rng.random(packets) < 0.3
+    src_ports = np.where(to_server, client_ports, port)
+    dst_ports = np.where(to_server, port, client_ports)
+    udp = link + 20
+    frames[:, udp] = src_ports >> 8
+    frames[:, udp + 1] = src_ports & 0xFF
+    frames[:, udp + 2] = dst_ports >> 8
+    frames[:, udp + 3] = dst_ports & 0xFF
+    return frames, lengths
+
+def write_pcap(path: str, frames: np.ndarray, lengths: np.ndarray, interval_ns: int = 10_000):
+    records = np.zeros(len(frames), dtype=np.dtype([('seconds', '<u4'), ('nanoseconds', '<u4'), ('captured', '<u4'),
+                                                    ('length', '<u4'), ('data', 'u1', frames.shape[1])]))
+    timestamps = np.arange(len(frames), dtype=np.int64) * interval_ns
+    records['seconds'] = timestamps // 1_000_000_000
+    records['nanoseconds'] = timestamps % 1_000_000_000
+    # Every record holds the full snap length, like a capture of packets that are all larger than it
+    records['captured'] = frames.shape[1]
+    records['length'] = lengths
+    records['data'] = frames
+    with open(path, 'wb') as file:
+        file.write(PCAP_HEADER.pack(PCAP_MAGIC_NS, 2, 4, 0, 0, frames.shape[1], 1))
+        records.tofile(file)
+    return timestamps
+
+def bench_traffic(directory: str, packets: int, clients: int, repeat: int):
+    frames, lengths = synthetic_udp_frames(packets, clients)
+    link = LINK_HEADER_LENGTHS[1]
+    timestamps = np.arange(packets, dtype=np.int64) * 10_000
+
+    def parse():
+        valid, src_ports, dst_ports = parse_udp_headers(frames, link)
+        count_udp_traffic(lengths, valid, src_ports, dst_ports, SERVER_PORT)
+
+    valid, src_ports, dst_ports = parse_udp_headers(frames, link)
+
+    def series():
+        TrafficTimeSeries(SERVER_PORT, 0).add(timestamps, lengths, valid, src_ports, dst_ports)
+
+    path = os.path.join(directory, "traffic.pcap")
+    write_pcap(path, frames, lengths)
+    duration = int(timestamps[-1])
+    markers = [{"label": str(index), "start": duration * index // 10, "stop": duration * (index + 1) // 10} for index in range(10)]
+
+    def pcap():
+        analyze_segments(PcapIndex(path, use_cache=False), SERVER_PORT, markers)
+
+    return {
+        "traffic.parse": rate(packets, best_seconds(parse, repeat), "packets/s"),
+        "traffic.series": rate(packets, best_seconds(series, repeat), "packets/s"),
+        "traffic.pcap": rate(packets, best_seconds(pcap, repeat), "packets/s"),
+    }
+
+class StandInController:
+    # Connects to the harness like a benchmark controller speaking the framed protocol, announces itself,
+    # acknowledges every StartServer right away and applies every frame in a tick of its own
+    def __init__(self, port: int):
+        self.socket = socket.create_connection(("127.0.0.1", port))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sequence = 0
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def frame(self, ack: BenchmarkAcks, payload: bytes):
+        self.sequence += 1
+        return encode_frame([(ack, payload)], self.sequence)
+
+    def serve(self):
+        self.socket.sendall(self.frame(BenchmarkAcks.ControllerReady, struct.pack('<i', 0)))
+        buffer = b''
+        tick = 0
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            frames, buffer = parse_frames(buffer + data)
+            replies = []
+            for flags, sequence, messages in frames:
+                tick += 1
+                for opcode, _ in messages:
+                    if opcode == BenchmarkCommands.StartServer.value[0]:
+                        replies.append(self.frame(BenchmarkAcks.ServerStarted, struct.pack('<i', 0)))
+                if flags & FRAME_ACKNOWLEDGE:
+                    replies.append(self.frame(BenchmarkAcks.CommandApplied, COMMAND_APPLIED.pack(sequence, tick)))
+            try:
+                if replies:
+                    self.socket.sendall(b''.join(replies))
+            except OSError:
+                break
+
+    def close(self):
+        self.socket.close()
+
+class StandInConnection(BenchmarkConnection):
+    # The harness side of a connection to a StandInController instead of a launched build
+    def __init__(self, ack_timeout: float = 5.0):
+        self.agent = None
+        self.headless = True
+        self.process = None
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(1)
+        self.port = self.socket.getsockname()[1]
+        self.controller = StandInController(self.port)
+        self.connection, _ = self.socket.accept()
+
+        self.init_acks(ack_timeout)
+        self.receive_thread = threading.Thread(target=self.receive_acks, daemon=True)
+        self.receive_thread.start()
+        self.capture_pipeline = None
+        self.frame_source = None
+
+    def close(self):
+        self.controller.close()
+        self.connection.close()
+        self.connection = None
+
+def bench_commands(commands: int, clients: int, repeat: int):
+    connection = StandInConnection()
+    connection.wait_until_ready()
+
+    def round_trip():
+        for _ in range(commands):
+            connection.send_commands([(BenchmarkCommands.StartServer, b'')])
+            connection.wait_for_ack(BenchmarkAcks.ServerStarted, connection.ack_timeout)
+
+    # One acknowledged frame with the inputs of all clients per tick, like a batched scenario stream
+    batch = [(BenchmarkCommands.DirectionalInput, input_payload(1.0, 0.0, index)) for index in range(clients)]
+
+    def batches():
+        connection.applied_commands()
+        for sent in range(1, commands + 1):
+            connection.send_commands(batch, acknowledge=True)
+            with connection.ack_condition:
+                connection.ack_condition.wait_for(lambda: len(connection.applied) >= sent, connection.ack_timeout)
+        return connection.applied_commands()
+
+    try:
+        results = {"command.round_trip": cost(commands, best_seconds(round_trip, repeat))}
+        applied = np.array([latency for _, _, latency in batches()])
+        results["command.batch_applied"] = {"value": float(np.median(applied)) / 1e3, "unit": "us", "higher_is_better": False}
+        return results
+    finally:
+        connection.close()
+
+def run_suite(sizes: dict, repeat: int, selected: list = None):
+    suites = {
+        "capture": lambda directory: bench_capture(directory, sizes["frames"], repeat),
+        "difference": lambda directory: bench_difference(sizes["frames"], sizes["clients"], repeat),
+        "videos": lambda directory: bench_videos(directory, sizes["frames"], sizes["clients"], repeat),
+        "traffic": lambda directory: bench_traffic(directory, sizes["packets"], sizes["clients"], repeat),
+        "commands": lambda directory: bench_commands(sizes["commands"], sizes["input_clients"], repeat),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="benchmark_selftest_") as directory:
+        for name, suite in suites.items():
+            if selected and name not in selected:
+                continue
+            print(f"Measuring {name}...")
+            results.update(suite(directory))
+    return results
+
+def machine():
+    return f"{platform.node()}/{platform.machine()}/{os.cpu_count()}"
+
+def revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def load_history(path: str):
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def reference_values(history: list, host: str, window: int):
+    # Median of the last passing results of every metric on the same machine
+    values = {}
+    for entry in history:
+        if entry["machine"] == host and not entry.get("regressions"):
+            for metric, result in entry["results"].items():
+                values.setdefault(metric, []).append(result["value"])
+    return {metric: float(np.median(samples[-window:])) for metric, samples in values.items()}
+
+def find_regressions(results: dict, references: dict, threshold: float):
+    regressions = []
+    for metric, result in results.items():
+        reference = references.get(metric)
+        if not reference:
+            continue
+        change = result["value"] / reference - 1
+        if (change < -threshold) if result["higher_is_better"] else (change > threshold):
+            regressions.append(metric)
+    return regressions
+
+def check_budget(results: dict, fps: float, budget: float):
+    # The harness runs next to the measured frameworks, its per frame work has to stay a small share of a
+    # frame interval so it does not become part of the measured differences
+    violations = []
+    interval_us = 1e6 / fps
+    capture = results.get("capture.grab"), results.get("capture.store")
+    if all(capture):
+        per_frame_us = sum(1e6 / result["value"] for result in capture)
+        if per_frame_us > budget * interval_us:
+            violations.append(f"capturing a frame takes {per_frame_us:.0f}us, {per_frame_us / interval_us:.0%} of the frame interval")
+    videos = results.get("analysis.compare_videos")
+    if videos and videos["value"] < fps:
+        violations.append(f"the analysis compares {videos['value']:.0f} frames/s, slower than the {fps:.0f} fps recorded per run")
+    for metric in ("command.round_trip", "command.batch_applied"):
+        commands = results.get(metric)
+        if commands and commands["value"] > budget * interval_us:
+            violations.append(f"{metric} takes {commands['value']:.0f}us, {commands['value'] / interval_us:.0%} of the frame interval")
+    return violations
+
+def print_results(results: dict, references: dict, regressions: list):
+    print(f"{'Metric':<28}{'Value':>14}  {'Unit':<10}{'Reference':>14}{'Change':>9}")
+    for metric, result in results.items():
+        reference = references.get(metric)
+        line = f"{metric:<28}{result['value']:>14.1f}  {result['unit']:<10}"
+        if reference:
+            line += f"{reference:>14.1f}{result['value'] / reference - 1:>+9.1%}"
+        if metric in regressions:
+            line += "  REGRESSION"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the overhead of the benchmark harness on synthetic input and tracks it over time.")
+    parser.add_argument("--history", default="benchmark_selftest_history.jsonl", help="results of previous runs, one JSON object per line")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative change of a metric that counts as a regression")
+    parser.add_argument("--window", type=int, default=5, help="previous runs the median reference is computed from")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of every measurement, the fastest one counts")
+    parser.add_argument("--quick", action='store_true', help="smaller inputs, e.g. for a smoke test")
+    parser.add_argument("--suite", action='append', choices=["capture", "difference", "videos", "traffic", "commands"], help="only run these suites")
+    parser.add_argument("--fps", type=float, default=30.0, help="capture rate of the visual benchmark")
+    parser.add_argument("--budget", type=float, default=0.1, help="share of a frame interval the per frame overhead may take")
+    parser.add_argument("--no-record", action='store_true', help="do not append the results to the history")
+    args = parser.parse_args()
+
+    sizes = {"frames": 300, "clients": 3, "packets": 1_000_000, "commands": 2000, "input_clients": 64}
+    if args.quick:
+        sizes = {"frames": 60, "clients": 3, "packets": 100_000, "commands": 200, "input_clients": 64}
+    results = run_suite(sizes, args.repeat, args.suite)
+
+    history = load_history(args.history)
+    host = machine()
+    references = reference_values(history, host, args.window)
+    regressions = find_regressions(results, references, args.threshold)
+    print_results(results, references, regressions)
+    violations = check_budget(results, args.fps, args.budget)
+    for violation in violations:
+        print(f"Harness overhead: {violation}")
+
+    if not args.no_record and not args.quick:
+        with open(args.history, 'a') as file:
+            file.write(json.dumps({"time": time.time(), "machine": host, "revision": revision(), "python": platform.python_version(),
+                                   "sizes": sizes, "results": results, "regressions": regressions}) + "\n")
+
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    if violations:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import math
+import numpy as np
+
+def incomplete_beta(a: float, b: float, x: float):
+    # Regularized incomplete beta function I_x(a, b) using the continued fraction from Numerical Recipes
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+
+    if x > (a + 1) / (a + b + 2):
+        return 1.0 - incomplete_beta(b, a, 1.0 - x)
+
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log1p(-x))
+
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    fraction = d
+    for m in range(1, 300):
+        m2 = 2 * m
+        numerator = m * (b - m) * x / ((a + m2 - 1) * (a + m2))
+        d = 1.0 + numerator * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + numerator / c
+        c = c if abs(c) > tiny else tiny
+        fraction *= d * c
+
+        numerator = -(a + m) * (a + b + m) * x / ((a + m2) * (a + m2 + 1))
+        d = 1.0 + numerator * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + numerator / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        fraction *= delta
+        if abs(delta - 1.0) < 1e-15:
+            break
+    return front * fraction / a
+
+def t_cdf(t: float, df: float):
+    tail = 0.5 * incomplete_beta(df / 2, 0.5, df / (df + t * t))
+    return 1.0 - tail if t >= 0 else tail
+
+def t_quantile(p: float, df: float):
+    # Inverse of the Student t CDF by bisection, exact to floating point precision for any df
+    if not 0.0 < p < 1.0:
+        raise ValueError(f"Quantile probability must be in (0, 1), got {p}")
+    if p < 0.5:
+        return -t_quantile(1.0 - p, df)
+
+    low, high = 0.0, 1.0
+    while t_cdf(high, df) < p:
+        high *= 2
+    for _ in range(200):
+        middle = (low + high) / 2
+        if t_cdf(middle, df) < p:
+            low = middle
+        else:
+            high = middle
+        if high - low < 1e-12 * max(1.0, high):
+            break
+    return (low + high) / 2
+
+def t_critical(n: int, confidence: float = 0.99):
+    # Two-sided critical value for the mean of n samples
+    return t_quantile(1.0 - (1.0 - confidence) / 2, n - 1)
+
+def compute_confidence_interval(mean, std_dev, n, confidence=0.99):
+    margin_of_error = t_critical(n, confidence) * (std_dev / math.sqrt(n))
+    return (mean - margin_of_error, mean + margin_of_error)
+
+def relative_half_width(samples, confidence=0.99):
+    n = len(samples)
+    if n < 2:
+        return math.inf
+    mean = np.mean(samples)
+    if mean == 0:
+        return 0.0 if np.std(samples) == 0 else math.inf
+    return t_critical(n, confidence) * np.std(samples, ddof=1) / math.sqrt(n) / abs(mean)
+
+class RunPlan:
+    # Iterates over the run indices of one configuration. With a fixed plan it yields WARMUPS + RUNS
+    # indices, the adaptive plan keeps going after RUNS measured runs until the relative CI half-width
+    # of every metric drops below the target or max_runs measured runs are reached.
+    def __init__(self, warmups: int, runs: int, confidence: float = 0.99, adaptive: bool = False,
+                 max_runs: int = 25, target_relative_half_width: float = 0.05, metrics=()):
+        self.warmups = warmups
+        self.runs = runs
+        self.confidence = confidence
+        self.adaptive = adaptive
+        self.max_runs = max(max_runs, runs)
+        self.target = target_relative_half_width
+        self.metrics = list(metrics)
+        self.samples = {metric: [] for metric in self.metrics}
+        self.measured = 0
+        self.resumed = 0
+        self.offset = 0
+        self.failures = 0
+        self.max_failures = runs  # Repeated failed runs before the configuration is given up
+
+    def resume(self, samples: list, last_index: int = 0):
+        # Continues a configuration with the runs measured before, e.g. by an interrupted sweep. Warmups are
+        # repeated and new runs are numbered after last_index.
+        for sample in samples:
+            self.add(sample)
+        self.resumed = len(samples)
+        self.offset = max(last_index - self.warmups, 0)
+
+    def __iter__(self):
+        i = 1
+        while True:
+            if self.complete(self.resumed + max(i - 1 - self.warmups - self.failures, 0)):
+                return
+            if self.failures > self.max_failures:
+                print(f"Giving up after {self.failures} failed runs, the missing runs are repeated by the next sweep.")
+                return
+            yield i if i <= self.warmups else i + self.offset
+            i += 1
+
+    def complete(self, measured: int = None):
+        measured = self.measured if measured is None else measured
+        return measured >= self.runs and (not self.adaptive or self.converged() or measured >= self.max_runs)
+
+    def fail(self):
+        # A measured run without a valid result is not stored and repeated with the next index
+        self.failures += 1
+
+    def add(self, sample: dict):
+        self.measured += 1
+        for metric in self.metrics:
+            self.samples[metric].append(sample.get(metric, 0))
+
+    def converged(self):
+        return all(relative_half_width(values, self.confidence) <= self.target for values in self.samples.values())
+
+    def report(self):
+        widths = ", ".join(f"{metric} {relative_half_width(values, self.confidence):.2%}" for metric, values in self.samples.items())
+        return f"{self.measured} runs, relative CI half-width: {widths}"
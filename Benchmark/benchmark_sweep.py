@@ -0,0 +1,153 @@
+import csv
+import json
+import time
+import sqlite3
+import threading
+import numbers
+import hashlib
+import argparse
+from benchmark_tracing import traced
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS configurations (
+    id INTEGER PRIMARY KEY,
+    benchmark TEXT NOT NULL,
+    process TEXT NOT NULL,
+    build_hash TEXT NOT NULL,
+    num_objects INTEGER NOT NULL,
+    num_clients INTEGER NOT NULL,
+    scenario TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    UNIQUE (benchmark, build_hash, num_objects, num_clients, scenario, variant)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    configuration_id INTEGER NOT NULL REFERENCES configurations (id),
+    run_index INTEGER NOT NULL,
+    created REAL NOT NULL,
+    UNIQUE (configuration_id, run_index)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    metric TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, metric)
+);
+CREATE INDEX IF NOT EXISTS runs_configuration ON runs (configuration_id);
+"""
+
+def scenario_hash(scenario):
+    return hashlib.sha256(json.dumps(scenario.definition()).encode()).hexdigest()[:16]
+
+def flatten_sample(results: dict, resources: dict = None, scenario: dict = None):
+    # One flat metric dict per run, resource aggregates are stored as "<role>.<metric>" and the input timing
+    # of the scenario (ScenarioResult.statistics) as "scenario_<metric>"
+    # Numpy scalars are stored as plain floats, everything that is not a number (e.g. per flow lists) is skipped
+    def number(value):
+        return float(value) if isinstance(value, numbers.Real) else None
+
+    sample = {metric: number(value) for metric, value in results.items() if value is None or isinstance(value, numbers.Real)}
+    for metric, value in (scenario or {}).items():
+        sample[f"scenario_{metric}"] = number(value)
+    for role, metrics in (resources or {}).items():
+        for metric, value in metrics.items():
+            sample[f"{role}.{metric}"] = number(value)
+    return sample
+
+def split_sample(sample: dict):
+    # Inverse of flatten_sample, returns the results and the resources (None if none were sampled)
+    results = {}
+    resources = {}
+    for metric, value in sample.items():
+        if '.' in metric:
+            role, name = metric.split('.', 1)
+            resources.setdefault(role, {})[name] = value
+        else:
+            results[metric] = value
+    return results, resources or None
+
+class SweepStore:
+    # Raw per run samples of every benchmark configuration. Each run is committed as soon as it is
+    # measured, so an interrupted sweep resumes with the runs that are still missing. One store can be shared
+    # by the threads of parallel benchmark instances.
+    def __init__(self, path: str = "benchmark_results.sqlite"):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def configuration(self, benchmark: str, process: str, build_hash: str, num_objects: int, num_clients: int, scenario: str, variant: str = ""):
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO configurations (benchmark, process, build_hash, num_objects, num_clients, scenario, variant) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (benchmark, process, build_hash, num_objects, num_clients, scenario, variant))
+            return self.connection.execute(
+                "SELECT id FROM configurations WHERE benchmark = ? AND build_hash = ? AND num_objects = ? AND num_clients = ? AND scenario = ? AND variant = ?",
+                (benchmark, build_hash, num_objects, num_clients, scenario, variant)).fetchone()[0]
+
+    @traced("store.add_run")
+    def add_run(self, configuration: int, run_index: int, sample: dict):
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM samples WHERE run_id IN (SELECT id FROM runs WHERE configuration_id = ? AND run_index = ?)", (configuration, run_index))
+                self.connection.execute("DELETE FROM runs WHERE configuration_id = ? AND run_index = ?", (configuration, run_index))
+                run = self.connection.execute("INSERT INTO runs (configuration_id, run_index, created) VALUES (?, ?, ?)",
+                                              (configuration, run_index, time.time())).lastrowid
+                self.connection.executemany("INSERT INTO samples (run_id, metric, value) VALUES (?, ?, ?)",
+                                            [(run, metric, value) for metric, value in sample.items()])
+
+    def samples(self, configuration: int):
+        # Samples of the measured runs in run order
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT runs.run_index, samples.metric, samples.value FROM runs JOIN samples ON samples.run_id = runs.id "
+                "WHERE runs.configuration_id = ? ORDER BY runs.run_index", (configuration,)).fetchall()
+            runs = {}
+            for run_index, metric, value in rows:
+                runs.setdefault(run_index, {})[metric] = value
+            return [runs[run_index] for run_index in sorted(runs)]
+
+    def last_run_index(self, configuration: int):
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(MAX(run_index), 0) FROM runs WHERE configuration_id = ?", (configuration,)).fetchone()[0]
+
+    def configurations(self, benchmark: str):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT id, process, build_hash, num_objects, num_clients, scenario, variant FROM configurations "
+                "WHERE benchmark = ? ORDER BY id", (benchmark,)).fetchall()
+
+    def export_csv(self, benchmark: str, csv_path: str, header: list, statistics_row):
+        # Writes the aggregates of every configuration with samples, statistics_row(process, num_objects,
+        # samples) computes one row from the raw samples or None to skip the configuration
+        with open(csv_path, mode='w', newline='') as csv_file:
+            csv_writer = csv.writer(csv_file)
+            csv_writer.writerow(header)
+            for configuration, process, _, num_objects, _, _, _ in self.configurations(benchmark):
+                samples = self.samples(configuration)
+                if len(samples) > 1:
+                    row = statistics_row(process, num_objects, samples)
+                    if row is not None:
+                        csv_writer.writerow(row)
+
+def main():
+    parser = argparse.ArgumentParser(description="Lists the configurations and run counts in a benchmark results database.")
+    parser.add_argument("database", nargs='?', default="benchmark_results.sqlite")
+    parser.add_argument("--benchmark", default=None)
+    args = parser.parse_args()
+
+    store = SweepStore(args.database)
+    benchmarks = [args.benchmark] if args.benchmark else [row[0] for row in store.connection.execute("SELECT DISTINCT benchmark FROM configurations")]
+    for benchmark in benchmarks:
+        for configuration, process, build, num_objects, num_clients, scenario, variant in store.configurations(benchmark):
+            print(f"{benchmark} {process} {variant or '-'} build {build[:12]} objects {num_objects} clients {num_clients} "
+                  f"scenario {scenario}: {len(store.samples(configuration))} runs")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import numpy as np
+
+class TrafficTimeSeries:
+    # Fixed memory accumulation of the server traffic into time bins, split per client flow.
+    # Flows are keyed by the ephemeral UDP port of the client, everything beyond max_flows
+    # is folded into the last flow slot (port 0).
+    def __init__(self, port: int, origin_ns: int, bin_ms: float = 16.0, max_duration_s: float = 120.0,
+                 max_flows: int = 32, size_bin_width: int = 64, max_packet_size: int = 1536):
+        self.port = port
+        self.origin_ns = origin_ns
+        self.bin_ns = int(bin_ms * 1_000_000)
+        self.num_bins = int(np.ceil(max_duration_s * 1e9 / self.bin_ns))
+        self.max_flows = max_flows
+        self.size_edges = np.arange(0, max_packet_size + size_bin_width, size_bin_width)
+        num_sizes = len(self.size_edges)  # last size bin collects everything above max_packet_size
+
+        self.bytes_to_server = np.zeros((max_flows, self.num_bins), dtype=np.int64)
+        self.bytes_from_server = np.zeros((max_flows, self.num_bins), dtype=np.int64)
+        self.packets_to_server = np.zeros((max_flows, self.num_bins), dtype=np.int32)
+        self.packets_from_server = np.zeros((max_flows, self.num_bins), dtype=np.int32)
+        self.size_histogram = np.zeros((max_flows, 2, num_sizes), dtype=np.int64)
+
+        self.flow_ports = np.zeros(max_flows, dtype=np.uint16)
+        self.flow_lookup = np.full(1 << 16, -1, dtype=np.int32)
+        self.num_flows = 0
+        self.last_bin = -1
+        self.dropped_packets = 0
+
+    def flow_indices(self, client_ports: np.ndarray):
+        for client_port in np.unique(client_ports[self.flow_lookup[client_ports] < 0]):
+            if self.num_flows < self.max_flows - 1:
+                self.flow_lookup[client_port] = self.num_flows
+                self.flow_ports[self.num_flows] = client_port
+                self.num_flows += 1
+            else:
+                self.flow_lookup[client_port] = self.max_flows - 1
+        return self.flow_lookup[client_ports]
+
+    def add(self, timestamps: np.ndarray, lengths: np.ndarray, valid: np.ndarray, src_ports: np.ndarray, dst_ports: np.ndarray):
+        to_server = valid & (dst_ports == self.port)
+        from_server = valid & ~to_server & (src_ports == self.port)
+        bins = (timestamps - self.origin_ns) // self.bin_ns
+        in_range = (to_server | from_server) & (bins >= 0) & (bins < self.num_bins)
+        self.dropped_packets += int(np.count_nonzero((to_server | from_server) & ~in_range))
+        if not in_range.any():
+            return
+
+        to_server = to_server[in_range]
+        bins = bins[in_range]
+        lengths = lengths[in_range]
+        client_ports = np.where(to_server, src_ports[in_range], dst_ports[in_range]).astype(np.intp)
+        flows = self.flow_indices(client_ports)
+        sizes = np.minimum(np.searchsorted(self.size_edges, lengths, side='right') - 1, len(self.size_edges) - 1)
+
+        np.add.at(self.bytes_to_server, (flows[to_server], bins[to_server]), lengths[to_server])
+        np.add.at(self.packets_to_server, (flows[to_server], bins[to_server]), 1)
+        np.add.at(self.bytes_from_server, (flows[~to_server], bins[~to_server]), lengths[~to_server])
+        np.add.at(self.packets_from_server, (flows[~to_server], bins[~to_server]), 1)
+        np.add.at(self.size_histogram, (flows, np.where(to_server, 0, 1), sizes), 1)
+        self.last_bin = max(self.last_bin, int(bins.max()))
+
+    def used_flows(self):
+        # The overflow slot is only reported when it was used
+        if self.num_flows == self.max_flows - 1 and (self.packets_to_server[-1].any() or self.packets_from_server[-1].any()):
+            return self.max_flows
+        return self.num_flows
+
+    def summary(self):
+        flows = self.used_flows()
+        seconds_per_bin = self.bin_ns / 1e9
+        total = self.bytes_to_server[:flows].sum(axis=0) + self.bytes_from_server[:flows].sum(axis=0)
+        return {
+            "flows": flows,
+            "peak_bytes_per_second_to_server": float(self.bytes_to_server[:flows].sum(axis=0).max(initial=0) / seconds_per_bin),
+            "peak_bytes_per_second_from_server": float(self.bytes_from_server[:flows].sum(axis=0).max(initial=0) / seconds_per_bin),
+            "peak_bytes_per_second_total": float(total.max(initial=0) / seconds_per_bin),
+            "bytes_from_server_per_flow": self.bytes_from_server[:flows].sum(axis=1).tolist(),
+            "dropped_packets": self.dropped_packets,
+        }
+
+    def save(self, path: str):
+        # Columnar npz file, trimmed to the flows and bins that were actually used
+        flows = self.used_flows()
+        bins = self.last_bin + 1
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez_compressed(
+            path,
+            port=self.port,
+            origin_ns=self.origin_ns,
+            bin_ns=self.bin_ns,
+            flow_ports=self.flow_ports[:flows],
+            bytes_to_server=self.bytes_to_server[:flows, :bins],
+            bytes_from_server=self.bytes_from_server[:flows, :bins],
+            packets_to_server=self.packets_to_server[:flows, :bins],
+            packets_from_server=self.packets_from_server[:flows, :bins],
+            size_edges=self.size_edges,
+            size_histogram=self.size_histogram[:flows],
+            dropped_packets=self.dropped_packets,
+        )
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import functools
+import itertools
+import threading
+
+class Span:
+    # Context manager of one enabled span
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name: str):
+        self.tracer = tracer
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+class NullSpan:
+    # Shared by every span while tracing is disabled
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Tracer:
+    # Records spans of all threads into a preallocated ring buffer of (name, start ns, end ns, pid, thread)
+    # tuples. Only the newest capacity spans are exported, the per name totals of the summary cover all of them.
+    # Timestamps are perf_counter_ns, which is system wide on Linux and Windows, so the spans of worker
+    # processes line up with the ones of the controller.
+    def __init__(self, capacity: int = 65536):
+        self.enabled = False
+        self.capacity = capacity
+        self.events = [None] * capacity
+        self.counter = itertools.count()
+        self.count = 0
+        self.totals = {}  # name -> [count, total ns, max ns]
+        self.thread_names = {}
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    def start(self, capacity: int = None):
+        if capacity and capacity != self.capacity:
+            self.capacity = capacity
+        self.events = [None] * self.capacity
+        self.counter = itertools.count()
+        self.count = 0
+        self.totals = {}
+        self.thread_names = {}
+        self.pid = os.getpid()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def record(self, name: str, start_ns: int, end_ns: int, pid: int = None, thread: int = None):
+        if thread is None:
+            thread = threading.get_ident()
+            if thread not in self.thread_names:
+                self.thread_names[thread] = threading.current_thread().name
+        index = next(self.counter)
+        self.events[index % self.capacity] = (name, start_ns, end_ns, pid or self.pid, thread)
+        self.count = index + 1
+
+        duration = end_ns - start_ns
+        with self.lock:
+            totals = self.totals.get(name)
+            if totals is None:
+                self.totals[name] = [1, duration, duration]
+            else:
+                totals[0] += 1
+                totals[1] += duration
+                if duration > totals[2]:
+                    totals[2] = duration
+
+    def span(self, name: str):
+        return Span(self, name) if self.enabled else NULL_SPAN
+
+    def recorded(self):
+        # Recorded spans in recording order
+        if self.count <= self.capacity:
+            events = self.events[:self.count]
+        else:
+            slot = self.count % self.capacity
+            events = self.events[slot:] + self.events[:slot]
+        return [event for event in events if event is not None]
+
+    def drain(self):
+        # Spans and thread names of this process, e.g. to hand them from a worker to the controller
+        events = self.recorded()
+        self.start()
+        return {"events": events, "threads": dict(self.thread_names)}
+
+    def merge(self, drained: dict):
+        for name, start_ns, end_ns, pid, thread in drained["events"]:
+            self.record(name, start_ns, end_ns, pid, thread)
+        self.thread_names.update(drained["threads"])
+
+    def export(self, path: str):
+        # Chrome trace event format, opens in chrome://tracing and ui.perfetto.dev
+        events = self.recorded()
+        origin = min([event[1] for event in events], default=0)
+        trace = [{
+            "name": name,
+            "ph": "X",
+            "ts": (start_ns - origin) / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": pid,
+            "tid": thread,
+        } for name, start_ns, end_ns, pid, thread in events]
+        trace += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": {"name": self.thread_names.get(thread, str(thread))}}
+                  for pid, thread in sorted({(event[3], event[4]) for event in events})]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+        print(f"Trace with {len(events)} spans written to {path}")
+
+    def summary(self, wall_ns: int = None):
+        # Per phase totals sorted by their share of the time, phases of concurrent threads can add up to
+        # more than the wall time
+        with self.lock:
+            totals = sorted(self.totals.items(), key=lambda item: item[1][1], reverse=True)
+        lines = [f"{'Phase':<32}{'Count':>8}{'Total s':>10}{'Mean ms':>10}{'Max ms':>10}" + (f"{'Wall %':>8}" if wall_ns else "")]
+        for name, (count, total, longest) in totals:
+            line = f"{name:<32}{count:>8}{total / 1e9:>10.2f}{total / count / 1e6:>10.2f}{longest / 1e6:>10.2f}"
+            if wall_ns:
+                line += f"{total / wall_ns * 100:>8.1f}"
+            lines.append(line)
+        return "\n".join(lines)
+
+TRACER = Tracer()
+
+def span(name: str):
+    # with span("phase"): ... records the block while tracing is enabled
+    return TRACER.span(name)
+
+def traced(name: str = None):
+    # Decorator recording every call of the function as a span named after it
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                TRACER.record(span_name, start, time.perf_counter_ns())
+        return wrapper
+    return decorator
+
+def enable_tracing(enabled: bool, capacity: int = 65536):
+    # Initializer of worker processes, so their spans can be drained into the controller trace
+    if enabled:
+        TRACER.start(capacity)
+
+def run_traced(function, *args, **kwargs):
+    # Runs a function in a worker process and returns its result together with the spans it recorded
+    result = function(*args, **kwargs)
+    return result, TRACER.drain() if TRACER.enabled else None
+
+def finish_trace(directory: str, benchmark: str, wall_ns: int):
+    # Exports the trace of a sweep and prints the per phase summary
+    TRACER.stop()
+    TRACER.export(os.path.join(directory, f"{benchmark}_{time.strftime('%Y%m%d_%H%M%S')}.json"))
+    print(TRACER.summary(wall_ns))
@@ -1,13 +1,23 @@
 import time
 import sys
 import os
-import csv
-import pyshark
 import threading
-import asyncio
 import numpy as np
 import math
+from benchmark_scenario import Scenario, DEFAULT_SCENARIO, run_scenario
 from benchmark_harness import BenchmarkHarnessNetwork, BenchmarkHarnessBase
+from benchmark_harness_async import BenchmarkHarnessNetworkAsync
+from benchmark_capture import create_capture_backend
+from benchmark_pcap import create_pcap_recorder, analyze_segments, segment_series, PcapIndex
+from benchmark_timeseries import TrafficTimeSeries
+from benchmark_relay import UdpRelay, ImpairmentProfile
+from benchmark_cache import process_name, build_hash
+from benchmark_agent import connect_agents
+from benchmark_parallel import ParallelScheduler, FrameworkInstance
+from benchmark_sweep import SweepStore, scenario_hash, flatten_sample, split_sample
+from benchmark_stats import RunPlan, compute_confidence_interval
+from benchmark_resources import resource_row, RESOURCE_COLUMNS
+from benchmark_tracing import TRACER, span, traced, finish_trace
 
 def main():
     PROCESS_PATHS = [
@@ -19,178 +29,329 @@ def main():
     WARMUPS = 0
     RUNS = 2
     NUM_CLIENTS = 3
+    ASYNC_HARNESS = False  # Launch and drive all clients concurrently, use for large NUM_CLIENTS
+    HEADLESS = True  # Launch the builds with "-batchmode -nographics", the traffic benchmark never captures their windows
     START_OBJECTS = 49
     END_OBJECTS = 49
     CONFIDENCE_LEVEL = 0.99
+    ADAPTIVE_RUNS = False  # Keep running after RUNS until the CI is narrow enough (not available in pcap mode)
+    MAX_RUNS = 25
+    TARGET_RELATIVE_HALF_WIDTH = 0.05
     UDP_PORT = 24856  # Replace with the port number used by the frameworks
-    INTERFACE = r"\Device\NPF_Loopback"  # Replace with your loopback interface (e.g., "lo" for Linux, "\Device\NPF_Loopback" for Windows)
+    INTERFACE = "lo" if sys.platform.startswith("linux") else r"\Device\NPF_Loopback"  # Loopback interface, replace to capture another one
+    CAPTURE_BACKEND = "auto"  # "raw" (Linux raw socket), "pyshark" or "auto"
+    CAPTURE_MODE = "live"  # "live" captures each run separately, "pcap" records the whole sweep once and analyzes it offline,
+                           # "relay" routes the clients through an impairing UDP relay that also counts the traffic
+    PCAP_RECORDER = "auto"  # "raw" (Linux raw socket), "dumpcap" (Wireshark) or "auto"
+    SERIES_DIRECTORY = "benchmark_traffic_series"  # Per run time series and per client flows, None to disable
+    SERIES_BIN_MS = 16.0
+    RESOURCE_SAMPLE_HZ = 10  # Per process CPU and memory sampling rate, 0 to disable
+    RELAY_PORT = 24857  # Clients are started with "-port RELAY_PORT" in relay mode
+    AGENTS = {}  # Remote agents started with "python benchmark_agent.py" on other nodes, e.g. {"node1": "192.168.0.11:24900"}
+    PLACEMENT = {}  # Roles placed on agents, e.g. {"server": "node1", "client_0": "node2"}, the others run locally
+    CAPTURE_AGENT = None  # Agent that captures the traffic in live mode, e.g. the one running the server. None captures locally
+    CAPTURE_AGENT_INTERFACE = "eth0"
+    PARALLEL_INSTANCES = 1  # Frameworks benchmarked at once, each on its own ports (UDP_PORT + 2 * slot) and cores
+    IMPAIRMENT_PROFILES = [
+        ImpairmentProfile("none"),
+        ImpairmentProfile("broadband", latency_ms=15, jitter_ms=2),
+        ImpairmentProfile("mobile", latency_ms=60, jitter_ms=15, loss=0.02, reorder=0.01, bandwidth_kbps=5000),
+    ]
+    RESULTS_DATABASE = "benchmark_results.sqlite"  # Raw samples of every run, shared with the visual benchmark
+    TRACE = False  # Records the time spent in each phase, exported as a Chrome trace with a per phase summary
+    TRACE_DIRECTORY = "benchmark_traces"
 
     if (RUNS < 2):
         print("Runs must be larger than 1 to compute meaningful means and CI!")
         return
+    if (PLACEMENT or CAPTURE_AGENT) and (ASYNC_HARNESS or CAPTURE_MODE != "live"):
+        print("Agents are only supported by the synchronous harness in live capture mode!")
+        return
 
     # Change working directory to current file
     script_directory = os.path.dirname(os.path.abspath(__file__)) 
     os.chdir(script_directory)
+    if TRACE:
+        TRACER.start()
+    sweep_start = time.perf_counter_ns()
 
-    with open(r"benchmark_traffic_results.csv", mode='a', newline='') as csv_file:
-        csv_writer = csv.writer(csv_file)
-        """
-        csv_writer.writerow([
-            "Process",
-            "Number of Objects", 
-            "Runs",
-            "Mean Bytes To Server", 
-            "Mean Bytes From Server", 
-            "Mean Total Bytes", 
-            "StdDev Total Bytes", 
-            "Error Total Bytes", 
-            "CI Total Bytes",
-            "Mean Packets To Server", 
-            "Mean Packets From Server", 
-            "Mean Total Packets", 
-            "StdDev Total Packets", 
-            "Error Total Packets", 
-            "CI Total Packets"
-        ])
-        """
+    # Every measured run is stored right away, an interrupted sweep continues with the missing runs of each
+    # configuration and the CSV file is exported from all stored runs
+    store = SweepStore(RESULTS_DATABASE)
+    scenario_key = scenario_hash(DEFAULT_SCENARIO)
+    agents = connect_agents(AGENTS)
+    placement_options = {"agents": agents, "placement": PLACEMENT} if PLACEMENT else {}
+    capture_agent = agents[CAPTURE_AGENT] if CAPTURE_AGENT else None
 
-        for path in PROCESS_PATHS:
-            harness = BenchmarkHarnessNetwork(path, NUM_CLIENTS)
+    def open_plan(path, process, num_objects, variant, adaptive):
+        configuration = store.configuration("traffic", process, build_hash(path), num_objects, NUM_CLIENTS, scenario_key, variant)
+        plan = RunPlan(WARMUPS, RUNS, CONFIDENCE_LEVEL, adaptive, MAX_RUNS, TARGET_RELATIVE_HALF_WIDTH, TRAFFIC_METRICS)
+        plan.resume(store.samples(configuration), store.last_run_index(configuration))
+        if plan.resumed:
+            print(f"{process}, {num_objects} objects: resuming after {plan.resumed} stored runs")
+        return configuration, plan
+
+    def run_instance(instance: FrameworkInstance):
+        path = instance.path
+        port = instance.port
+        relay_port = instance.relay_port
+        if CAPTURE_MODE == "relay":
+            plans = {(profile.name, num_objects): open_plan(path, f"{path} ({profile.name})", num_objects, f"relay:{profile.name}", ADAPTIVE_RUNS)
+                     for profile in IMPAIRMENT_PROFILES for num_objects in range(START_OBJECTS, END_OBJECTS + 1, 1)}
+            if all(plan.complete() for _, plan in plans.values()):
+                print(f"All runs of {path} are stored, skipping.")
+                return
+
+            with span("harness.launch"):
+                harness = create_harness(path, NUM_CLIENTS, ASYNC_HARNESS, startup=instance.startup(), headless=HEADLESS, client_startup=f"-port {relay_port}")
+            instance.register(harness.process_ids())
+            for profile in IMPAIRMENT_PROFILES:
+                for num_objects in range(START_OBJECTS, END_OBJECTS + 1, 1):
+                    configuration, plan = plans[(profile.name, num_objects)]
+                    for i in plan:
+                        with span("relay.start"):
+                            relay = UdpRelay(relay_port, port, profile)
+                            relay.start()
+                        resources, scenario = run_benchmark(harness, num_objects, RESOURCE_SAMPLE_HZ)
+                        with span("relay.stop"):
+                            relay.stop()
 
-            for num_objects in range(START_OBJECTS, END_OBJECTS + 1, 1):
-                bytes_to_server = []
-                bytes_from_server = []
-                total_bytes = []
-                packets_to_server = []
-                packets_from_server = []
-                total_packets = []
+                        # Builds that do not read "-port" connect their clients straight to the server
+                        if relay.clients == 0:
+                            print(f"No client traffic passed the relay, {path} does not connect its clients to \"-port {relay_port}\". Skipping the relay mode.")
+                            del harness
+                            return
+                        if relay.clients < NUM_CLIENTS:
+                            print(f"{profile.name}, {num_objects} objects, run {i}: only {relay.clients} of {NUM_CLIENTS} clients used the relay, repeating the run.")
+                            if i > WARMUPS:
+                                plan.fail()
+                            continue
+
+                        if i > WARMUPS:
+                            results = relay.results()
+                            store.add_run(configuration, i, flatten_sample(results, resources, scenario))
+                            plan.add(results)
+
+                    print(f"{profile.name}, {num_objects} objects: {plan.report()}")
+
+            del harness
+            print(f"Completed benchmark.")
+            return
 
-                for i in range(1, WARMUPS + RUNS + 1, 1):
+        recorder = None
+        run_labels = {}
+        run_resources = {}
+        run_scenarios = {}
+        # Run results of the pcap mode are only known after the sweep, so it always uses a fixed plan
+        plans = {num_objects: open_plan(path, path, num_objects, CAPTURE_MODE, ADAPTIVE_RUNS and CAPTURE_MODE != "pcap")
+                 for num_objects in range(START_OBJECTS, END_OBJECTS + 1, 1)}
+        if all(plan.complete() for _, plan in plans.values()):
+            print(f"All runs of {path} are stored, skipping.")
+            return
+
+        with span("harness.launch"):
+            harness = create_harness(path, NUM_CLIENTS, ASYNC_HARNESS, startup=instance.startup(), headless=HEADLESS, **placement_options)
+        instance.register(harness.process_ids())
+
+        if CAPTURE_MODE == "pcap":
+            # Record the whole sweep of this process into one capture and analyze the runs afterwards
+            pcap_path = f"benchmark_traffic_{process_name(path)}.pcap"
+            recorder = create_pcap_recorder(PCAP_RECORDER, port, INTERFACE, pcap_path)
+            recorder.start()
+            time.sleep(1)
+
+        for num_objects in range(START_OBJECTS, END_OBJECTS + 1, 1):
+            configuration, plan = plans[num_objects]
+            run_labels[num_objects] = []
+
+            for i in plan:
+                if recorder:
+                    label = f"{num_objects}_{i}"
+                    recorder.mark_start(label)
+                    resources, scenario = run_benchmark(harness, num_objects, RESOURCE_SAMPLE_HZ)
+                    recorder.mark_stop(label)
+
+                    if i > WARMUPS:
+                        run_labels[num_objects].append((i, label))
+                        run_resources[label] = resources
+                        run_scenarios[label] = scenario
+                    continue
+
+                series = None
+                if capture_agent:
+                    capture_agent.start_traffic_capture(port, CAPTURE_AGENT_INTERFACE, CAPTURE_BACKEND)
+                else:
                     cancel_event = threading.Event()
                     capture_results = {}
-                    capture_thread = threading.Thread(target=capture_traffic, args=(cancel_event, capture_results, UDP_PORT, INTERFACE))
+                    series = TrafficTimeSeries(port, time.time_ns(), SERIES_BIN_MS) if SERIES_DIRECTORY else None
+                    capture_thread = threading.Thread(target=capture_traffic, args=(cancel_event, capture_results, port, INTERFACE, CAPTURE_BACKEND, series))
                     capture_thread.start()
+                with span("capture.warmup"):
                     time.sleep(1)
-                    
-                    harness.start(num_objects)
-                    benchmark(harness)
-                    harness.stop()
 
-                    cancel_event.set()
-                    capture_thread.join()
+                resources, scenario = run_benchmark(harness, num_objects, RESOURCE_SAMPLE_HZ)
 
-                    if i > WARMUPS:
-                        bytes_to_server.append(capture_results.get("bytes_to_server", 0))
-                        bytes_from_server.append(capture_results.get("bytes_from_server", 0))
-                        total_bytes.append(capture_results.get("total_bytes", 0))
-                        packets_to_server.append(capture_results.get("packets_to_server", 0))
-                        packets_from_server.append(capture_results.get("packets_from_server", 0))
-                        total_packets.append(capture_results.get("total_packets", 0))
-
-                # Compute statistics
-                avg_bytes_to_server = np.mean(bytes_to_server)
-                avg_bytes_from_server = np.mean(bytes_from_server)
-                avg_total_bytes = np.mean(total_bytes)
-                std_total_bytes = np.std(total_bytes, ddof=1)
-                err_total_bytes = std_total_bytes / math.sqrt(RUNS)
-                ci_total_bytes = compute_confidence_interval(avg_total_bytes, std_total_bytes, RUNS, CONFIDENCE_LEVEL)
-
-                avg_packets_to_server = np.mean(packets_to_server)
-                avg_packets_from_server = np.mean(packets_from_server)
-                avg_total_packets = np.mean(total_packets)
-                std_total_packets = np.std(total_packets, ddof=1)
-                err_total_packets = std_total_packets / math.sqrt(RUNS)
-                ci_total_packets = compute_confidence_interval(avg_total_packets, std_total_packets, RUNS, CONFIDENCE_LEVEL)
-
-                csv_writer.writerow([
-                    path,
-                    num_objects,
-                    RUNS,
-                    avg_bytes_to_server,
-                    avg_bytes_from_server,
-                    avg_total_bytes,
-                    std_total_bytes,
-                    err_total_bytes,
-                    f"{str(ci_total_bytes[0])}-{str(ci_total_bytes[1])}",
-                    avg_packets_to_server,
-                    avg_packets_from_server,
-                    avg_total_packets,
-                    std_total_packets,
-                    err_total_packets,
-                    f"{str(ci_total_packets[0])}-{str(ci_total_packets[1])}",
-                ])
+                if capture_agent:
+                    capture_results = capture_agent.stop_traffic_capture()
+                else:
+                    with span("capture.join"):
+                        cancel_event.set()
+                        capture_thread.join()
 
-            del harness
-            print(f"Completed benchmark.")
-        print(f"Completed all benchmarks.")
-
-def benchmark(harness: BenchmarkHarnessBase):
-    harness.directional_input_client(0, 0.0,  1.0)
-    time.sleep(3)
-    harness.directional_input_client(0, 1.0, -1.0)
-    time.sleep(1)
-    harness.directional_input_client(0, 0.0,  0.0)
-    
-    harness.directional_input_client(1, 0.0,  1.0)
-    time.sleep(5)
-    harness.directional_input_client(1, 0.0,  0.0)
-
-def capture_traffic(cancel_event, results, port, interface):
-    # Create an event loop in this thread
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
-    capture = pyshark.LiveCapture(interface=interface, bpf_filter=f"udp port {port}")
-    bytes_to_server = 0
-    bytes_from_server = 0
-    packets_to_server = 0
-    packets_from_server = 0
-
-    print("Traffic capture started...")
-    try:
-        for packet in capture.sniff_continuously():
-            if cancel_event.is_set():
-                break
-
-            if hasattr(packet, 'udp') and hasattr(packet, 'length'):
-                packet_length = int(packet.length)
-
-                # Check if the captured port is the destination or source
-                if int(packet.udp.dstport) == port:
-                    # Traffic to the server
-                    bytes_to_server += packet_length
-                    packets_to_server += 1
-                elif int(packet.udp.srcport) == port:
-                    # Traffic from the server
-                    bytes_from_server += packet_length
-                    packets_from_server += 1
-
-    except Exception as e:
-        print(f"Error during traffic capture: {e}")
-    finally:
-        capture.close()
-
-    # Store results
-    results["bytes_to_server"] = bytes_to_server
-    results["bytes_from_server"] = bytes_from_server
-    results["total_bytes"] = bytes_to_server + bytes_from_server
-    results["packets_to_server"] = packets_to_server
-    results["packets_from_server"] = packets_from_server
-    results["total_packets"] = packets_to_server + packets_from_server
-
-    print("Traffic capture stopped.")
-
-def compute_confidence_interval(mean, std_dev, n, confidence=0.99):
-    # Approximate t-critical value for df = 25 - 1 from https://people.richland.edu/james/lecture/m170/tbl-t.html
-    t_critical = {
-        0.90: 1.711,  # 90% confidence
-        0.95: 2.064,  # 95% confidence
-        0.99: 2.797   # 99% confidence
-    }.get(confidence)
-
-    margin_of_error = t_critical * (std_dev / math.sqrt(n))
-    return (mean - margin_of_error, mean + margin_of_error)
+                if i > WARMUPS:
+                    if "capture_error" in capture_results:
+                        print(f"{num_objects} objects, run {i}: {capture_results['capture_error']}, repeating the run.")
+                        plan.fail()
+                        continue
+                    store.add_run(configuration, i, flatten_sample(capture_results, resources, scenario))
+                    plan.add(capture_results)
+                    if series:
+                        save_series(series, SERIES_DIRECTORY, path, f"{num_objects}_{i}")
+
+            if not recorder:
+                print(f"{num_objects} objects: {plan.report()}")
+
+        if recorder:
+            recorder.stop()
+            if recorder.error:
+                # Nothing is stored, so the next sweep records the runs again
+                print(f"Recording of {path} failed, its runs are not stored: {recorder.error}")
+                del harness
+                return
+            with span("pcap.analyze"):
+                index = PcapIndex(pcap_path)
+                segments = {segment["label"]: segment for segment in analyze_segments(index, port, recorder.markers)}
+            if SERIES_DIRECTORY:
+                for marker in recorder.markers:
+                    if marker["label"] in run_resources:
+                        save_series(segment_series(index, port, marker, bin_ms=SERIES_BIN_MS), SERIES_DIRECTORY, path, marker["label"])
+            for num_objects, labels in run_labels.items():
+                configuration, _ = plans[num_objects]
+                for i, label in labels:
+                    store.add_run(configuration, i, flatten_sample(segments[label], run_resources[label], run_scenarios[label]))
+
+        del harness
+        print(f"Completed benchmark.")
+
+    if PARALLEL_INSTANCES > 1:
+        # Every instance gets its own game port, relay port and cores, so several frameworks share the host
+        ParallelScheduler(PROCESS_PATHS, run_instance, PARALLEL_INSTANCES, UDP_PORT).run()
+    else:
+        for path in PROCESS_PATHS:
+            instance = FrameworkInstance(path)
+            instance.assign(0, UDP_PORT, RELAY_PORT, None)
+            run_instance(instance)
+
+    store.export_csv("traffic", r"benchmark_traffic_results.csv", TRAFFIC_COLUMNS,
+                     lambda process, num_objects, samples: statistics_row(process, num_objects, samples, CONFIDENCE_LEVEL))
+    store.close()
+    for agent in agents.values():
+        agent.close()
+    if TRACE:
+        finish_trace(TRACE_DIRECTORY, "traffic", time.perf_counter_ns() - sweep_start)
+    print(f"Completed all benchmarks.")
+
+TRAFFIC_METRICS = ["total_bytes", "total_packets"]
+TRAFFIC_COLUMNS = [
+    "Process",
+    "Number of Objects",
+    "Runs",
+    "Mean Bytes To Server",
+    "Mean Bytes From Server",
+    "Mean Total Bytes",
+    "StdDev Total Bytes",
+    "Error Total Bytes",
+    "CI Total Bytes",
+    "Mean Packets To Server",
+    "Mean Packets From Server",
+    "Mean Total Packets",
+    "StdDev Total Packets",
+    "Error Total Packets",
+    "CI Total Packets",
+    *RESOURCE_COLUMNS
+]
+
+def create_harness(path: str, num_clients: int, use_async: bool, **kwargs):
+    if use_async:
+        return BenchmarkHarnessNetworkAsync(path, num_clients, **kwargs)
+    return BenchmarkHarnessNetwork(path, num_clients, **kwargs)
+
+def save_series(series: TrafficTimeSeries, directory: str, path: str, label: str):
+    series.save(os.path.join(directory, f"{process_name(path)}_{label}.npz"))
+    summary = series.summary()
+    print(f"Run {label}: {summary['flows']} flows, peak {summary['peak_bytes_per_second_total']:.0f} B/s, "
+          f"bytes from server per flow {summary['bytes_from_server_per_flow']}")
+
+@traced("run")
+def run_benchmark(harness: BenchmarkHarnessBase, num_objects: int, sample_hz: float = 0):
+    # Returns the resource samples (None without sampling) and the input timing statistics of the scenario
+    sampler = harness.resource_sampler(sample_hz) if sample_hz > 0 else None
+    if sampler:
+        sampler.start()
+
+    harness.start(num_objects)
+    statistics = benchmark(harness).statistics()
+    harness.stop()
+
+    if sampler:
+        sampler.stop()
+        return sampler.results(), statistics
+    return None, statistics
+
+def statistics_row(path, num_objects, samples: list[dict], confidence):
+    # One CSV row from the stored samples of a configuration
+    run_results, run_resources = zip(*[split_sample(sample) for sample in samples])
+    runs = len(run_results)
+    bytes_to_server = [results.get("bytes_to_server", 0) for results in run_results]
+    bytes_from_server = [results.get("bytes_from_server", 0) for results in run_results]
+    total_bytes = [results.get("total_bytes", 0) for results in run_results]
+    packets_to_server = [results.get("packets_to_server", 0) for results in run_results]
+    packets_from_server = [results.get("packets_from_server", 0) for results in run_results]
+    total_packets = [results.get("total_packets", 0) for results in run_results]
+
+    # Compute statistics
+    avg_bytes_to_server = np.mean(bytes_to_server)
+    avg_bytes_from_server = np.mean(bytes_from_server)
+    avg_total_bytes = np.mean(total_bytes)
+    std_total_bytes = np.std(total_bytes, ddof=1)
+    err_total_bytes = std_total_bytes / math.sqrt(runs)
+    ci_total_bytes = compute_confidence_interval(avg_total_bytes, std_total_bytes, runs, confidence)
+
+    avg_packets_to_server = np.mean(packets_to_server)
+    avg_packets_from_server = np.mean(packets_from_server)
+    avg_total_packets = np.mean(total_packets)
+    std_total_packets = np.std(total_packets, ddof=1)
+    err_total_packets = std_total_packets / math.sqrt(runs)
+    ci_total_packets = compute_confidence_interval(avg_total_packets, std_total_packets, runs, confidence)
+
+    return [
+        path,
+        num_objects,
+        runs,
+        avg_bytes_to_server,
+        avg_bytes_from_server,
+        avg_total_bytes,
+        std_total_bytes,
+        err_total_bytes,
+        f"{str(ci_total_bytes[0])}-{str(ci_total_bytes[1])}",
+        avg_packets_to_server,
+        avg_packets_from_server,
+        avg_total_packets,
+        std_total_packets,
+        err_total_packets,
+        f"{str(ci_total_packets[0])}-{str(ci_total_packets[1])}",
+    ] + resource_row([resources for resources in run_resources if resources])
+
+def benchmark(harness: BenchmarkHarnessBase, scenario: Scenario = DEFAULT_SCENARIO):
+    result = run_scenario(harness, scenario)
+    statistics = result.statistics()
+    print(f"Scenario {scenario.name}: {statistics['events']} inputs, mean lateness {statistics.get('mean_lateness_ms', 0):.3f}ms, "
+          f"p95 {statistics.get('p95_lateness_ms', 0):.3f}ms, jitter {statistics.get('jitter_ms', 0):.3f}ms")
+    return result
+
+@traced("capture.traffic")
+def capture_traffic(cancel_event, results, port, interface, backend="auto", series=None):
+    create_capture_backend(backend, port, interface).capture(cancel_event, results, series)
 
 if __name__ == "__main__":
     sys.exit(main())
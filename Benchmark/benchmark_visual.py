@@ -1,10 +1,17 @@
 import sys
 import os
-import csv
-import cv2
+import time
 import numpy as np
-import math
+from concurrent.futures import ProcessPoolExecutor
+from benchmark_scenario import Scenario, DEFAULT_SCENARIO, run_scenario
 from benchmark_harness import BenchmarkHarnessNetwork, BenchmarkHarnessLocal, BenchmarkHarnessBase
+from benchmark_analysis import analyze_run, remove_recordings, init_worker
+from benchmark_cache import BaselineCache, process_name, build_hash
+from benchmark_agent import connect_agents
+from benchmark_sweep import SweepStore, scenario_hash, flatten_sample, split_sample
+from benchmark_stats import RunPlan, compute_confidence_interval
+from benchmark_resources import resource_row, set_affinity, RESOURCE_COLUMNS
+from benchmark_tracing import TRACER, span, run_traced, finish_trace
 
 def main():
     PROCESS_PATHS = [
@@ -13,12 +20,33 @@ def main():
         r"../Projects/FishNet/Builds/Benchmark.exe",
         r"../Projects/Mirror/Builds/Benchmark.exe"
     ]
+    LOCAL_PROCESS_PATH = r"../Projects/Local/Builds/Benchmark.exe"
+    SCENARIO = DEFAULT_SCENARIO
     WARMUPS = 0
     RUNS = 2
     NUM_CLIENTS = 3
     START_OBJECTS = 49
     END_OBJECTS = 49
     CONFIDENCE_LEVEL = 0.99
+    ADAPTIVE_RUNS = False  # Keep running after RUNS until the CI is narrow enough
+    MAX_RUNS = 25
+    TARGET_RELATIVE_HALF_WIDTH = 0.05
+    FRAME_SOURCE = "auto"  # "win32", "x11" (e.g. under Xvfb) or "synthetic", auto picks by platform
+    FRAME_SCALE = 0.5  # Frames are stored as downscaled grayscale
+    FRAME_COMPRESSION = "none"  # "none", "zlib" or "lz4" (requires the lz4 package) per chunk
+    ROI_MASK = None  # Image with the size of the baseline frames, black pixels (e.g. UI) are excluded from the diff
+    RESOURCE_SAMPLE_HZ = 10  # Per process CPU and memory sampling rate, 0 to disable
+    BASELINE_CACHE_DIRECTORY = "benchmark_baseline_cache"
+    BASELINE_CACHE_MAX_GB = 4.0
+    RUN_DIRECTORY = "benchmark_visual_runs"  # Every run records into its own files, so it can be analyzed while the next one records
+    KEEP_RUN_RECORDINGS = False
+    ANALYSIS_WORKERS = 2
+    ANALYSIS_CPUS = None  # Cores of the analysis workers, the frameworks get the others. None uses the last quarter of the cores
+    AGENTS = {}  # Remote agents started with "python benchmark_agent.py" on other nodes, e.g. {"node1": "192.168.0.11:24900"}
+    PLACEMENT = {}  # Roles placed on agents, e.g. {"client_0": "node1"}, recordings are fetched from the agents after each run
+    RESULTS_DATABASE = "benchmark_results.sqlite"  # Raw samples of every run, shared with the traffic benchmark
+    TRACE = False  # Records the time spent in each phase, exported as a Chrome trace with a per phase summary
+    TRACE_DIRECTORY = "benchmark_traces"
 
     if (RUNS < 2):
         print("Runs must be larger than 1 to compute meaningful means and CI!")
@@ -27,176 +55,211 @@ def main():
     # Change working directory to current file
     script_directory = os.path.dirname(os.path.abspath(__file__)) 
     os.chdir(script_directory)
-
-    with open(r"benchmark_visuals_results.csv", mode='a', newline='') as csv_file:
-        csv_writer = csv.writer(csv_file)
-        csv_writer.writerow([
-            "Process",
-            "Number of Objects", 
-            "Runs",
-            "Mean Server Diff", 
-            "StdDev Server Diff", 
-            "Error Server Diff",
-            "CI Server Diff",
-            "Mean Clients Diff", 
-            "StdDev Clients Diff", 
-            "Error Clients Diff",
-            "CI Clients Diff"
-        ])
-
-        for path in PROCESS_PATHS:
-            local = BenchmarkHarnessLocal(r"../Projects/Local/Builds/Benchmark.exe", NUM_CLIENTS)
-            network = BenchmarkHarnessNetwork(path, NUM_CLIENTS)
-
-            LOCAL_VIDEO_PATH = "local.avi"
-            SERVER_VIDEO_PATH = "network_server.avi"
-            CLIENTS_VIDEO_PATH = [f"network_client_{i}.avi" for i in range(NUM_CLIENTS)]
-
-            for num_objects in range(START_OBJECTS, END_OBJECTS + 1, 1):
-
-                # Run the local baseline benchmark
-                local.start(num_objects)
-                local.process.start_capture(LOCAL_VIDEO_PATH)
-                benchmark(local)
-                local.process.stop_capture()
-                local.stop()
-                
-                server_diffs = []
-                client_diffs = []
-
-                for i in range(1, WARMUPS + RUNS + 1, 1): 
-
-                    # Run the network benchmark
-                    network.start(num_objects)
-                    network.server.start_capture(SERVER_VIDEO_PATH)
-                    for j, client in enumerate(network.clients):
-                        client.start_capture(CLIENTS_VIDEO_PATH[j])
-                    benchmark(network)
-                    for client in network.clients:
-                        client.stop_capture()
-                    network.server.stop_capture()
-                    network.stop()
-
-                    # Only include results if warmups are done
-                    if i > WARMUPS:
-                        # Compute and save differences between videos
-                        server_diffs.append(compute_difference(SERVER_VIDEO_PATH, LOCAL_VIDEO_PATH))
-                        client_diffs.append(compute_difference(compute_average_videos(CLIENTS_VIDEO_PATH), LOCAL_VIDEO_PATH))
-
-                # Compute averages
-                avg_server_diff = np.mean(server_diffs)
-                std_server_diff = np.std(server_diffs, ddof=1)
-                err_server_diff = std_server_diff / np.sqrt(RUNS)
-                ci_server_diff = compute_confidence_interval(avg_server_diff, std_server_diff, RUNS, CONFIDENCE_LEVEL)
-                avg_client_diff = np.mean(client_diffs)
-                std_client_diff = np.std(client_diffs, ddof=1)
-                err_client_diff = std_client_diff / np.sqrt(RUNS)
-                ci_client_diff = compute_confidence_interval(avg_client_diff, std_client_diff, RUNS, CONFIDENCE_LEVEL)
-
-                csv_writer.writerow([
-                    path,
-                    num_objects,
-                    RUNS,
-                    avg_server_diff,
-                    std_server_diff,
-                    err_server_diff,
-                    f"{str(ci_server_diff[0])}-{str(ci_client_diff[1])}",
-                    avg_client_diff,
-                    std_client_diff,
-                    err_client_diff,
-                    f"{str(ci_client_diff[0])}-{str(ci_client_diff[1])}",
-                ])
-
-            del network
-            del local
-            print(f"Completed benchmark.")    
-        print(f"Completed all benchmarks.")
-
-def benchmark(harness: BenchmarkHarnessBase):
-    harness.directional_input(0, 0.0,  1.0,  3)
-    harness.directional_input(0, 1.0, -1.0,  1)
-    harness.directional_input(1, 0.0,  1.0,  5)
-
-def compute_difference(video1_path: str, video2_path: str):
-    capture1 = cv2.VideoCapture(video1_path)
-    capture2 = cv2.VideoCapture(video2_path)
-
-    if not capture1.isOpened() or not capture2.isOpened():
-        print(f"Error opening videos: {video1_path}, {video2_path}")
-        return None
-
-    frame_diffs = []
-
-    while capture1.isOpened() and capture2.isOpened():
-        ret1, frame1 = capture1.read()
-        ret2, frame2 = capture2.read()
-
-        if not ret1 or not ret2:
-            break  # End of video
-
-        # Convert to grayscale
-        gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-        gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
-
-        # Compute absolute difference
-        diff = cv2.absdiff(gray1, gray2)
-        frame_diffs.append(np.mean(diff))
-
-    capture1.release()
-    capture2.release()
-
-    if frame_diffs:
-        return np.mean(frame_diffs)
-    return None
-
-def compute_average_videos(videos: list[str]):
-    captures = [cv2.VideoCapture(video) for video in videos]
-
-    if any(not capture.isOpened() for capture in captures):
-        print("Error opening one or more client videos.")
+    if TRACE:
+        TRACER.start()
+    sweep_start = time.perf_counter_ns()
+
+    # Lossless frame stores, a ".avi" extension records XVID videos instead
+    VIDEO_EXTENSION = ".frames"
+    capture_options = {"scale": FRAME_SCALE, "compression": FRAME_COMPRESSION}
+
+    # Every analyzed run is stored right away, an interrupted sweep continues with the missing runs of each
+    # configuration and the CSV file is exported from all stored runs
+    store = SweepStore(RESULTS_DATABASE)
+    scenario_key = scenario_hash(SCENARIO)
+    agents = connect_agents(AGENTS)
+
+    # Baselines only depend on the local build, the configuration and the scenario, so they are recorded
+    # once and shared by every framework and later sweeps
+    baseline_cache = BaselineCache(BASELINE_CACHE_DIRECTORY, int(BASELINE_CACHE_MAX_GB * 1024 ** 3), VIDEO_EXTENSION)
+    local = None  # Only launched once a baseline is missing from the cache
+
+    # Videos are compared in worker processes while the next run records, pinned to other cores than the frameworks
+    os.makedirs(RUN_DIRECTORY, exist_ok=True)
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    analysis_cpus = set(ANALYSIS_CPUS) if ANALYSIS_CPUS is not None else set(cpus[-max(len(cpus) // 4, 1):]) if len(cpus) > 1 else set()
+    framework_cpus = set(cpus) - analysis_cpus
+    analysis = ProcessPoolExecutor(ANALYSIS_WORKERS, initializer=init_worker, initargs=(analysis_cpus, TRACE))
+
+    for path in PROCESS_PATHS:
+        plans = {}
+        for num_objects in range(START_OBJECTS, END_OBJECTS + 1, 1):
+            configuration = store.configuration("visual", path, build_hash(path), num_objects, NUM_CLIENTS, scenario_key, VIDEO_EXTENSION)
+            plan = RunPlan(WARMUPS, RUNS, CONFIDENCE_LEVEL, ADAPTIVE_RUNS, MAX_RUNS, TARGET_RELATIVE_HALF_WIDTH, VISUAL_METRICS)
+            plan.resume([sample for sample in store.samples(configuration) if compared(sample)], store.last_run_index(configuration))
+            if plan.resumed:
+                print(f"{path}, {num_objects} objects: resuming after {plan.resumed} stored runs")
+            plans[num_objects] = (configuration, plan)
+        if all(plan.complete() for _, plan in plans.values()):
+            print(f"All runs of {path} are stored, skipping.")
+            continue
+
+        with span("harness.launch"):
+            network = BenchmarkHarnessNetwork(path, NUM_CLIENTS, frame_source=FRAME_SOURCE, agents=agents, placement=PLACEMENT)
+        for pid in network.process_ids().values():
+            set_affinity(pid, framework_cpus)
+
+        for num_objects in range(START_OBJECTS, END_OBJECTS + 1, 1):
+            configuration, plan = plans[num_objects]
+            if plan.complete():
+                continue
+
+            # Run the local baseline benchmark unless it is already cached
+            baseline_key = baseline_cache.key(LOCAL_PROCESS_PATH, num_objects, NUM_CLIENTS, SCENARIO, **capture_options)
+            baseline = baseline_cache.get(baseline_key)
+            if baseline is None:
+                with span("baseline.record"):
+                    if local is None:
+                        local = BenchmarkHarnessLocal(LOCAL_PROCESS_PATH, NUM_CLIENTS, frame_source=FRAME_SOURCE)
+                        set_affinity(local.process.process.pid, framework_cpus)
+                    local.start(num_objects)
+                    local.process.start_capture(baseline_cache.path(baseline_key), **capture_options)
+                    local_origin = benchmark(local, SCENARIO).first_input_ns()
+                    local.process.stop_capture()
+                    local.stop()
+                    baseline_cache.put(baseline_key, origin_ns=local_origin, num_objects=num_objects)
+                    baseline = baseline_cache.get(baseline_key)
+            local_video_path, local_metadata = baseline
+            local_origin = local_metadata["origin_ns"]
+
+            pending = []
+
+            def collect(i, future, resources, scenario):
+                # Spans of the worker are merged into the trace of the sweep
+                differences, spans = future.result()
+                if spans:
+                    TRACER.merge(spans)
+                results = {
+                    "server_diff": differences["server"].result() if differences else None,
+                    "client_diff": differences["clients"].result() if differences else None,
+                }
+                # No frame could be compared, e.g. a recording is missing. Runs failing after the last one was
+                # started are repeated by the next sweep.
+                if not compared(results):
+                    print(f"{num_objects} objects, run {i}: no frames could be compared, repeating the run.")
+                    plan.fail()
+                    return
+                store.add_run(configuration, i, flatten_sample(results, resources, scenario))
+                plan.add(results)
+
+            for i in plan:
+                run_prefix = os.path.join(RUN_DIRECTORY, f"{process_name(path)}_{num_objects}_{i}")
+                groups = {
+                    "server": [f"{run_prefix}_server{VIDEO_EXTENSION}"],
+                    "clients": [f"{run_prefix}_client_{j}{VIDEO_EXTENSION}" for j in range(NUM_CLIENTS)],
+                }
+
+                # Run the network benchmark
+                sampler = network.resource_sampler(RESOURCE_SAMPLE_HZ) if RESOURCE_SAMPLE_HZ > 0 else None
+                if sampler:
+                    sampler.start()
+                network.start(num_objects)
+                network.server.start_capture(groups["server"][0], **capture_options)
+                for j, client in enumerate(network.clients):
+                    client.start_capture(groups["clients"][j], **capture_options)
+                network_result = benchmark(network, SCENARIO)
+                for client in network.clients:
+                    client.stop_capture()
+                network.server.stop_capture()
+                network.stop()
+                if sampler:
+                    sampler.stop()
+
+                # Only include results if warmups are done
+                if i > WARMUPS:
+                    # Compare the server and the averaged client videos against the baseline in one pass, with
+                    # frames matched by their capture time relative to the first input of each run
+                    pending.append((i, analysis.submit(run_traced, analyze_run, local_video_path, groups, local_origin, network_result.first_input_ns(),
+                                                       ROI_MASK, not KEEP_RUN_RECORDINGS), sampler.results() if sampler else None,
+                                    network_result.statistics()))
+                elif not KEEP_RUN_RECORDINGS:
+                    remove_recordings(groups)
+
+                # Adaptive plans decide on the runs analyzed so far
+                for item in [item for item in pending if item[1].done()]:
+                    pending.remove(item)
+                    collect(*item)
+
+            with span("analysis.wait"):
+                for item in pending:
+                    collect(*item)
+            print(f"{num_objects} objects: {plan.report()}")
+
+        del network
+        print(f"Completed benchmark.")
+    if local:
+        del local
+    analysis.shutdown()
+
+    store.export_csv("visual", r"benchmark_visuals_results.csv", VISUAL_COLUMNS,
+                     lambda process, num_objects, samples: statistics_row(process, num_objects, samples, CONFIDENCE_LEVEL))
+    store.close()
+    for agent in agents.values():
+        agent.close()
+    if TRACE:
+        finish_trace(TRACE_DIRECTORY, "visual", time.perf_counter_ns() - sweep_start)
+    print(f"Completed all benchmarks.")
+
+VISUAL_METRICS = ["server_diff", "client_diff"]
+VISUAL_COLUMNS = [
+    "Process",
+    "Number of Objects",
+    "Runs",
+    "Mean Server Diff",
+    "StdDev Server Diff",
+    "Error Server Diff",
+    "CI Server Diff",
+    "Mean Clients Diff",
+    "StdDev Clients Diff",
+    "Error Clients Diff",
+    "CI Clients Diff",
+    *RESOURCE_COLUMNS
+]
+
+def compared(results: dict):
+    # Runs without a difference for every metric, e.g. stored by earlier versions, are not measurements
+    return all(results.get(metric) is not None for metric in VISUAL_METRICS)
+
+def statistics_row(path, num_objects, samples: list[dict], confidence):
+    # One CSV row from the stored samples of a configuration
+    samples = [sample for sample in samples if compared(sample)]
+    if len(samples) < 2:
         return None
-
-    avg_frames = []
-    while all(capture.isOpened() for capture in captures):
-        frames = [capture.read()[1] for capture in captures]
-        
-        if any(frame is None for frame in frames):
-            break  # End of video
-
-        # Convert to grayscale
-        gray_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames]
-
-        # Compute average frame
-        avg_frame = np.mean(gray_frames, axis=0).astype(np.uint8)
-        avg_frames.append(avg_frame)
-
-    for capture in captures:
-        capture.release()
-
-    if avg_frames is not None:
-        # Write the average video to disk
-        avg_video_path = "avg_videos.avi"
-        frame_height, frame_width = avg_frames[0].shape
-        out = cv2.VideoWriter(avg_video_path, cv2.VideoWriter_fourcc(*'XVID'), 30, (frame_width, frame_height), False)
-
-        for frame in avg_frames:
-            out.write(frame)
-        out.release()
-
-        return avg_video_path
-    else:
-        print("Failed to compute average videos.")
-
-def compute_confidence_interval(mean, std_dev, n, confidence=0.99):
-    # Approximate t-critical value for df = 25 - 1 from https://people.richland.edu/james/lecture/m170/tbl-t.html
-    t_critical = {
-        0.90: 1.711,  # 90% confidence
-        0.95: 2.064,  # 95% confidence
-        0.99: 2.797   # 99% confidence
-    }.get(confidence)
-
-    margin_of_error = t_critical * (std_dev / math.sqrt(n))
-    return (mean - margin_of_error, mean + margin_of_error)
+    run_results, run_resources = zip(*[split_sample(sample) for sample in samples])
+    server_diffs = [results["server_diff"] for results in run_results]
+    client_diffs = [results["client_diff"] for results in run_results]
+
+    # Compute averages
+    runs = len(server_diffs)
+    avg_server_diff = np.mean(server_diffs)
+    std_server_diff = np.std(server_diffs, ddof=1)
+    err_server_diff = std_server_diff / np.sqrt(runs)
+    ci_server_diff = compute_confidence_interval(avg_server_diff, std_server_diff, runs, confidence)
+    avg_client_diff = np.mean(client_diffs)
+    std_client_diff = np.std(client_diffs, ddof=1)
+    err_client_diff = std_client_diff / np.sqrt(runs)
+    ci_client_diff = compute_confidence_interval(avg_client_diff, std_client_diff, runs, confidence)
+
+    return [
+        path,
+        num_objects,
+        runs,
+        avg_server_diff,
+        std_server_diff,
+        err_server_diff,
+        f"{str(ci_server_diff[0])}-{str(ci_server_diff[1])}",
+        avg_client_diff,
+        std_client_diff,
+        err_client_diff,
+        f"{str(ci_client_diff[0])}-{str(ci_client_diff[1])}",
+    ] + resource_row([resources for resources in run_resources if resources])
+
+def benchmark(harness: BenchmarkHarnessBase, scenario: Scenario = DEFAULT_SCENARIO):
+    result = run_scenario(harness, scenario)
+    statistics = result.statistics()
+    print(f"Scenario {scenario.name}: {statistics['events']} inputs, mean lateness {statistics.get('mean_lateness_ms', 0):.3f}ms, "
+          f"p95 {statistics.get('p95_lateness_ms', 0):.3f}ms, jitter {statistics.get('jitter_ms', 0):.3f}ms")
+    return result
 
 if __name__ == "__main__":
     sys.exit(main())
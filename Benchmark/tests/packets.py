@@ -0,0 +1,30 @@
+import struct
+import numpy as np
+from benchmark_pcap import PCAP_HEADER, PCAP_RECORD_HEADER, PCAP_MAGIC_NS
+
+def udp_frame(src_port: int, dst_port: int, payload: int = 32, options: int = 0, protocol: int = 17, fragment: int = 0):
+    # Ethernet, IPv4 with options words of IP options and UDP header followed by a zero payload
+    ihl = 5 + options
+    ip = bytearray(ihl * 4)
+    ip[0] = 0x40 | ihl
+    struct.pack_into('>H', ip, 2, ihl * 4 + 8 + payload)
+    struct.pack_into('>H', ip, 6, fragment)
+    ip[9] = protocol
+    return bytes(12) + b'\x08\x00' + bytes(ip) + struct.pack('>HHHH', src_port, dst_port, 8 + payload, 0) + bytes(payload)
+
+def frame_rows(frames: list, snap_length: int = 128):
+    rows = np.zeros((len(frames), snap_length), dtype=np.uint8)
+    for row, frame in zip(rows, frames):
+        data = frame[:snap_length]
+        row[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+    return rows
+
+def write_pcap(path: str, packets: list, snap_length: int = 128):
+    # packets are (timestamp ns, frame), records are truncated to the snap length like a capture
+    with open(path, 'wb') as file:
+        file.write(PCAP_HEADER.pack(PCAP_MAGIC_NS, 2, 4, 0, 0, snap_length, 1))
+        for timestamp, frame in packets:
+            seconds, nanoseconds = divmod(timestamp, 1_000_000_000)
+            captured = frame[:snap_length]
+            file.write(PCAP_RECORD_HEADER.pack(seconds, nanoseconds, len(captured), len(frame)))
+            file.write(captured)
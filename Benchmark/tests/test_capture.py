@@ -0,0 +1,50 @@
+import numpy as np
+from benchmark_capture import parse_udp_headers, count_udp_traffic, LINK_HEADER_LENGTHS
+from packets import udp_frame, frame_rows
+
+ETHERNET = LINK_HEADER_LENGTHS[1]
+
+def test_udp_ports_behind_ip_options():
+    rows = frame_rows([udp_frame(1000, 2000), udp_frame(3000, 4000, options=3)])
+    valid, src_ports, dst_ports = parse_udp_headers(rows, ETHERNET)
+
+    assert valid.tolist() == [True, True]
+    assert src_ports.tolist() == [1000, 3000]
+    assert dst_ports.tolist() == [2000, 4000]
+
+def test_other_protocols_and_fragments_are_invalid():
+    rows = frame_rows([
+        udp_frame(1000, 2000, protocol=6),
+        udp_frame(1000, 2000, fragment=0x0010),  # Later fragment without a UDP header
+        udp_frame(1000, 2000, fragment=0x2000),  # First fragment, more fragments follow
+    ])
+    valid, _, _ = parse_udp_headers(rows, ETHERNET)
+    assert valid.tolist() == [False, False, True]
+
+def test_ports_beyond_the_snap_length_are_invalid():
+    rows = frame_rows([udp_frame(1000, 2000, options=10)], snap_length=ETHERNET + 24)
+    valid, _, _ = parse_udp_headers(rows, ETHERNET)
+    assert valid.tolist() == [False]
+
+def test_empty_batch():
+    valid, src_ports, dst_ports = parse_udp_headers(np.zeros((0, 128), dtype=np.uint8), ETHERNET)
+    assert len(valid) == len(src_ports) == len(dst_ports) == 0
+
+def test_traffic_is_counted_per_direction():
+    frames = [
+        udp_frame(50000, 24856, payload=10),
+        udp_frame(24856, 50000, payload=20),
+        udp_frame(24856, 24856, payload=30),  # Destination port is checked first
+        udp_frame(50000, 7777, payload=40),
+        udp_frame(50000, 24856, payload=50, protocol=6),
+    ]
+    lengths = np.array([len(frame) for frame in frames])
+    valid, src_ports, dst_ports = parse_udp_headers(frame_rows(frames), ETHERNET)
+    counts = count_udp_traffic(lengths, valid, src_ports, dst_ports, 24856)
+
+    assert counts == {
+        "bytes_to_server": int(lengths[0] + lengths[2]),
+        "bytes_from_server": int(lengths[1]),
+        "packets_to_server": 2,
+        "packets_from_server": 1,
+    }
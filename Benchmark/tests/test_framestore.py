@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+import pytest
+from benchmark_framestore import FrameStore, FrameStoreWriter, shift_timestamps
+
+def frames(count: int, height: int = 24, width: int = 32):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (count, height, width, 3), dtype=np.uint8)
+
+def write(path, recorded, compression="none", chunk_frames=4):
+    writer = FrameStoreWriter(path, recorded.shape[2], recorded.shape[1], scale=1.0, chunk_frames=chunk_frames, compression=compression)
+    for index, frame in enumerate(recorded):
+        writer.write(frame, 1_000 + index * 100)
+    writer.close()
+
+@pytest.mark.parametrize("compression", ["none", "zlib"])
+def test_round_trip(tmp_path, compression):
+    path = str(tmp_path / "capture.frames")
+    recorded = frames(10)
+    write(path, recorded, compression)
+
+    store = FrameStore(path)
+    assert len(store) == 10
+    assert store.shape == (24, 32)
+    assert store.timestamps.tolist() == [1_000 + index * 100 for index in range(10)]
+    for index in (0, 3, 4, 9):
+        # The writer converts to grayscale, a scale of 1 keeps the frames lossless
+        assert np.array_equal(store.frame(index), cv2.cvtColor(recorded[index], cv2.COLOR_BGR2GRAY))
+    assert [len(chunk) for chunk in store.chunks()] == [4, 4, 2]
+    with pytest.raises(IndexError):
+        store.frame(10)
+    store.close()
+
+def test_frames_by_timestamp(tmp_path):
+    path = str(tmp_path / "capture.frames")
+    write(path, frames(5))
+    store = FrameStore(path)
+
+    assert store.index_at(0) == 0
+    assert store.index_at(1_000) == 0
+    assert store.index_at(1_199) == 1
+    assert store.index_at(10_000) == 4
+    store.close()
+
+def test_shift_timestamps(tmp_path):
+    path = str(tmp_path / "capture.frames")
+    write(path, frames(6))
+    shift_timestamps(path, -500)
+
+    store = FrameStore(path)
+    assert store.timestamps.tolist() == [500 + index * 100 for index in range(6)]
+    assert len(store) == 6
+    store.close()
+
+def test_unclosed_store_is_rejected(tmp_path):
+    path = str(tmp_path / "capture.frames")
+    writer = FrameStoreWriter(path, 32, 24, scale=1.0, chunk_frames=2)
+    for frame in frames(3):
+        writer.write(frame, 0)
+    writer.file.flush()
+
+    with pytest.raises(ValueError):
+        FrameStore(path)
+    with pytest.raises(ValueError):
+        shift_timestamps(path, 100)
+    writer.close()
@@ -0,0 +1,64 @@
+import numpy as np
+from benchmark_pcap import PcapIndex, analyze_segments, PCAP_RECORD_HEADER
+from packets import udp_frame, write_pcap
+
+SERVER_PORT = 24856
+OTHER_PORT = 7777
+
+def recording(path):
+    # One recording of all UDP traffic with two servers and a client port that talks to both
+    packets = []
+    for k in range(10):
+        packets.append((1_000 + k * 100, udp_frame(50000, SERVER_PORT, payload=100)))
+        packets.append((1_010 + k * 100, udp_frame(SERVER_PORT, 50000, payload=200)))
+        packets.append((1_020 + k * 100, udp_frame(50001, OTHER_PORT, payload=10)))
+    write_pcap(path, packets)
+    return packets
+
+def test_index_reads_every_record(tmp_path):
+    path = str(tmp_path / "traffic.pcap")
+    packets = recording(path)
+    index = PcapIndex(path, use_cache=False)
+
+    assert len(index.offsets) == len(packets)
+    assert np.array_equal(index.timestamps, [timestamp for timestamp, _ in packets])
+    assert np.array_equal(index.lengths, [len(frame) for _, frame in packets])
+    assert index.valid.all()
+
+def test_two_ports_from_one_recording(tmp_path):
+    path = str(tmp_path / "traffic.pcap")
+    recording(path)
+    index = PcapIndex(path)
+    markers = [{"label": "run", "start": 0, "stop": 10_000}]
+
+    server, = analyze_segments(index, SERVER_PORT, markers)
+    assert server["packets_to_server"] == 10
+    assert server["packets_from_server"] == 10
+    assert server["bytes_to_server"] == 10 * len(udp_frame(0, 0, payload=100))
+    assert server["bytes_from_server"] == 10 * len(udp_frame(0, 0, payload=200))
+
+    # The cached index of the same file serves another port
+    other, = analyze_segments(PcapIndex(path), OTHER_PORT, markers)
+    assert other["packets_to_server"] == 10
+    assert other["packets_from_server"] == 0
+    assert other["bytes_to_server"] == 10 * len(udp_frame(0, 0, payload=10))
+
+def test_segments_follow_markers(tmp_path):
+    path = str(tmp_path / "traffic.pcap")
+    recording(path)
+    index = PcapIndex(path, use_cache=False)
+    markers = [{"label": "first", "start": 0, "stop": 1_420}, {"label": "rest", "start": 1_500, "stop": 10_000}]
+
+    first, rest = analyze_segments(index, SERVER_PORT, markers)
+    assert first["packets_to_server"] == 5
+    assert rest["packets_to_server"] == 5
+    assert first["label"] == "first"
+
+def test_truncated_trailing_record_is_ignored(tmp_path):
+    path = str(tmp_path / "traffic.pcap")
+    recording(path)
+    # A capture that was still running ends in a record whose data is incomplete
+    with open(path, 'ab') as file:
+        file.write(PCAP_RECORD_HEADER.pack(0, 5_000, 100, 100) + bytes(10))
+    index = PcapIndex(path, use_cache=False)
+    assert len(index.offsets) == 30
@@ -0,0 +1,63 @@
+import struct
+from benchmark_harness import BenchmarkCommands, BenchmarkAcks, ControllerStream, FRAME_HEADER, FRAME_ACKNOWLEDGE, COMMAND_APPLIED, \
+    LEGACY_PROTOCOL, PROTOCOL_VERSION, encode_frame, parse_frames, encode_commands, input_payload
+
+def test_frame_round_trip():
+    messages = [(BenchmarkCommands.DirectionalInput, input_payload(1.0, -1.0)), (BenchmarkCommands.StartServer, b'')]
+    frames, remaining = parse_frames(encode_frame(messages, 7, FRAME_ACKNOWLEDGE))
+
+    assert remaining == b''
+    assert frames == [(FRAME_ACKNOWLEDGE, 7, [(0x05, input_payload(1.0, -1.0)), (0x01, b'')])]
+
+def test_incomplete_frame_is_kept():
+    data = encode_frame([(BenchmarkCommands.SetObjectNumber, struct.pack('i', 49))], 1)
+    frames, remaining = parse_frames(data[:-2])
+    assert frames == []
+    assert remaining == data[:-2]
+
+    frames, remaining = parse_frames(remaining + data[-2:] + data[:3])
+    assert [sequence for _, sequence, _ in frames] == [1]
+    assert remaining == data[:3]
+
+def test_malformed_bytes_and_versions_are_skipped():
+    frame = encode_frame([(BenchmarkCommands.StopClient, b'')], 2)
+    other_version = bytearray(encode_frame([(BenchmarkCommands.StopServer, b'')], 3))
+    other_version[1] = PROTOCOL_VERSION + 1
+    frames, remaining = parse_frames(b'\x00\x01' + bytes(other_version) + frame)
+
+    assert [sequence for _, sequence, _ in frames] == [2]
+    assert remaining == b''
+
+def test_truncated_message_is_cut_at_the_frame_end():
+    body = struct.pack('<BH', 0x05, 8) + b'\x00' * 4
+    data = FRAME_HEADER.pack(0xBF, PROTOCOL_VERSION, 0, len(body), 4) + body
+    frames, _ = parse_frames(data)
+    assert frames == [(0, 4, [(0x05, b'\x00' * 4)])]
+
+def test_stream_detects_legacy_acknowledgements():
+    stream = ControllerStream()
+    data = BenchmarkAcks.ControllerReady.value + struct.pack('i', 42) + BenchmarkAcks.ServerStarted.value + struct.pack('i', 0)
+
+    assert stream.feed(data[:3]) == []
+    assert stream.version == LEGACY_PROTOCOL
+    assert stream.feed(data[3:]) == [(BenchmarkAcks.ControllerReady, 42), (BenchmarkAcks.ServerStarted, 0)]
+
+def test_stream_reads_framed_acknowledgements():
+    stream = ControllerStream()
+    data = encode_frame([(BenchmarkAcks.ObjectsSpawned, struct.pack('<i', 49)),
+                         (BenchmarkAcks.CommandApplied, COMMAND_APPLIED.pack(5, 120))], 1)
+    acks = [ack for byte in range(len(data)) for ack in stream.feed(data[byte:byte + 1])]
+
+    assert stream.version == PROTOCOL_VERSION
+    assert acks == [(BenchmarkAcks.ObjectsSpawned, 49), (BenchmarkAcks.CommandApplied, (5, 120))]
+
+def test_commands_for_both_protocols():
+    commands = [(BenchmarkCommands.SetObjectNumber, struct.pack('i', 9)), (BenchmarkCommands.StartServer, b'')]
+
+    assert encode_commands(commands, LEGACY_PROTOCOL, 1) == b'\x06' + struct.pack('i', 9) + b'\x01'
+    frames, _ = parse_frames(encode_commands(commands, PROTOCOL_VERSION, 1, acknowledge=True))
+    assert frames == [(FRAME_ACKNOWLEDGE, 1, [(0x06, struct.pack('i', 9)), (0x01, b'')])]
+
+def test_input_payload_layouts():
+    assert struct.unpack('ff', input_payload(0.5, -1.0)) == (0.5, -1.0)
+    assert struct.unpack('iff', input_payload(0.5, -1.0, 3)) == (3, 0.5, -1.0)
@@ -0,0 +1,66 @@
+import time
+from benchmark_harness import BenchmarkHarnessBase
+from benchmark_scenario import Scenario, run_scenario
+
+class RecordingHarness(BenchmarkHarnessBase):
+    # Records the dispatched input batches, delays[k] seconds are spent sending the k-th batch
+    def __init__(self, delays=(), delay: float = 0.0):
+        super().__init__("recording")
+        self.num_clients = 2
+        self.delays = list(delays)
+        self.delay = delay
+        self.batches = []
+
+    def start(self, num_clients, num_objects):
+        pass
+
+    def stop(self):
+        pass
+
+    def directional_input_server(self, right: float, up: float):
+        pass
+
+    def directional_input_client(self, client_idx: int, right: float, up: float):
+        pass
+
+    def directional_inputs(self, inputs: list):
+        self.batches.append(inputs)
+        time.sleep(self.delays.pop(0) if self.delays else self.delay)
+
+def test_interleaved_streams_are_not_coalesced_across_targets():
+    # Sending a sample delays the next target past the sample of a third target, only samples superseded by
+    # the same target may be dropped
+    scenario = Scenario("interleaved") \
+        .stream(0.0, 0.2, 0, lambda t: (1.0, t), rate=50) \
+        .stream(0.001, 0.2, 1, lambda t: (-1.0, t), rate=50) \
+        .stream(0.002, 0.2, 2, lambda t: (0.0, t), rate=50)
+    harness = RecordingHarness(delay=0.003)
+    result = run_scenario(harness, scenario)
+
+    assert result.skipped == 0
+    assert (result.dispatched_ns >= 0).all()
+    assert sum(len(batch) for batch in harness.batches) == len(scenario.events)
+
+def test_superseded_stream_samples_are_dropped():
+    scenario = Scenario("late").stream(0.0, 0.1, 0, lambda t: (t, 0.0), rate=100)
+    harness = RecordingHarness(delays=[0.035])
+    result = run_scenario(harness, scenario)
+    sent = [inputs for batch in harness.batches for inputs in batch]
+
+    # The samples planned while the first one was sent are skipped, the stream continues with the current one
+    assert result.skipped >= 2
+    assert result.skipped == len(scenario.events) - len(sent)
+    assert result.dispatched_ns[1] < 0 and result.dispatched_ns[2] < 0
+    # The final release of the stream is no stream sample and always sent
+    assert result.dispatched_ns[-1] >= 0
+    assert sent[-1] == (0, 0.0, 0.0)
+    assert [right for _, right, _ in sent[:-1]] == sorted(right for _, right, _ in sent[:-1])
+
+def test_inputs_planned_together_are_sent_in_one_batch():
+    scenario = Scenario("together").input(0.0, 0, 1.0, 0.0).input(0.0, 1, 0.0, 1.0).input(0.01, 0, 0.0, 0.0)
+    harness = RecordingHarness()
+    result = run_scenario(harness, scenario)
+
+    assert harness.batches == [[(0, 1.0, 0.0), (1, 0.0, 1.0)], [(0, 0.0, 0.0)]]
+    assert result.statistics()["events"] == 3
+    assert result.skipped == 0
@@ -0,0 +1,70 @@
+import math
+import pytest
+from benchmark_stats import incomplete_beta, t_cdf, t_quantile, t_critical, compute_confidence_interval, RunPlan
+
+@pytest.mark.parametrize("x", [0.1, 0.5, 0.9])
+def test_incomplete_beta_closed_forms(x):
+    assert incomplete_beta(1, 1, x) == pytest.approx(x)
+    assert incomplete_beta(3, 1, x) == pytest.approx(x ** 3)
+    assert incomplete_beta(1, 3, x) == pytest.approx(1 - (1 - x) ** 3)
+
+def test_t_cdf_matches_the_cauchy_distribution():
+    # Student t with one degree of freedom
+    for t in (-3.0, -0.5, 0.0, 1.0, 10.0):
+        assert t_cdf(t, 1) == pytest.approx(0.5 + math.atan(t) / math.pi)
+
+@pytest.mark.parametrize("p, df, expected", [
+    (0.975, 1, 12.7062),
+    (0.975, 5, 2.5706),
+    (0.995, 10, 3.1693),
+    (0.975, 30, 2.0423),
+    (0.975, 100000, 1.9600),
+])
+def test_t_quantile_table_values(p, df, expected):
+    assert t_quantile(p, df) == pytest.approx(expected, abs=1e-4)
+    assert t_quantile(1 - p, df) == pytest.approx(-expected, abs=1e-4)
+
+def test_t_quantile_rejects_probabilities_outside_the_unit_interval():
+    with pytest.raises(ValueError):
+        t_quantile(1.0, 5)
+
+def test_confidence_interval():
+    low, high = compute_confidence_interval(10.0, 2.0, 6, 0.95)
+    margin = t_critical(6, 0.95) * 2.0 / math.sqrt(6)
+    assert t_critical(6, 0.95) == pytest.approx(2.5706, abs=1e-4)
+    assert (low, high) == pytest.approx((10.0 - margin, 10.0 + margin))
+
+def test_fixed_plan_yields_warmups_and_runs():
+    plan = RunPlan(1, 3)
+    assert list(plan) == [1, 2, 3, 4]
+
+def test_failed_runs_are_repeated():
+    plan = RunPlan(1, 3)
+    indices = []
+    for i in plan:
+        indices.append(i)
+        if i == 3:
+            plan.fail()
+    assert indices == [1, 2, 3, 4, 5]
+
+def test_plan_gives_up_after_repeated_failures():
+    plan = RunPlan(0, 2)
+    indices = []
+    for i in plan:
+        indices.append(i)
+        plan.fail()
+    assert len(indices) == plan.max_failures + 1
+
+def test_resumed_plan_continues_after_the_stored_runs():
+    plan = RunPlan(1, 3, metrics=["total_bytes"])
+    plan.resume([{"total_bytes": 10}, {"total_bytes": 11}], last_index=3)
+    assert plan.resumed == 2
+    assert list(plan) == [1, 4]
+
+def test_adaptive_plan_stops_when_converged():
+    plan = RunPlan(0, 2, adaptive=True, max_runs=10, target_relative_half_width=0.05, metrics=["total_bytes"])
+    indices = []
+    for i in plan:
+        indices.append(i)
+        plan.add({"total_bytes": 100})
+    assert indices == [1, 2]
@@ -1,3 +1,4 @@
+using jKnepel.NetcodeBenchmark.Controller;
 using System;
 using System.Collections.Generic;
 using FishNet.Connection;
@@ -54,6 +55,9 @@ namespace jKnepel.NetcodeBenchmark.Projects.FishNet
 				Spawn(obj);
 				_networkObjects[index] = obj;
 			}
+
+			// Acknowledged once the objects are spawned, the harness starts the scenario afterwards
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ObjectsSpawned, _networkObjects.Length);
 		}
 		
 		public override void OnStopServer()
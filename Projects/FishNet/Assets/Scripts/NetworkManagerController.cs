@@ -1,4 +1,6 @@
+using System;
 using FishNet.Managing;
+using jKnepel.NetcodeBenchmark.Controller;
 using UnityEngine;
 using UnityEditor;
 
@@ -8,15 +10,72 @@ namespace jKnepel.NetcodeBenchmark.Projects.FishNet
     {
         [SerializeField] private NetworkManager networkManager;
 
+        private bool _awaitingServer;
+        private bool _awaitingClient;
+
         private void Awake()
         {
             if (networkManager == null)
                 networkManager = FindObjectOfType<NetworkManager>();
+
+            BenchmarkController.ReportsServerReadiness = true;
+            BenchmarkController.ReportsClientReadiness = true;
+
+            if (TryGetPortArgument(out var port))
+                networkManager.TransportManager.Transport.SetPort(port);
+            // Server address of clients running on another node than the server, e.g. "-address 192.168.0.10"
+            if (TryGetArgument("-address", out var address))
+                networkManager.TransportManager.Transport.SetClientAddress(address);
+        }
+
+        private static bool TryGetPortArgument(out ushort port)
+        {
+            // Optional game port passed through the benchmark startup arguments, e.g. "-port 24857"
+            port = 0;
+            return TryGetArgument("-port", out var value) && ushort.TryParse(value, out port);
+        }
+
+        private static bool TryGetArgument(string name, out string value)
+        {
+            // Value following a benchmark startup argument
+            value = null;
+            var args = Environment.GetCommandLineArgs();
+            var index = Array.IndexOf(args, name);
+            if (index < 0 || index + 1 >= args.Length)
+                return false;
+            value = args[index + 1];
+            return true;
+        }
+
+        private void Update()
+        {
+            if (_awaitingServer && networkManager.ServerManager.Started)
+            {
+                _awaitingServer = false;
+                BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ServerStarted);
+            }
+
+            if (_awaitingClient && networkManager.ClientManager.Started)
+            {
+                _awaitingClient = false;
+                BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ClientConnected);
+            }
+        }
+
+        public void StartServer()
+        {
+            _awaitingServer = true;
+            networkManager.ServerManager.StartConnection();
         }
 
-        public void StartServer() => networkManager.ServerManager.StartConnection();
         public void StopServer() => networkManager.ServerManager.StopConnection(true);
-        public void StartClient() => networkManager.ClientManager.StartConnection();
+
+        public void StartClient()
+        {
+            _awaitingClient = true;
+            networkManager.ClientManager.StartConnection();
+        }
+
         public void StopClient() => networkManager.ClientManager.StopConnection();
     }
 
@@ -1,10 +1,12 @@
 using System;
+using System.Collections;
 using System.IO;
 using System.Net;
 using System.Net.Sockets;
 using System.Threading.Tasks;
 using UnityEngine;
 using UnityEngine.Events;
+using UnityEngine.Rendering;
 
 namespace jKnepel.NetcodeBenchmark.Controller
 {
@@ -19,11 +21,43 @@ namespace jKnepel.NetcodeBenchmark.Controller
             DirectionalInput = 5,
             SetObjectNumber = 6
         }
+
+        public enum EBenchmarkAcks : byte
+        {
+            ControllerReady = 0x80,
+            ServerStarted = 0x81,
+            ClientConnected = 0x82,
+            ObjectsSpawned = 0x83,
+            ControllerMode = 0x84,
+            CommandApplied = 0x85
+        }
+
+        // Framed protocol of harnesses launching the build with "-protocol 2": a header of magic, version,
+        // flags, body length and sequence followed by messages of opcode, payload length and payload
+        private const byte FrameMagic = 0xBF;
+        private const byte ProtocolVersion = 2;
+        private const byte FrameAcknowledge = 0x01;
+        private const int FrameHeaderLength = 12;
+        private const int FrameMessageHeaderLength = 3;
+        private const int MaxFrameLength = 1 << 20;
+        
+        private static BenchmarkController _instance;
         
         private TcpClient _tcpClient;
         private NetworkStream _stream;
         private MemoryStream _memoryStream;
         private bool _isRunning;
+        private int _numberOfObjects;
+        private int _token;
+        private bool _framed;
+        private uint _sequence;
+
+        // Set by framework integrations and managers that acknowledge server and client readiness from the
+        // framework state themselves. The managers always acknowledge the spawned objects.
+        public static bool ReportsServerReadiness { get; set; }
+        public static bool ReportsClientReadiness { get; set; }
+        // Builds without a readiness signal acknowledge after the fixed delay the harness used to wait
+        private const float ReadinessDelay = 1f;
 
         [SerializeField] private UnityEvent startServer;
         [SerializeField] private UnityEvent stopServer;
@@ -41,9 +75,20 @@ namespace jKnepel.NetcodeBenchmark.Controller
                 return;
             }
             
+            // Optional handshake token used by the harness to identify processes sharing one listening socket
+            var tokenIndex = Array.IndexOf(args, "-token");
+            if (tokenIndex >= 0 && tokenIndex + 1 < args.Length)
+                int.TryParse(args[tokenIndex + 1], out _token);
+            
+            // Harnesses without the argument only understand plain commands and acknowledgements
+            var protocolIndex = Array.IndexOf(args, "-protocol");
+            if (protocolIndex >= 0 && protocolIndex + 1 < args.Length && int.TryParse(args[protocolIndex + 1], out var protocol))
+                _framed = protocol >= ProtocolVersion;
+            
             QualitySettings.vSyncCount = 0;
             Application.targetFrameRate = 60;
             DontDestroyOnLoad(gameObject);
+            _instance = this;
             ConnectToServer(port);
         }
 
@@ -56,7 +101,7 @@ namespace jKnepel.NetcodeBenchmark.Controller
         {
             try
             {
-                _tcpClient = new();
+                _tcpClient = new() { NoDelay = true };
                 Debug.Log($"Connecting to server at {port}...");
                 await _tcpClient.ConnectAsync(IPAddress.Loopback, port);
 
@@ -64,6 +109,9 @@ namespace jKnepel.NetcodeBenchmark.Controller
                 _stream = _tcpClient.GetStream();
                 _memoryStream = new();
                 _isRunning = true;
+                Acknowledge(EBenchmarkAcks.ControllerReady, _token);
+                // Lets the harness verify that builds launched headless really run without graphics
+                Acknowledge(EBenchmarkAcks.ControllerMode, (Application.isBatchMode ? 1 : 0) | (SystemInfo.graphicsDeviceType == GraphicsDeviceType.Null ? 2 : 0));
 
                 await ReceiveMessagesAsync();
             }
@@ -92,6 +140,45 @@ namespace jKnepel.NetcodeBenchmark.Controller
             Debug.Log("Disconnected from server.");
         }
         
+        public static void Acknowledge(EBenchmarkAcks ack, int value = 0)
+        {
+            Send(ack, BitConverter.GetBytes(value));
+        }
+
+        private static void Send(EBenchmarkAcks ack, byte[] payload)
+        {
+            if (_instance == null || _instance._stream is not { CanWrite: true })
+                return;
+
+            byte[] message;
+            if (_instance._framed)
+            {
+                message = new byte[FrameHeaderLength + FrameMessageHeaderLength + payload.Length];
+                message[0] = FrameMagic;
+                message[1] = ProtocolVersion;
+                BitConverter.GetBytes(FrameMessageHeaderLength + payload.Length).CopyTo(message, 4);
+                BitConverter.GetBytes(++_instance._sequence).CopyTo(message, 8);
+                message[FrameHeaderLength] = (byte)ack;
+                BitConverter.GetBytes((ushort)payload.Length).CopyTo(message, FrameHeaderLength + 1);
+                payload.CopyTo(message, FrameHeaderLength + FrameMessageHeaderLength);
+            }
+            else
+            {
+                message = new byte[1 + payload.Length];
+                message[0] = (byte)ack;
+                payload.CopyTo(message, 1);
+            }
+
+            try
+            {
+                _instance._stream.Write(message, 0, message.Length);
+            }
+            catch (Exception e)
+            {
+                Debug.LogError($"Error sending acknowledgement: {e.Message}");
+            }
+        }
+        
         private async Task ReceiveMessagesAsync()
         {
             var buffer = new byte[1024];
@@ -112,7 +199,10 @@ namespace jKnepel.NetcodeBenchmark.Controller
 
                     _memoryStream.Write(buffer, 0, bytesRead);
 
-                    while (TryProcessMessages(_memoryStream)) {}
+                    if (_framed)
+                        while (TryProcessFrames(_memoryStream)) {}
+                    else
+                        while (TryProcessMessages(_memoryStream)) {}
                 }
                 catch (Exception e)
                 {
@@ -182,6 +272,80 @@ namespace jKnepel.NetcodeBenchmark.Controller
 
             return processedAnyMessage;
         }
+
+        private bool TryProcessFrames(MemoryStream memoryStream)
+        {
+            var buffer = memoryStream.ToArray();
+
+            var index = 0;
+            var processedAnyFrame = false;
+
+            while (buffer.Length - index >= FrameHeaderLength)
+            {
+                var length = BitConverter.ToInt32(buffer, index + 4);
+                if (buffer[index] != FrameMagic || length < 0 || length > MaxFrameLength)
+                {
+                    Debug.LogError($"Received malformed frame header, skipping byte {buffer[index]}.");
+                    index++;
+                    continue;
+                }
+
+                var end = index + FrameHeaderLength + length;
+                if (end > buffer.Length)
+                    break; // Incomplete frame
+
+                var version = buffer[index + 1];
+                var flags = buffer[index + 2];
+                var sequence = BitConverter.ToUInt32(buffer, index + 8);
+                var position = index + FrameHeaderLength;
+                index = end;
+                processedAnyFrame = true;
+
+                if (version != ProtocolVersion)
+                {
+                    Debug.LogError($"Received frame of unsupported protocol version {version}.");
+                    continue;
+                }
+
+                // All messages of one frame are applied within the same Unity frame
+                while (position + FrameMessageHeaderLength <= end)
+                {
+                    var flag = (EBenchmarkCommands)buffer[position];
+                    var size = BitConverter.ToUInt16(buffer, position + 1);
+                    position += FrameMessageHeaderLength;
+                    if (position + size > end)
+                        break; // Truncated message
+
+                    var message = new byte[size];
+                    Array.Copy(buffer, position, message, 0, size);
+                    position += size;
+
+                    if (Enum.IsDefined(typeof(EBenchmarkCommands), flag))
+                        HandleMessage(flag, message);
+                    else
+                        Debug.LogError($"Received unknown command {(byte)flag}.");
+                }
+
+                if ((flags & FrameAcknowledge) != 0)
+                {
+                    var applied = new byte[8];
+                    BitConverter.GetBytes(sequence).CopyTo(applied, 0);
+                    BitConverter.GetBytes(Time.frameCount).CopyTo(applied, 4);
+                    Send(EBenchmarkAcks.CommandApplied, applied);
+                }
+            }
+
+            memoryStream.SetLength(0);
+            memoryStream.Write(buffer, index, buffer.Length - index);
+
+            return processedAnyFrame;
+        }
+        
+        private IEnumerator AcknowledgeAfterDelay(EBenchmarkAcks ack)
+        {
+            yield return new WaitForSeconds(ReadinessDelay);
+            Acknowledge(ack);
+        }
         
         private void HandleMessage(EBenchmarkCommands flag, byte[] message)
         {
@@ -189,9 +353,14 @@ namespace jKnepel.NetcodeBenchmark.Controller
             {
                 case EBenchmarkCommands.StartServer:
                     startServer?.Invoke();
+                    if (!ReportsServerReadiness)
+                        StartCoroutine(AcknowledgeAfterDelay(EBenchmarkAcks.ServerStarted));
                     break;
                 case EBenchmarkCommands.StartClient:
                     startClient?.Invoke();
+                    // Scenes without a client listener start nothing, so there is no client state to wait for
+                    if (!ReportsClientReadiness)
+                        Acknowledge(EBenchmarkAcks.ClientConnected);
                     break;
                 case EBenchmarkCommands.StopServer:
                     stopServer?.Invoke();
@@ -201,15 +370,18 @@ namespace jKnepel.NetcodeBenchmark.Controller
                     break;
                 case EBenchmarkCommands.DirectionalInput:
                 {
-                    directionalInput?.Invoke(BitConverter.ToInt32(message, 0), new (
-                        BitConverter.ToSingle(message, 4), 
-                        BitConverter.ToSingle(message, 8)
+                    // Framed inputs without a player index are meant for the server player
+                    var offset = message.Length >= 12 ? 4 : 0;
+                    directionalInput?.Invoke(offset > 0 ? BitConverter.ToInt32(message, 0) : -1, new (
+                        BitConverter.ToSingle(message, offset), 
+                        BitConverter.ToSingle(message, offset + 4)
                     ));
                     break;
                 }
                 case EBenchmarkCommands.SetObjectNumber:
                 {
-                    setObjectNumber?.Invoke(BitConverter.ToInt32(message, 0));
+                    _numberOfObjects = BitConverter.ToInt32(message, 0);
+                    setObjectNumber?.Invoke(_numberOfObjects);
                     break;
                 }
                 default:
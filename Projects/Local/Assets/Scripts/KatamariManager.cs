@@ -1,3 +1,4 @@
+using jKnepel.NetcodeBenchmark.Controller;
 using System;
 using System.Collections.Generic;
 using UnityEngine;
@@ -23,6 +24,12 @@ namespace jKnepel.NetcodeBenchmark.Projects.Local
 
 		#region lifecycle
 
+		private void Awake()
+		{
+			BenchmarkController.ReportsServerReadiness = true;
+			BenchmarkController.ReportsClientReadiness = true;
+		}
+
 		public void StartServer()
 		{
 			_networkObjects = new KatamariObject[numberOfObjects];
@@ -42,6 +49,10 @@ namespace jKnepel.NetcodeBenchmark.Projects.Local
 				var obj = Instantiate(objectPrefab, position, objectPrefab.transform.rotation, transform);
 				_networkObjects[index] = obj;
 			}
+
+			// The local build has no connection to wait for, the server is ready once its objects exist
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ServerStarted);
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ObjectsSpawned, _networkObjects.Length);
 		}
 
 		public void StopServer()
@@ -58,6 +69,7 @@ namespace jKnepel.NetcodeBenchmark.Projects.Local
 		{
 			var player = Instantiate(playerPrefab, new(-3f + 1.5f * (_playerObjects.Count + 1), 0.5f, -5), Quaternion.identity);
 			_playerObjects.Add(player);
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ClientConnected);
 		}
 
 		public void StopClient()
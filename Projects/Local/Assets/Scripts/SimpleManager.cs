@@ -1,3 +1,4 @@
+using jKnepel.NetcodeBenchmark.Controller;
 using System;
 using UnityEngine;
 
@@ -26,6 +27,7 @@ namespace jKnepel.NetcodeBenchmark.Projects.Local
 
 		private void Awake()
 		{
+			BenchmarkController.ReportsServerReadiness = true;
 			QualitySettings.vSyncCount = 0;
 			Application.targetFrameRate = 60;
 		}
@@ -50,6 +52,10 @@ namespace jKnepel.NetcodeBenchmark.Projects.Local
 				_networkObjects[index] = obj;
 			}
 
+			// The local build has no connection to wait for, the server is ready once its objects exist
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ServerStarted);
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ObjectsSpawned, _networkObjects.Length);
+
 			_serverStarted = true;
 		}
 		
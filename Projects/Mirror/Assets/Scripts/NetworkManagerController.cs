@@ -1,4 +1,6 @@
+using System;
 using Mirror;
+using jKnepel.NetcodeBenchmark.Controller;
 using UnityEngine;
 using UnityEditor;
 
@@ -8,15 +10,72 @@ namespace jKnepel.NetcodeBenchmark.Projects.Mirror
     {
         [SerializeField] private NetworkManager networkManager;
 
+        private bool _awaitingServer;
+        private bool _awaitingClient;
+
         private void Awake()
         {
             if (networkManager == null)
                 networkManager = FindObjectOfType<NetworkManager>();
+
+            BenchmarkController.ReportsServerReadiness = true;
+            BenchmarkController.ReportsClientReadiness = true;
+
+            if (TryGetPortArgument(out var port) && networkManager.transport is PortTransport portTransport)
+                portTransport.Port = port;
+            // Server address of clients running on another node than the server, e.g. "-address 192.168.0.10"
+            if (TryGetArgument("-address", out var address))
+                networkManager.networkAddress = address;
+        }
+
+        private static bool TryGetPortArgument(out ushort port)
+        {
+            // Optional game port passed through the benchmark startup arguments, e.g. "-port 24857"
+            port = 0;
+            return TryGetArgument("-port", out var value) && ushort.TryParse(value, out port);
+        }
+
+        private static bool TryGetArgument(string name, out string value)
+        {
+            // Value following a benchmark startup argument
+            value = null;
+            var args = Environment.GetCommandLineArgs();
+            var index = Array.IndexOf(args, name);
+            if (index < 0 || index + 1 >= args.Length)
+                return false;
+            value = args[index + 1];
+            return true;
+        }
+
+        private void Update()
+        {
+            if (_awaitingServer && NetworkServer.active)
+            {
+                _awaitingServer = false;
+                BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ServerStarted);
+            }
+
+            if (_awaitingClient && NetworkClient.isConnected)
+            {
+                _awaitingClient = false;
+                BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ClientConnected);
+            }
+        }
+
+        public void StartServer()
+        {
+            _awaitingServer = true;
+            networkManager.StartServer();
         }
 
-        public void StartServer() => networkManager.StartServer();
         public void StopServer() => networkManager.StopServer();
-        public void StartClient() => networkManager.StartClient();
+
+        public void StartClient()
+        {
+            _awaitingClient = true;
+            networkManager.StartClient();
+        }
+
         public void StopClient() => networkManager.StopClient();
     }
 
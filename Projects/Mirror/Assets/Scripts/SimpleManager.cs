@@ -1,3 +1,4 @@
+using jKnepel.NetcodeBenchmark.Controller;
 using System;
 using System.Collections.Generic;
 using Mirror;
@@ -56,6 +57,9 @@ namespace jKnepel.NetcodeBenchmark.Projects.Mirror
 				NetworkServer.Spawn(obj.gameObject);
 				_networkObjects[index] = obj;
 			}
+
+			// Acknowledged once the objects are spawned, the harness starts the scenario afterwards
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ObjectsSpawned, _networkObjects.Length);
 		}
 
 		private void Update()
@@ -1,3 +1,4 @@
+using jKnepel.NetcodeBenchmark.Controller;
 using System;
 using System.Collections.Generic;
 using Unity.Netcode;
@@ -53,6 +54,9 @@ namespace jKnepel.NetcodeBenchmark.Projects.NGO
 				obj.TrySetParent(NetworkObject);
 				_networkObjects[index] = obj;
 			}
+
+			// Acknowledged once the objects are spawned, the harness starts the scenario afterwards
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ObjectsSpawned, _networkObjects.Length);
 			
 			base.OnNetworkSpawn();
 		}
@@ -1,4 +1,7 @@
+using System;
 using Unity.Netcode;
+using Unity.Netcode.Transports.UTP;
+using jKnepel.NetcodeBenchmark.Controller;
 using UnityEngine;
 using UnityEditor;
 
@@ -8,15 +11,76 @@ namespace jKnepel.NetcodeBenchmark.Projects.NGO
     {
         [SerializeField] private NetworkManager networkManager;
 
+        private bool _awaitingServer;
+        private bool _awaitingClient;
+
         private void Awake()
         {
             if (networkManager == null)
                 networkManager = FindObjectOfType<NetworkManager>();
+
+            BenchmarkController.ReportsServerReadiness = true;
+            BenchmarkController.ReportsClientReadiness = true;
+
+            if (networkManager.NetworkConfig.NetworkTransport is UnityTransport transport)
+            {
+                if (!TryGetPortArgument(out var port))
+                    port = transport.ConnectionData.Port;
+                // Server address of clients running on another node than the server, e.g. "-address 192.168.0.10"
+                if (!TryGetArgument("-address", out var address))
+                    address = transport.ConnectionData.Address;
+                transport.SetConnectionData(address, port, transport.ConnectionData.ServerListenAddress);
+            }
+        }
+
+        private static bool TryGetPortArgument(out ushort port)
+        {
+            // Optional game port passed through the benchmark startup arguments, e.g. "-port 24857"
+            port = 0;
+            return TryGetArgument("-port", out var value) && ushort.TryParse(value, out port);
+        }
+
+        private static bool TryGetArgument(string name, out string value)
+        {
+            // Value following a benchmark startup argument
+            value = null;
+            var args = Environment.GetCommandLineArgs();
+            var index = Array.IndexOf(args, name);
+            if (index < 0 || index + 1 >= args.Length)
+                return false;
+            value = args[index + 1];
+            return true;
+        }
+
+        private void Update()
+        {
+            if (_awaitingServer && networkManager.IsServer && networkManager.IsListening)
+            {
+                _awaitingServer = false;
+                BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ServerStarted);
+            }
+
+            if (_awaitingClient && networkManager.IsConnectedClient)
+            {
+                _awaitingClient = false;
+                BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ClientConnected);
+            }
+        }
+
+        public void StartServer()
+        {
+            _awaitingServer = true;
+            networkManager.StartServer();
         }
 
-        public void StartServer() => networkManager.StartServer();
         public void StopServer() => networkManager.Shutdown();
-        public void StartClient() => networkManager.StartClient();
+
+        public void StartClient()
+        {
+            _awaitingClient = true;
+            networkManager.StartClient();
+        }
+
         public void StopClient() => networkManager.Shutdown();
     }
 
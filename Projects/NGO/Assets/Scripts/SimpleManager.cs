@@ -1,3 +1,4 @@
+using jKnepel.NetcodeBenchmark.Controller;
 using System;
 using Unity.Netcode;
 using UnityEngine;
@@ -52,6 +53,9 @@ namespace jKnepel.NetcodeBenchmark.Projects.NGO
 				obj.Spawn();
 				_networkObjects[index] = obj;
 			}
+
+			// Acknowledged once the objects are spawned, the harness starts the scenario afterwards
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ObjectsSpawned, _networkObjects.Length);
 			
 			base.OnNetworkSpawn();
 		}
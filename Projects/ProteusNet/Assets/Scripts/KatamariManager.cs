@@ -1,3 +1,4 @@
+using jKnepel.NetcodeBenchmark.Controller;
 using jKnepel.ProteusNet.Components;
 using System;
 using System.Collections.Generic;
@@ -27,6 +28,11 @@ namespace jKnepel.NetcodeBenchmark.Projects.ProteusNet
 
 		#region lifecycle
 
+		private void Awake()
+		{
+			BenchmarkController.ReportsServerReadiness = true;
+		}
+
 		public override void OnServerSpawned()
 		{
 			networkManager.Server.OnRemoteClientConnected += SpawnClient;
@@ -50,6 +56,10 @@ namespace jKnepel.NetcodeBenchmark.Projects.ProteusNet
 				obj.Spawn();
 				_networkObjects[index] = obj;
 			}
+
+			// The server runs once the manager is spawned on it, the objects exist once they are spawned
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ServerStarted);
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ObjectsSpawned, _networkObjects.Length);
 		}
 		
 		public override void OnServerDespawned()
@@ -1,3 +1,4 @@
+using jKnepel.NetcodeBenchmark.Controller;
 using jKnepel.ProteusNet.Components;
 using System;
 using UnityEngine;
@@ -26,6 +27,7 @@ namespace jKnepel.NetcodeBenchmark.Projects.ProteusNet
 		
 		private void Awake()
 		{
+			BenchmarkController.ReportsServerReadiness = true;
 			QualitySettings.vSyncCount = 0;
 			Application.targetFrameRate = 60;
 		}
@@ -50,6 +52,10 @@ namespace jKnepel.NetcodeBenchmark.Projects.ProteusNet
 				obj.Spawn();
 				_networkObjects[index] = obj;
 			}
+
+			// The server runs once the manager is spawned on it, the objects exist once they are spawned
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ServerStarted);
+			BenchmarkController.Acknowledge(BenchmarkController.EBenchmarkAcks.ObjectsSpawned, _networkObjects.Length);
 		}
 
 		private void Update()